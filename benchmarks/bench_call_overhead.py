@@ -0,0 +1,118 @@
+"""
+Benchmark: client overhead per API call, without any network I/O
+
+Compares building, signing and sending a request from a precompiled
+command spec (what the API methods do) with packaging the full params dict
+and sending it through `request` without a spec, as the API methods used
+to.  The
+transport answers immediately, so only the client's own work is measured.
+Run from the repository root with:
+
+    python -m benchmarks.bench_call_overhead
+"""
+import argparse
+import functools
+import time
+import tracemalloc
+
+from python_coinpayments import CoinPayments
+
+# API methods named like their commands, with their params
+CALLS = (
+    ("rates", {}),
+    ("get_tx_info", {"txid": "CPDC4OMYFCCJBXRAK2SWJJUJTP"}),
+    ("create_transaction", {
+        "amount": "10.00",
+        "currency1": "USD",
+        "currency2": "BTC",
+        "buyer_email": "buyer@example.com",
+        "buyer_name": "John Doe",
+        "item_name": "Order 1234",
+        "invoice": "invoice-1234",
+        "custom": "custom-1234",
+    }),
+)
+
+
+class NullTransport:
+    """
+    Transport that answers every request at once
+    """
+
+    @staticmethod
+    def request(method, url, body=None, headers=None, timeout=None):
+        # pylint: disable=unused-argument
+        """
+        Answer a request
+        """
+        return 200, b'{"error": "ok"}'
+
+
+def make_client():
+    """
+    Get a client that does no I/O and no decoding
+    """
+    return CoinPayments(
+        public_key="public key",
+        private_key="private key",
+        ipn_url="https://example.com/ipn",
+        transport=NullTransport(),
+        decoder=lambda body: body)
+
+
+def legacy_call(client: CoinPayments, cmd: str, params: dict):
+    """
+    Send a call the way the API methods used to
+    """
+    params = dict(params)
+    params.update({
+        "key": client.public_key,
+        "version": client.version,
+        "format": client.format,
+    })
+    if client.ipn_url and cmd == "create_transaction":
+        params.update({"ipn_url": client.ipn_url})
+    params.update({"cmd": cmd})
+    return client.request("post", **params)
+
+
+def measure(func, calls: int):
+    """
+    Get the mean time per call in microseconds and the bytes allocated by
+    one call
+    """
+    func()  # warm up
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    elapsed = (time.perf_counter() - start) / calls * 1e6
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    """
+    Run the benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=50000)
+    args = parser.parse_args()
+
+    client = make_client()
+    for cmd, params in CALLS:
+        spec = measure(
+            functools.partial(getattr(client, cmd), params), args.calls)
+        legacy = measure(
+            functools.partial(legacy_call, client, cmd, params), args.calls)
+        print(cmd)
+        for name, (elapsed, peak) in (("params dict", legacy),
+                                      ("precompiled spec", spec)):
+            print("  {:<18} {:8.2f} us/call {:8d} B peak".format(
+                name, elapsed, peak))
+
+
+if __name__ == "__main__":
+    main()
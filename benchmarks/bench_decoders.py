@@ -0,0 +1,106 @@
+"""
+Benchmark: decoding large balances and get_tx_info_multi responses
+
+Run from the repository root with:
+
+    python -m benchmarks.bench_decoders
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from python_coinpayments.decoders import FAST_BACKENDS, get_decoder
+
+
+def make_tx_info_multi(count: int):
+    """
+    Build a get_tx_info_multi sized response body
+    """
+    return json.dumps({
+        "error": "ok",
+        "result": {
+            "CPTX{:08d}".format(i): {
+                "error": "ok",
+                "time_created": 1553366870,
+                "time_expires": 1553376870,
+                "status": 100,
+                "status_text": "Complete",
+                "type": "coins",
+                "coin": "BTC",
+                "amount": 123456,
+                "amountf": "0.00123456",
+                "received": 123456,
+                "receivedf": "0.00123456",
+                "recv_confirms": 3,
+                "payment_address": "3PH6wBTHcXyYBLKhbVxSGEJ5GDgtRJYvA5",
+            }
+            for i in range(count)
+        },
+    }).encode("utf-8")
+
+
+def make_balances(count: int):
+    """
+    Build a balances sized response body
+    """
+    return json.dumps({
+        "error": "ok",
+        "result": {
+            "COIN{}".format(i): {
+                "balance": 12345678,
+                "balancef": "0.12345678",
+                "status": "available",
+                "coin_status": "online",
+            }
+            for i in range(count)
+        },
+    }).encode("utf-8")
+
+
+def measure(decoder, body: bytes, rounds: int):
+    """
+    Get the mean decode time in ms and the peak memory in KiB
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        decoder(body)
+    elapsed = (time.perf_counter() - start) / rounds * 1000
+    tracemalloc.start()
+    decoder(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak / 1024
+
+
+def main():
+    """
+    Run the benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    names = ["json", "decimal"]
+    for name in FAST_BACKENDS:
+        try:
+            get_decoder(name)
+        except ImportError:
+            continue
+        names.append(name)
+
+    bodies = (
+        ("get_tx_info_multi", make_tx_info_multi(args.count)),
+        ("balances", make_balances(args.count)),
+    )
+    for label, body in bodies:
+        print("{} ({} KiB)".format(label, len(body) // 1024))
+        for name in names:
+            elapsed, peak = measure(get_decoder(name), body, args.rounds)
+            print("  {:<12} {:8.2f} ms {:10.0f} KiB peak".format(
+                name, elapsed, peak))
+
+
+if __name__ == "__main__":
+    main()
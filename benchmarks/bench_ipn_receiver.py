@@ -0,0 +1,236 @@
+"""
+Load test: signed IPNs posted concurrently to the WSGI and ASGI receivers
+
+The WSGI receiver runs on a threaded wsgiref server.  No ASGI server is
+required: the ASGI receiver runs on a minimal asyncio HTTP/1.1 server, with
+a callback that blocks for --work seconds to show that it does not stall the
+event loop.  Run from the repository root with:
+
+    python -m benchmarks.bench_ipn_receiver
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import http.client
+import socketserver
+import statistics
+import threading
+import time
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from python_coinpayments import IPNVerifier
+from python_coinpayments.middleware import ASGIIPNReceiver, WSGIIPNReceiver
+from python_coinpayments.signing import Signer, encode_params
+
+SECRET = "secret"
+MERCHANT = "merchant"
+
+
+class QuietHandler(WSGIRequestHandler):
+    """
+    Keep benchmark output quiet
+    """
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    """
+    Threaded WSGI server
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+@contextlib.contextmanager
+def wsgi_server(app):
+    """
+    Serve a WSGI app on a random local port; yields the port
+    """
+    httpd = make_server(
+        "127.0.0.1", 0, app, server_class=ThreadingWSGIServer,
+        handler_class=QuietHandler)
+    thread = threading.Thread(
+        target=httpd.serve_forever, args=(0.01, ), daemon=True)
+    thread.start()
+    try:
+        yield httpd.server_port
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+async def _serve_connection(app, reader, writer):
+    """
+    Serve keep-alive HTTP/1.1 requests with Content-Length bodies
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = []
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.partition(b":")
+                name, value = name.strip().lower(), value.strip()
+                headers.append((name, value))
+                if name == b"content-length":
+                    length = int(value)
+            body = await reader.readexactly(length)
+
+            async def receive(body=body):
+                return {"type": "http.request", "body": body}
+
+            response = {}
+
+            async def send(message, response=response):
+                if message["type"] == "http.response.start":
+                    response["status"] = message["status"]
+                    response["headers"] = message["headers"]
+                else:
+                    response["body"] = message.get("body", b"")
+
+            scope = {
+                "type": "http", "method": method, "path": path,
+                "headers": headers,
+            }
+            await app(scope, receive, send)
+            head = ["HTTP/1.1 {} X".format(response["status"])] + [
+                "{}: {}".format(name.decode(), value.decode())
+                for name, value in response["headers"]
+            ]
+            writer.write(
+                "\r\n".join(head).encode("latin-1") + b"\r\n\r\n"
+                + response["body"])
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+@contextlib.contextmanager
+def asgi_server(app):
+    """
+    Serve an ASGI app on a random local port; yields the port
+    """
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(asyncio.start_server(
+        lambda reader, writer: _serve_connection(app, reader, writer),
+        "127.0.0.1", 0, backlog=128))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.sockets[0].getsockname()[1]
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        server.close()
+        loop.close()
+
+
+def make_ipns(count: int):
+    """
+    Build count signed IPN bodies, as (hmac, body) tuples
+    """
+    signer = Signer(SECRET)
+    ipns = []
+    for index in range(count):
+        body = encode_params({
+            "ipn_version": "1.0",
+            "ipn_id": "{:032x}".format(index),
+            "ipn_mode": "hmac",
+            "merchant": MERCHANT,
+            "ipn_type": "api",
+            "txn_id": "CPTX{:08d}".format(index),
+            "status": "100",
+            "status_text": "Complete",
+            "amount1": "1.00",
+            "amount2": "0.00012345",
+        })
+        ipns.append((signer.sign(body), body))
+    return ipns
+
+
+def post_all(port: int, ipns: list):
+    """
+    Post IPNs over one keep-alive connection; returns latencies in ms
+    """
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    latencies = []
+    try:
+        for hmac, body in ipns:
+            start = time.perf_counter()
+            conn.request("POST", "/ipn", body=body, headers={
+                "HMAC": hmac,
+                "Content-Type": "application/x-www-form-urlencoded",
+            })
+            response = conn.getresponse()
+            response.read()
+            assert response.status == 200, response.status
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        conn.close()
+    return latencies
+
+
+def load(port: int, ipns: list, concurrency: int):
+    """
+    Post IPNs from concurrency threads
+
+    Returns a tuple of (IPNs per second, latencies in ms)
+    """
+    slices = [ipns[index::concurrency] for index in range(concurrency)]
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(post_all, [port] * concurrency, slices))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for result in results for latency in result)
+    return len(ipns) / elapsed, latencies
+
+
+def report(name: str, rate: float, latencies: list):
+    """
+    Print one result line
+    """
+    print("{:<8} {:8.0f} IPN/s  p50 {:6.2f} ms  p99 {:6.2f} ms".format(
+        name, rate, statistics.median(latencies),
+        latencies[int(len(latencies) * 0.99) - 1]))
+
+
+def main():
+    """
+    Run the load test
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ipns", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument(
+        "--work", type=float, default=0.001,
+        help="seconds each callback blocks for")
+    args = parser.parse_args()
+
+    def callback(http_post):  # pylint: disable=unused-argument
+        time.sleep(args.work)
+
+    verifier = IPNVerifier(secret=SECRET, merchant_id=MERCHANT)
+    ipns = make_ipns(args.ipns)
+
+    with wsgi_server(WSGIIPNReceiver(verifier, callback)) as port:
+        report("WSGI", *load(port, ipns, args.concurrency))
+
+    executor = concurrent.futures.ThreadPoolExecutor(args.concurrency)
+    with asgi_server(ASGIIPNReceiver(
+            verifier, callback, executor=executor)) as port:
+        report("ASGI", *load(port, ipns, args.concurrency))
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Benchmark: memory held by get_tx_info results as dicts and as models
+
+Models convert fields as they are read without keeping the converted
+values, so reading a field does not change their size.
+
+Run from the repository root with:
+
+    python -m benchmarks.bench_models
+"""
+import argparse
+import json
+import tracemalloc
+
+from python_coinpayments.models import TransactionInfo
+
+
+def make_results(count: int):
+    """
+    Decode `count` get_tx_info results, as the client would
+    """
+    body = json.dumps([
+        {
+            "time_created": 1553366870 + i,
+            "time_expires": 1553376870 + i,
+            "status": 100,
+            "status_text": "Complete",
+            "type": "coins",
+            "coin": "BTC",
+            "amount": 123456 + i,
+            "amountf": "0.00{}".format(123456 + i),
+            "received": 123456 + i,
+            "receivedf": "0.00{}".format(123456 + i),
+            "recv_confirms": 3,
+            "payment_address": "3PH6wBTHcXyYBLKhbVxSGEJ5GD{:08d}".format(i),
+        }
+        for i in range(count)
+    ])
+    return json.loads(body)
+
+
+def measure(build, count: int):
+    """
+    Get the KiB still allocated after build() made count results
+    """
+    tracemalloc.start()
+    results = build(count)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return current / 1024
+
+
+def main():
+    """
+    Run the benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=50000)
+    args = parser.parse_args()
+
+    def as_models(count):
+        return [TransactionInfo.from_dict(result)
+                for result in make_results(count)]
+
+    def as_models_read(count):
+        models = as_models(count)
+        for model in models:
+            model.amountf  # pylint: disable=pointless-statement
+        return models
+
+    for name, build in (("dicts", make_results),
+                        ("TransactionInfo", as_models),
+                        ("TransactionInfo, amountf read", as_models_read)):
+        print("{:<32} {:10.0f} KiB".format(name, measure(build, args.count)))
+
+
+if __name__ == "__main__":
+    main()
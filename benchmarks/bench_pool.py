@@ -0,0 +1,74 @@
+"""
+Benchmark: latency per API call with and without the connection pool
+
+Run from the repository root with:
+
+    python -m benchmarks.bench_pool
+"""
+import argparse
+import time
+import urllib.request
+
+from benchmarks.stub_server import https_stub
+from python_coinpayments import CoinPayments, ConnectionPool
+from python_coinpayments.resilience import split_timeout
+
+
+class UrlopenTransport:
+    """
+    Transport that opens a new connection per call, like urlopen always did
+    """
+
+    def __init__(self, ssl_context):
+        self.ssl_context = ssl_context
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Send a request with urllib.request.urlopen
+        """
+        req = urllib.request.Request(
+            url, data=body, headers=headers or {}, method=method)
+        with urllib.request.urlopen(
+                req, context=self.ssl_context,
+                timeout=split_timeout(timeout)[1]) as resp:
+            return resp.status, resp.read()
+
+
+def measure(client: CoinPayments, calls: int):
+    """
+    Return the mean latency of `calls` rates() calls in milliseconds
+    """
+    client.rates()  # warm up
+    start = time.perf_counter()
+    for _ in range(calls):
+        client.rates()
+    return (time.perf_counter() - start) / calls * 1000
+
+
+def main():
+    """
+    Run the benchmark
+    """
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with https_stub() as (url, ssl_context):
+        transports = (
+            ("urlopen (new connection per call)",
+             UrlopenTransport(ssl_context)),
+            ("ConnectionPool (keep-alive)",
+             ConnectionPool(ssl_context=ssl_context)),
+        )
+        for name, transport in transports:
+            client = CoinPayments(
+                public_key="public key",
+                private_key="private key",
+                transport=transport)
+            client.url = url
+            print("{:<36} {:8.3f} ms/call".format(
+                name, measure(client, args.calls)))
+
+
+if __name__ == "__main__":
+    main()
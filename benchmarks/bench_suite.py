@@ -0,0 +1,342 @@
+"""
+Benchmark suite: signing, IPN verification and API call throughput
+
+API calls go to a local `FakeAPI` server, which checks their HMACs like
+CoinPayments does.  Each command is called sequentially, from a pool of
+threads sharing one client and concurrently on asyncio.  Results are
+printed and, with --output, written as JSON; --compare checks them against
+an earlier JSON file and exits with status 1 on a regression.  Run from the
+repository root with:
+
+    python -m benchmarks.bench_suite --output results.json
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+
+from benchmarks.stub_server import (
+    PRIVATE_KEY, PUBLIC_KEY, FakeAPI, FakeAPIHandler, http_stub, https_stub,
+)
+from python_coinpayments import (
+    CoinPayments, ConnectionPool, IPNVerifier, __version__,
+)
+from python_coinpayments.aio import AsyncCoinPayments, AsyncConnectionPool
+from python_coinpayments.signing import Signer, encode_params
+
+COMMANDS = {
+    "rates": ("rates", {}),
+    "balances": ("balances", {}),
+    "get_tx_info": ("get_tx_info", {"txid": "CPDC4OMYFCCJBXRAK2SWJJUJTP"}),
+    "create_transaction": ("create_transaction", {
+        "amount": "10.00",
+        "currency1": "USD",
+        "currency2": "BTC",
+        "buyer_email": "buyer@example.com",
+        "item_name": "Order 1234",
+    }),
+    "get_callback_address": ("get_callback_address", {"currency": "BTC"}),
+}
+
+
+def result(name: str, count: int, elapsed: float, latencies: list = None,
+           errors: int = 0):
+    """
+    Summarize a benchmark run as a dict
+    """
+    summary = {
+        "name": name,
+        "count": count,
+        "ops_per_sec": count / elapsed,
+        "mean_us": elapsed / count * 1e6,
+    }
+    if latencies:
+        latencies = sorted(latencies)
+        summary.update({
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p99_ms": latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+            * 1000,
+            "errors": errors,
+        })
+    return summary
+
+
+def time_loop(name: str, func, args: list, repeat: int):
+    """
+    Time repeat calls of func over args, cycling through them
+    """
+    count = len(args) * repeat
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for arg in args:
+            func(*arg)
+    return result(name, count, time.perf_counter() - start)
+
+
+def bench_signing(repeat: int):
+    """
+    Sign create_transaction sized requests
+    """
+    signer = Signer(PRIVATE_KEY)
+    params = [
+        dict(COMMANDS["create_transaction"][1], key=PUBLIC_KEY, version=1,
+             cmd="create_transaction", format="json",
+             invoice="{:08d}".format(index))
+        for index in range(100)
+    ]
+    encoded = [(encode_params(param), ) for param in params]
+    return [
+        time_loop("signing.encode", encode_params,
+                  [(param, ) for param in params], repeat),
+        time_loop("signing.sign", signer.sign, encoded, repeat),
+        time_loop("signing.sign_params", signer.sign_params,
+                  [(param, ) for param in params], repeat),
+    ]
+
+
+def bench_ipn(repeat: int):
+    """
+    Verify signed IPNs, one in ten with a bad HMAC
+    """
+    signer = Signer("ipn secret")
+    ipns = []
+    for index in range(100):
+        http_post = {
+            "ipn_version": "1.0",
+            "ipn_id": "{:032x}".format(index),
+            "ipn_mode": "hmac",
+            "merchant": "merchant",
+            "ipn_type": "api",
+            "txn_id": "CPTX{:08d}".format(index),
+            "status": "100",
+            "status_text": "Complete",
+            "amount1": "10.00",
+            "amount2": "0.00123450",
+        }
+        _, hashed = signer.sign_params(http_post)
+        if not index % 10:
+            hashed = "0" * len(hashed)
+        ipns.append(({"HTTP_HMAC": hashed}, http_post))
+    verifier = IPNVerifier(secret="ipn secret", merchant_id="merchant")
+    return [time_loop("ipn.verify", verifier.verify, ipns, repeat)]
+
+
+def call(client: CoinPayments, command: str):
+    """
+    Call a command; returns a tuple of (latency, whether it failed)
+    """
+    method, params = COMMANDS[command]
+    start = time.perf_counter()
+    try:
+        failed = getattr(client, method)(dict(params))["error"] != "ok"
+    except Exception:  # pylint: disable=broad-except
+        failed = True
+    return time.perf_counter() - start, failed
+
+
+def run_calls(name: str, calls, count: int):
+    """
+    Summarize (latency, failed) tuples produced by calls()
+    """
+    start = time.perf_counter()
+    outcomes = calls()
+    elapsed = time.perf_counter() - start
+    return result(
+        name, count, elapsed, [latency for latency, _ in outcomes],
+        sum(failed for _, failed in outcomes))
+
+
+def bench_sync(client: CoinPayments, command: str, count: int):
+    """
+    Call a command count times in a row
+    """
+    return run_calls(
+        "throughput.{}.sequential".format(command),
+        lambda: [call(client, command) for _ in range(count)], count)
+
+
+def bench_threads(client: CoinPayments, command: str, count: int,
+                  concurrency: int):
+    """
+    Call a command count times from concurrency threads
+    """
+    def calls():
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(
+                lambda _: call(client, command), range(count)))
+
+    return run_calls("throughput.{}.threads".format(command), calls, count)
+
+
+async def acall(client: AsyncCoinPayments, command: str,
+                semaphore: asyncio.Semaphore):
+    """
+    Call a command on the asyncio client, at most concurrency at a time
+    """
+    method, params = COMMANDS[command]
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            response = await getattr(client, method)(dict(params))
+            failed = response["error"] != "ok"
+        except Exception:  # pylint: disable=broad-except
+            failed = True
+        return time.perf_counter() - start, failed
+
+
+async def acalls(client: AsyncCoinPayments, command: str, count: int,
+                 concurrency: int):
+    """
+    Call a command count times on asyncio, concurrency at a time
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*[
+        acall(client, command, semaphore) for _ in range(count)])
+
+
+def bench_asyncio(client: AsyncCoinPayments, command: str, count: int,
+                  concurrency: int, loop: asyncio.AbstractEventLoop):
+    """
+    Call a command count times, concurrency at a time, on asyncio
+    """
+    return run_calls(
+        "throughput.{}.asyncio".format(command),
+        lambda: loop.run_until_complete(
+            acalls(client, command, count, concurrency)),
+        count)
+
+
+def bench_throughput(args):
+    """
+    Call each command against the fake API, sequentially and concurrently
+    """
+    api = FakeAPI(
+        latency=args.latency, error_rate=args.error_rate,
+        response_size=args.response_size, seed=0)
+    stub = http_stub if args.plain else https_stub
+    results = []
+    # pooled connections belong to the loop that opened them
+    loop = asyncio.new_event_loop()
+    with stub(FakeAPIHandler, api) as (url, ssl_context):
+        client = CoinPayments(
+            public_key=PUBLIC_KEY, private_key=PRIVATE_KEY,
+            transport=ConnectionPool(
+                maxsize=args.concurrency, ssl_context=ssl_context))
+        client.url = url
+        aclient = AsyncCoinPayments(
+            public_key=PUBLIC_KEY, private_key=PRIVATE_KEY,
+            transport=AsyncConnectionPool(
+                maxsize=args.concurrency, ssl_context=ssl_context))
+        aclient.url = url
+        for command in args.commands:
+            call(client, command)  # warm up
+            results.append(bench_sync(client, command, args.calls))
+            results.append(bench_threads(
+                client, command, args.calls, args.concurrency))
+            results.append(bench_asyncio(
+                aclient, command, args.calls, args.concurrency, loop))
+        aclient.transport.clear()
+    loop.close()
+    return results
+
+
+def compare(results: list, baseline: dict, threshold: float):
+    """
+    Print the change in throughput against a baseline
+
+    Returns the names of the benchmarks that regressed by more than
+    threshold (a fraction).
+    """
+    before = {
+        previous["name"]: previous for previous in baseline["results"]}
+    regressions = []
+    for current in results:
+        previous = before.get(current["name"])
+        if previous is None:
+            continue
+        change = current["ops_per_sec"] / previous["ops_per_sec"] - 1
+        flag = ""
+        if change < -threshold:
+            regressions.append(current["name"])
+            flag = "  REGRESSION"
+        print("{:<48} {:+7.1%}{}".format(current["name"], change, flag))
+    return regressions
+
+
+def report(summary: dict):
+    """
+    Print one result line
+    """
+    line = "{:<48} {:>11.0f} ops/s".format(
+        summary["name"], summary["ops_per_sec"])
+    if "p50_ms" in summary:
+        line += "  p50 {:7.2f} ms  p99 {:7.2f} ms  errors {}".format(
+            summary["p50_ms"], summary["p99_ms"], summary["errors"])
+    else:
+        line += "  {:9.2f} us/op".format(summary["mean_us"])
+    print(line)
+
+
+def main():
+    """
+    Run the suite
+    """
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200,
+                        help="rounds of 100 signatures or IPNs")
+    parser.add_argument("--calls", type=int, default=500,
+                        help="API calls per command and mode")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds the fake API takes per call")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of calls failing with HTTP 503")
+    parser.add_argument("--response-size", type=int, default=0,
+                        help="pad responses to this many bytes")
+    parser.add_argument("--commands", nargs="+", default=list(COMMANDS),
+                        choices=list(COMMANDS))
+    parser.add_argument("--plain", action="store_true",
+                        help="use plain HTTP instead of HTTPS")
+    parser.add_argument("--output", help="write the results as JSON here")
+    parser.add_argument("--compare", help="JSON results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    results = bench_signing(args.repeat) + bench_ipn(args.repeat)
+    results += bench_throughput(args)
+    for summary in results:
+        report(summary)
+
+    settings = vars(args).copy()
+    del settings["output"], settings["compare"]
+    document = {
+        "version": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "date": datetime.datetime.utcnow().isoformat() + "Z",
+        "settings": settings,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(document, output, indent=2)
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            regressions = compare(results, json.load(baseline),
+                                  args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
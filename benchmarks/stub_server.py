@@ -0,0 +1,314 @@
+"""
+Local HTTPS stub of the CoinPayments API used by the benchmarks
+
+`StubHandler` answers every call with the same tiny body.  `FakeAPI` is a
+stand-in for the real API: it checks keys and HMACs the way CoinPayments
+does and answers the main commands with realistic results.
+"""
+import collections
+import contextlib
+import hmac
+import http.server
+import json
+import os
+import random
+import socketserver
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from python_coinpayments.signing import Signer
+
+RESPONSE = b'{"error": "ok", "result": {}}'
+
+PUBLIC_KEY = "public key"
+PRIVATE_KEY = "private key"
+
+TX_INFO = {
+    "time_created": 1553366870,
+    "time_expires": 1553376870,
+    "status": 0,
+    "status_text": "Waiting for buyer funds...",
+    "type": "coins",
+    "coin": "BTC",
+    "amount": 1234500,
+    "amountf": "0.01234500",
+    "received": 0,
+    "receivedf": "0.00000000",
+    "recv_confirms": 0,
+    "payment_address": "3PqzqtNsAAwxPUWz6hs9PTWFTuPMpVKoB2",
+}
+
+RESULTS = {
+    "get_basic_info": {
+        "username": "merchant",
+        "merchant_id": "a8a5d1d3d5f4bf6b0a5bd8e9c2f6b9d4",
+        "email": "merchant@example.com",
+        "public_name": "Merchant",
+        "time_joined": 1355234432,
+    },
+    "rates": {
+        currency: {
+            "is_fiat": int(currency in ("USD", "EUR")),
+            "rate_btc": rate,
+            "last_update": "1553366870",
+            "tx_fee": "0.00010000",
+            "status": "online",
+            "name": currency,
+            "confirms": "3",
+            "capabilities": ["payments", "wallet", "transfers"],
+        }
+        for currency, rate in (
+            ("BTC", "1.000000000000000000000000"),
+            ("LTC", "0.014900000000000000000000"),
+            ("ETH", "0.032100000000000000000000"),
+            ("USD", "0.000250000000000000000000"),
+            ("EUR", "0.000220000000000000000000"),
+        )
+    },
+    "balances": {
+        currency: {
+            "balance": 12345678,
+            "balancef": "0.12345678",
+            "status": "available",
+            "coin_status": "online",
+        }
+        for currency in ("BTC", "LTC", "ETH")
+    },
+    "create_transaction": {
+        "amount": "0.01234500",
+        "address": "3PqzqtNsAAwxPUWz6hs9PTWFTuPMpVKoB2",
+        "txn_id": "CPDC4OMYFCCJBXRAK2SWJJUJTP",
+        "confirms_needed": "2",
+        "timeout": 9000,
+        "checkout_url": "https://www.coinpayments.net/index.php?cmd=checkout",
+        "status_url": "https://www.coinpayments.net/index.php?cmd=status",
+        "qrcode_url": "https://www.coinpayments.net/qrgen.php?id=CPDC4OMY",
+    },
+    "get_tx_info": TX_INFO,
+    "get_callback_address": {
+        "address": "3PqzqtNsAAwxPUWz6hs9PTWFTuPMpVKoB2",
+    },
+    "create_withdrawal": {
+        "id": "CWDC3BQXZXKMFRMRIMVTZOXWH4",
+        "status": 0,
+        "amount": "0.01000000",
+    },
+}
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answer every POST with a tiny JSON body, keeping connections alive
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Handle an API call
+        """
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE)))
+        self.end_headers()
+        self.wfile.write(RESPONSE)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """
+        Keep benchmark output quiet
+        """
+
+
+class StubServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Threaded HTTP server
+    """
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def make_certificate(directory: str):
+    """
+    Create a self-signed certificate for localhost using openssl
+
+    Returns a tuple of (certfile, keyfile)
+    """
+    certfile = os.path.join(directory, "cert.pem")
+    keyfile = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes",
+            "-keyout", keyfile, "-out", certfile, "-days", "1",
+            "-subj", "/CN=localhost",
+            "-addext", "subjectAltName=DNS:localhost,IP:127.0.0.1",
+        ],
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return certfile, keyfile
+
+
+class FakeAPI:
+    """
+    Stand-in for the CoinPayments API
+
+    Requests are checked like the API checks them: the version, the public
+    key and the HMAC of the body under its private key (`keys` maps public
+    to private keys) and the command.  Failed checks are answered with the
+    API's error messages.  Every call takes `latency` seconds, a fraction
+    `error_rate` of them fail with HTTP 503 and results are padded to about
+    `response_size` bytes.  Thread-safe.
+    """
+
+    def __init__(
+            self,
+            keys: dict = None,
+            latency: float = 0.0,
+            error_rate: float = 0.0,
+            response_size: int = 0,
+            seed: int = None,
+    ):
+        """
+        Initialize!
+        """
+        if keys is None:
+            keys = {PUBLIC_KEY: PRIVATE_KEY}
+        self._signers = {
+            public: Signer(private) for public, private in keys.items()}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.response_size = response_size
+        self.calls = collections.Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        # encoded once, so the server is not what is being measured
+        self._responses = {
+            cmd: self._encode(result) for cmd, result in RESULTS.items()}
+
+    def _encode(self, result: dict):
+        """
+        Encode a successful response, padded to response_size
+        """
+        body = json.dumps({"error": "ok", "result": result})
+        padding = self.response_size - len(body) - len(', "padding": ""')
+        if padding > 0:
+            result = dict(result, padding="x" * padding)
+            body = json.dumps({"error": "ok", "result": result})
+        return body.encode("utf-8")
+
+    @staticmethod
+    def _error(message: str):
+        return json.dumps({"error": message}).encode("utf-8")
+
+    def handle(self, http_hmac: str, body: bytes):
+        """
+        Answer one API call
+
+        Returns a tuple of (HTTP status, response body)
+        """
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+        if failed:
+            return 503, self._error("Service temporarily unavailable")
+
+        params = dict(urllib.parse.parse_qsl(
+            body.decode("utf-8"), keep_blank_values=True))
+        if params.get("version") != "1":
+            return 200, self._error("Invalid API version")
+        signer = self._signers.get(params.get("key"))
+        if signer is None:
+            return 200, self._error("Invalid API public key")
+        if not http_hmac:
+            return 200, self._error("No HMAC signature sent.")
+        if not hmac.compare_digest(
+                http_hmac.encode("utf-8"), signer.sign(body).encode("utf-8")):
+            return 200, self._error("HMAC signature does not match")
+
+        cmd = params.get("cmd")
+        with self._lock:
+            self.calls[cmd] += 1
+        if cmd == "get_tx_info_multi":
+            return 200, self._encode({
+                txid: dict(TX_INFO, error="ok")
+                for txid in params.get("txid", "").split("|")
+            })
+        response = self._responses.get(cmd)
+        if response is None:
+            return 200, self._error("Invalid command name!")
+        return 200, response
+
+
+class FakeAPIHandler(StubHandler):
+    """
+    Answer API calls with the server's FakeAPI
+    """
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Handle an API call
+        """
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        status, response = self.server.api.handle(
+            self.headers.get("HMAC"), body)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+@contextlib.contextmanager
+def _serve(handler, context: ssl.SSLContext = None, api: FakeAPI = None):
+    """
+    Run a StubServer on a random local port; yields the server
+    """
+    httpd = StubServer(("127.0.0.1", 0), handler)
+    httpd.api = api
+    if context is not None:
+        httpd.socket = context.wrap_socket(httpd.socket, server_side=True)
+    thread = threading.Thread(
+        target=httpd.serve_forever, args=(0.01, ), daemon=True)
+    thread.start()
+    try:
+        yield httpd
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@contextlib.contextmanager
+def https_stub(handler=StubHandler, api: FakeAPI = None):
+    """
+    Run the stub over HTTPS on a random local port
+
+    Yields a tuple of (url, client ssl context trusting the stub)
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = make_certificate(directory)
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(certfile, keyfile)
+        client_context = ssl.create_default_context(cafile=certfile)
+        with _serve(handler, server_context, api) as httpd:
+            yield (
+                "https://localhost:{}/api.php".format(httpd.server_port),
+                client_context,
+            )
+
+
+@contextlib.contextmanager
+def http_stub(handler=StubHandler, api: FakeAPI = None):
+    """
+    Run the stub over plain HTTP on a random local port
+
+    Yields a tuple of (url, None), like https_stub
+    """
+    with _serve(handler, api=api) as httpd:
+        yield "http://127.0.0.1:{}/api.php".format(httpd.server_port), None
@@ -9,3 +9,15 @@ __version__ = "0.5.0"
 from python_coinpayments.api import (  # noqa
     CoinPayments, authenticate_ipn_request, calculate_hmac,
 )
+from python_coinpayments.aio import (  # noqa
+    AsyncCoinPayments, AsyncConnectionPool,
+)
+from python_coinpayments.cache import ResponseCache  # noqa
+from python_coinpayments.exceptions import CoinPaymentsError  # noqa
+from python_coinpayments.ipn import IPNVerifier  # noqa
+from python_coinpayments.ratelimit import RateLimiter  # noqa
+from python_coinpayments.resilience import (  # noqa
+    CircuitBreaker, RetryPolicy,
+)
+from python_coinpayments.store import FinalResultStore  # noqa
+from python_coinpayments.transport import ConnectionPool  # noqa
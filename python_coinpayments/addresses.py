@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Pool of pre-allocated callback addresses
+"""
+import collections
+import concurrent.futures
+import json
+import sqlite3
+import threading
+
+from python_coinpayments.exceptions import CoinPaymentsError
+
+
+class CallbackAddressPool:
+    """
+    Keeps unused callback addresses ready for each currency
+
+    `sizes` maps currencies to the number of unused addresses to keep.  An
+    address is handed out by `acquire` in O(1) without calling the API;
+    once a currency is down to `low_water` (by default half its size) the
+    background refiller tops it up with concurrent get_callback_address
+    calls, on at most `max_workers` threads.  Should a currency run dry,
+    `acquire` calls the API directly.
+
+    With `path` the unused addresses are kept in an SQLite database (in WAL
+    mode) and reloaded on restart, so none are lost.  `params` are extra
+    get_callback_address params, e.g. a label.  All methods are
+    thread-safe.
+    """
+
+    def __init__(
+            self,
+            client,
+            sizes: dict,
+            path: str = None,
+            low_water: dict = None,
+            max_workers: int = 4,
+            params: dict = None,
+            refill_interval: float = 60.0,
+    ):
+        """
+        Initialize!
+        """
+        self.client = client
+        self.sizes = dict(sizes)
+        self.low_water = {
+            currency: size // 2 for currency, size in self.sizes.items()}
+        self.low_water.update(low_water or {})
+        self.max_workers = max_workers
+        self.params = dict(params or {})
+        self.refill_interval = refill_interval
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._pools = {
+            currency: collections.deque() for currency in self.sizes}
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS callback_addresses ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " currency TEXT NOT NULL,"
+                " address TEXT NOT NULL)")
+            for id_, currency, address in self._db.execute(
+                    "SELECT id, currency, address FROM callback_addresses"
+                    " ORDER BY id"):
+                self._pools.setdefault(currency, collections.deque()).append(
+                    (id_, json.loads(address)))
+
+    def _fetch(self, currency: str):
+        """
+        Get a new callback address from the API
+        """
+        params = dict(self.params, currency=currency)
+        response = self.client.get_callback_address(params)
+        if response.get("error") != "ok":
+            raise CoinPaymentsError(response.get("error"))
+        return response["result"]
+
+    def acquire(self, currency: str):
+        """
+        Get an unused callback address for currency
+
+        Returns the get_callback_address result, e.g. {"address": ...}.
+        Raises CoinPaymentsError if the pool is empty and the API refuses.
+        """
+        with self._lock:
+            pool = self._pools.get(currency)
+            entry = pool.popleft() if pool else None
+            if entry is not None:
+                self.hits += 1
+                if self._db is not None:
+                    self._db.execute(
+                        "DELETE FROM callback_addresses WHERE id = ?",
+                        (entry[0], ))
+            else:
+                self.misses += 1
+            low = len(pool or ()) <= self.low_water.get(currency, 0)
+        if low and currency in self.sizes:
+            self._wakeup.set()
+        if entry is not None:
+            return entry[1]
+        return self._fetch(currency)
+
+    def _add(self, currency: str, address: dict):
+        with self._lock:
+            id_ = None
+            if self._db is not None:
+                id_ = self._db.execute(
+                    "INSERT INTO callback_addresses (currency, address)"
+                    " VALUES (?, ?)",
+                    (currency, json.dumps(address))).lastrowid
+            self._pools.setdefault(currency, collections.deque()).append(
+                (id_, address))
+
+    def refill(self, currency: str = None):
+        """
+        Top up one currency, or all that are at or below their low water
+
+        Returns the number of addresses added.  Failed calls are skipped
+        and retried on the next refill.  Raises ValueError for a currency
+        that has no pool size.
+        """
+        if currency is not None and currency not in self.sizes:
+            raise ValueError("No pool size for {}".format(currency))
+        # a single refill at a time, or pools would be overfilled
+        with self._refill_lock:
+            with self._lock:
+                if currency is not None:
+                    currencies = [currency]
+                else:
+                    currencies = [
+                        currency for currency, pool in self._pools.items()
+                        if currency in self.sizes
+                        and len(pool) <= self.low_water[currency]
+                    ]
+                wanted = [
+                    currency for currency in currencies
+                    for _ in range(self.sizes[currency]
+                                   - len(self._pools[currency]))
+                ]
+            if not wanted:
+                return 0
+            added = 0
+            with concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers) as executor:
+                futures = {
+                    executor.submit(self._fetch, currency): currency
+                    for currency in wanted
+                }
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        address = future.result()
+                    except Exception:  # pylint: disable=broad-except
+                        continue
+                    self._add(futures[future], address)
+                    added += 1
+        return added
+
+    def levels(self):
+        """
+        Get the number of unused addresses per currency
+        """
+        with self._lock:
+            return {
+                currency: len(pool) for currency, pool in self._pools.items()}
+
+    def _run(self):
+        while not self._stopped:
+            self._wakeup.clear()
+            self.refill()
+            self._wakeup.wait(self.refill_interval)
+
+    def start(self):
+        """
+        Fill the pools and keep them filled on a background thread
+        """
+        self._stopped = False
+        self._thread = threading.Thread(
+            target=self._run, name="address-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background refills
+        """
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        """
+        Stop refilling and close the database, if any
+        """
+        self.stop()
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio support for the CoinPayments client
+"""
+import asyncio
+import collections
+import itertools
+import ssl
+import time
+import urllib.parse
+
+from python_coinpayments.api import CoinPayments
+from python_coinpayments.bulk import (
+    TX_INFO_MULTI_LIMIT, TxInfoChunk, chunked, make_tx_info_chunk,
+    merge_tx_info_chunks,
+)
+from python_coinpayments.cache import ResponseCache
+from python_coinpayments.commands import CommandSpec, request_key
+from python_coinpayments.instrumentation import RequestEvent, add_time
+from python_coinpayments.pagination import MAX_PAGE_SIZE, aiter_pages
+from python_coinpayments.ratelimit import RateLimiter
+from python_coinpayments.resilience import (
+    DEFAULT_TIMEOUT, TRANSPORT_ERRORS, CircuitBreaker, RetryPolicy,
+    split_timeout,
+)
+from python_coinpayments.singleflight import AsyncSingleFlight
+from python_coinpayments.store import FinalResultStore
+from python_coinpayments.transport import RecordingTransport, ReplayTransport
+
+# asyncio.TimeoutError is only an OSError from Python 3.11 on, and a
+# connection closed before the whole response arrived is an EOFError
+ASYNC_TRANSPORT_ERRORS = TRANSPORT_ERRORS + (
+    asyncio.TimeoutError, asyncio.IncompleteReadError)
+
+# asyncio.get_running_loop is new in Python 3.7; in a coroutine,
+# get_event_loop returns the running loop as well
+get_running_loop = getattr(
+    asyncio, "get_running_loop", asyncio.get_event_loop)
+
+# errors that mean a kept-alive connection was closed by the server while
+# it sat idle in the pool; they are only safe to retry if they happened
+# while the request was being written
+STALE_CONNECTION_ERRORS = (
+    asyncio.IncompleteReadError,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class AsyncConnectionPool:
+    """
+    Pool of persistent, non-blocking HTTP/1.1 connections
+
+    The asyncio counterpart of `ConnectionPool`.  A pool must only be used
+    from the event loop its connections were opened on.  As with
+    `ConnectionPool`, only a request that could not be written to a reused
+    connection is retried.  If a request is cancelled or times out its
+    connection is closed instead of being returned to the pool, so a
+    half-read response can never leak into the next request.
+    """
+    supports_timings = True
+
+    def __init__(
+            self,
+            maxsize: int = 10,
+            idle_timeout: float = 60.0,
+            max_retries: int = 1,
+            timeout=None,
+            ssl_context: ssl.SSLContext = None,
+    ):
+        """
+        Initialize!
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self._idle = {}
+
+    async def _new_connection(
+            self,
+            scheme: str,
+            host: str,
+            port: int,
+            connect_timeout: float = None,
+    ):
+        """
+        Open a new connection
+        """
+        return await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port,
+                ssl=self.ssl_context if scheme == "https" else None),
+            connect_timeout)
+
+    def _get_connection(self, origin: tuple):
+        """
+        Get an idle (reader, writer) pair for origin, or None
+        """
+        now = time.monotonic()
+        idle = self._idle.get(origin)
+        while idle:
+            reader, writer, last_used = idle.pop()
+            # StreamWriter.is_closing only exists from Python 3.7 on
+            if (now - last_used > self.idle_timeout or reader.at_eof()
+                    or writer.transport.is_closing()):
+                writer.close()
+                continue
+            return reader, writer
+        return None
+
+    def _put_connection(self, origin: tuple, reader, writer):
+        """
+        Return a connection to the pool, closing it if the pool is full
+        """
+        idle = self._idle.setdefault(origin, collections.deque())
+        if len(idle) < self.maxsize:
+            idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    @staticmethod
+    async def _read_head(reader):
+        """
+        Read the status line and headers of a response from reader
+
+        Returns a tuple of (status, headers)
+        """
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split(None, 2)[1])
+        headers = {}
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return status, headers
+
+    @staticmethod
+    async def _read_body(reader, headers: dict):
+        """
+        Read the body of a response with headers from reader
+        """
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size_line = await reader.readuntil(b"\r\n")
+                size = int(size_line.split(b";", 1)[0], 16)
+                if size == 0:
+                    # skip trailers up to the final empty line
+                    while await reader.readuntil(b"\r\n") != b"\r\n":
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b"".join(chunks)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+            headers["connection"] = "close"
+        return body
+
+    async def _read_response(self, reader, timings: dict = None,
+                             start: float = None):
+        """
+        Read the response to a request sent at `start`
+
+        Returns a tuple of (status, headers, body)
+        """
+        status, headers = await self._read_head(reader)
+        if timings is not None:
+            start = add_time(timings, "wait", start)
+        body = await self._read_body(reader, headers)
+        if timings is not None:
+            add_time(timings, "read", start)
+        return status, headers, body
+
+    async def request(
+            self,
+            method: str,
+            url: str,
+            body: bytes = None,
+            headers: dict = None,
+            timeout=None,
+            timings: dict = None,
+    ):
+        """
+        Send a request and read the whole response
+
+        `timeout` is in seconds, either one number or a (connect, read)
+        tuple, and defaults to the pool's timeout.  The read timeout applies
+        to sending the request and reading the whole response.  `timings`
+        is as for `ConnectionPool.request`.
+
+        Returns a tuple of:
+            - the HTTP status code
+            - the response body as bytes
+        """
+        parsed = urllib.parse.urlsplit(url)
+        scheme = parsed.scheme or "https"
+        port = parsed.port or (443 if scheme == "https" else 80)
+        origin = (scheme, parsed.hostname, port)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = "{}?{}".format(path, parsed.query)
+
+        lines = ["{} {} HTTP/1.1".format(method, path),
+                 "Host: {}".format(parsed.netloc)]
+        for name, value in (headers or {}).items():
+            lines.append("{}: {}".format(name, value))
+        if body is not None:
+            lines.append("Content-Length: {}".format(len(body)))
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+        payload = head + body if body is not None else head
+
+        connect_timeout, read_timeout = split_timeout(
+            self.timeout if timeout is None else timeout)
+
+        retries = 0
+        while True:
+            connection = self._get_connection(origin)
+            reused = connection is not None
+            if connection is None:
+                start = time.perf_counter()
+                connection = await self._new_connection(
+                    *origin, connect_timeout)
+                if timings is not None:
+                    add_time(timings, "connect", start)
+            reader, writer = connection
+            sent = False
+            try:
+                start = time.perf_counter()
+                writer.write(payload)
+                await asyncio.wait_for(writer.drain(), read_timeout)
+                sent = True
+                # the read timeout covers writing and reading together
+                remaining = read_timeout
+                if read_timeout is not None:
+                    remaining = max(
+                        read_timeout - (time.perf_counter() - start), 0)
+                status, response_headers, response_body = \
+                    await asyncio.wait_for(
+                        self._read_response(reader, timings, start),
+                        remaining)
+            except STALE_CONNECTION_ERRORS:
+                writer.close()
+                if sent or not reused or retries >= self.max_retries:
+                    raise
+                retries += 1
+                continue
+            except BaseException:
+                # includes cancellation: the connection is in an unknown
+                # state and must not be reused
+                writer.close()
+                raise
+
+            if response_headers.get("connection", "").lower() == "close":
+                writer.close()
+            else:
+                self._put_connection(origin, reader, writer)
+            return status, response_body
+
+    def clear(self):
+        """
+        Close all idle connections
+        """
+        idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for _, writer, _ in connections:
+                writer.close()
+
+    close = clear
+
+
+class AsyncRecordingTransport(RecordingTransport):
+    """
+    Records the requests sent through an asyncio transport
+
+    The asyncio counterpart of `RecordingTransport`, writing the same
+    format.
+    """
+
+    async def request(self, method: str, url: str, body: bytes = None,
+                      headers: dict = None, timeout=None, **kwargs):
+        """
+        Send a request with the wrapped transport and record it
+        """
+        started, start = time.time(), time.perf_counter()
+        try:
+            status, response = await self.transport.request(
+                method, url, body=body, headers=headers, timeout=timeout,
+                **kwargs)
+        except Exception as exception:
+            self._record(
+                started, start, method, url, body, error=exception)
+            raise
+        self._record(started, start, method, url, body, status, response)
+        return status, response
+
+
+class AsyncReplayTransport(ReplayTransport):
+    """
+    Answers requests of the asyncio client from a recording
+
+    The asyncio counterpart of `ReplayTransport`.
+    """
+
+    async def request(self, method: str, url: str, body: bytes = None,
+                      headers: dict = None, timeout=None):
+        # pylint: disable=unused-argument
+        """
+        Answer a request from the recording
+        """
+        entry, delay = self._lookup(body)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._response(entry)
+
+
+class AsyncCoinPayments(CoinPayments):
+    """
+    Coinpayments API handler class for asyncio
+
+    Has the same methods as `CoinPayments`, but they return coroutines:
+
+        client = AsyncCoinPayments(public_key, private_key)
+        rates = await client.rates()
+
+    Takes the same arguments as `CoinPayments`; the transport defaults to an
+    `AsyncConnectionPool`.  Besides the per command timeouts, a single call
+    can be given its own deadline or cancelled with the usual asyncio tools,
+    e.g. `await asyncio.wait_for(client.balances(), 2)`.
+    """
+    # asyncio timeouts and incomplete reads may be retried as well
+    transport_errors = ASYNC_TRANSPORT_ERRORS
+
+    def __init__(
+            self,
+            public_key: str,
+            private_key: str,
+            ipn_url: str = "",
+            transport: AsyncConnectionPool = None,
+            cache: ResponseCache = None,
+            coalesce: bool = False,
+            rate_limiter: RateLimiter = None,
+            timeout=DEFAULT_TIMEOUT,
+            timeouts: dict = None,
+            retry: RetryPolicy = None,
+            circuit_breaker: CircuitBreaker = None,
+            decoder=None,
+            store: FinalResultStore = None,
+            acquire_timeout: float = None,
+    ):
+        """
+        Initialize!
+        """
+        if transport is None:
+            transport = AsyncConnectionPool()
+        super().__init__(
+            public_key,
+            private_key,
+            ipn_url=ipn_url,
+            transport=transport,
+            cache=cache,
+            coalesce=coalesce,
+            rate_limiter=rate_limiter,
+            timeout=timeout,
+            timeouts=timeouts,
+            retry=retry,
+            circuit_breaker=circuit_breaker,
+            decoder=decoder,
+            store=store,
+            acquire_timeout=acquire_timeout,
+        )
+
+    @staticmethod
+    def _make_single_flight():
+        """
+        Get the coalescer for identical in-flight requests
+        """
+        return AsyncSingleFlight()
+
+    async def _send(self, request_method: str, params: dict,
+                    spec: CommandSpec = None):
+        """
+        Send a request and parse its response, timing it for the listeners
+        """
+        if not self.listeners:
+            return await self._perform(request_method, params, spec=spec)
+        event, start = self._start_event(params, spec)
+        try:
+            response = await self._perform(
+                request_method, params, event, spec)
+        except BaseException as exception:
+            self._end_event(event, start, error=exception)
+            raise
+        self._end_event(event, start, response)
+        return response
+
+    async def _perform(
+            self,
+            request_method: str,
+            params: dict,
+            event: RequestEvent = None,
+            spec: CommandSpec = None,
+    ):
+        """
+        Send a request and parse its response
+
+        Idempotent commands are retried on transport errors, timeouts and
+        5xx responses according to the retry policy.  With an `event` the
+        phases of the request are timed into it.
+        """
+        attempts = self._attempts(request_method, params, event, spec)
+        while True:
+            attempts.begin()
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async(
+                    self.public_key, attempts.cmd,
+                    timeout=self.acquire_timeout)
+            attempts.ready()
+            try:
+                status, response_body = await self.transport.request(
+                    attempts.method, self.url, body=attempts.body,
+                    headers=attempts.headers, timeout=attempts.timeout,
+                    **attempts.extra)
+            except BaseException as exception:
+                delay = attempts.failed(exception)
+                if delay is None:
+                    raise
+            else:
+                delay = attempts.received(status, response_body)
+                if delay is None:
+                    return attempts.decode(response_body)
+            await asyncio.sleep(delay)
+
+    async def request(self, request_method: str, spec: CommandSpec = None,
+                      **params):
+        """
+        The basic request that all API calls use
+
+        `params` are all params of the request, including key and cmd, or
+        with the precompiled `spec` of a command only the caller's own.
+        """
+        params = self._full_params(params, spec)
+        store = self.store
+        if not self._stores(params):
+            return await self._fetch(request_method, params, spec)
+        # SQLite blocks, so the store is queried in the default executor
+        loop = get_running_loop()
+        hits, missing = await loop.run_in_executor(
+            None, store.lookup, params)
+        response = None
+        if missing is not None:
+            response = await self._fetch(request_method, missing, spec)
+        return await loop.run_in_executor(
+            None, store.respond, params, hits, response)
+
+    async def _fetch(self, request_method: str, params: dict,
+                     spec: CommandSpec = None):
+        """
+        Get the response to params from the cache or the API
+        """
+        cmd = self._cmd(params, spec)
+        hit, response = self._cache_get(cmd, params)
+        if hit:
+            return response
+        if self._coalesces(cmd):
+            response = await self._in_flight.do(
+                request_key(params), self._send, request_method, params,
+                spec)
+        else:
+            response = await self._send(request_method, params, spec)
+        self._cache_set(cmd, params, response)
+        return response
+
+    async def _get_tx_info_chunk(self, txids: list):
+        """
+        Look up one chunk of a bulk transaction info lookup
+        """
+        try:
+            response = await self.get_tx_info_multi({"txid": "|".join(txids)})
+        except asyncio.CancelledError:
+            raise
+        except Exception as exception:  # pylint: disable=broad-except
+            return TxInfoChunk(txids, None, exception)
+        return make_tx_info_chunk(txids, response)
+
+    async def iter_tx_info_bulk(
+            self,
+            txids,
+            max_workers: int = 4,
+            chunk_size: int = TX_INFO_MULTI_LIMIT,
+    ):
+        """
+        Get transaction information for any number of transaction IDs
+
+        An async generator yielding a `TxInfoChunk` per chunk as it
+        finishes, with at most `max_workers` chunks in flight.
+        """
+        chunks = chunked(txids, chunk_size)
+        pending = {
+            asyncio.ensure_future(self._get_tx_info_chunk(chunk))
+            for chunk in itertools.islice(chunks, max_workers)
+        }
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for chunk in itertools.islice(chunks, 1):
+                        pending.add(asyncio.ensure_future(
+                            self._get_tx_info_chunk(chunk)))
+                    yield task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def get_tx_info_bulk(
+            self,
+            txids,
+            max_workers: int = 4,
+            chunk_size: int = TX_INFO_MULTI_LIMIT,
+    ):
+        """
+        Get transaction information for any number of transaction IDs
+
+        Returns a tuple of:
+            - dict of transaction ID to transaction info
+            - list of the `TxInfoChunk`s that failed
+        """
+        chunks = []
+        async for chunk in self.iter_tx_info_bulk(
+                txids, max_workers=max_workers, chunk_size=chunk_size):
+            chunks.append(chunk)
+        return merge_tx_info_chunks(chunks)
+
+    def iter_tx_list(
+            self,
+            params: dict = None,
+            page_size: int = MAX_PAGE_SIZE,
+            prefetch: bool = True,
+    ):
+        """
+        Async iterator over the IDs of all transactions, page by page
+        """
+        return aiter_pages(
+            self.get_tx_list, params, page_size=page_size, prefetch=prefetch)
+
+    def iter_withdrawal_history(
+            self,
+            params: dict = None,
+            page_size: int = MAX_PAGE_SIZE,
+            prefetch: bool = True,
+    ):
+        """
+        Async iterator over all withdrawals, page by page
+        """
+        return aiter_pages(
+            self.get_withdrawal_history, params, page_size=page_size,
+            prefetch=prefetch)
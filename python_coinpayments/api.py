@@ -2,21 +2,35 @@
 """
 Coinpayments module
 """
-import hashlib
-import hmac
-import json
-import urllib.error
-import urllib.parse
-import urllib.request
-
-
-def calculate_hmac(secret: str, **params):
-    """
-    Calculate the HMAC based on the secret and url encoded params
-    """
-    encoded = urllib.parse.urlencode(params).encode("utf-8")
-    return hmac.new(bytearray(secret, "utf-8"), encoded,
-                    hashlib.sha512).hexdigest()
+import concurrent.futures
+import itertools
+import time
+
+from python_coinpayments.bulk import (
+    TX_INFO_MULTI_LIMIT, TxInfoChunk, chunked, make_tx_info_chunk,
+    merge_tx_info_chunks,
+)
+from python_coinpayments.cache import ResponseCache
+from python_coinpayments.commands import (
+    IPN_COMMANDS, READ_ONLY_COMMANDS, CommandSpec, request_key,
+)
+from python_coinpayments.decoders import stdlib_decoder
+from python_coinpayments.instrumentation import (
+    RequestEvent, add_time, finish_event,
+)
+from python_coinpayments.ipn import IPNVerifier
+from python_coinpayments.pagination import MAX_PAGE_SIZE, iter_pages
+from python_coinpayments.ratelimit import RateLimiter
+from python_coinpayments.resilience import (
+    DEFAULT_TIMEOUT, TRANSPORT_ERRORS, CircuitBreaker, RetryPolicy,
+)
+# calculate_hmac is imported here for backwards compatibility
+from python_coinpayments.signing import (  # noqa pylint: disable=unused-import
+    Signer, calculate_hmac, encode_params,
+)
+from python_coinpayments.singleflight import SingleFlight
+from python_coinpayments.store import FinalResultStore
+from python_coinpayments.transport import ConnectionPool
 
 
 def authenticate_ipn_request(
@@ -29,44 +43,200 @@ def authenticate_ipn_request(
     """
     Authenticates the IPN request
 
+    To authenticate many IPNs with the same secret, create an `IPNVerifier`
+    once and reuse it instead.
+
     Returns a tuple of:
         - bool indicating if authenticated or not
         - error message, if any
     """
-    params = http_post
-    received_ipn_mode = params.get("ipn_mode")
-    merchant = params.get("merchant")
-    http_hmac = http_headers.get("HTTP_HMAC")
-    hashed = calculate_hmac(secret=secret, **params)
-
-    if merchant is None:
-        result = False, "No merchant ID"
-    elif merchant != merchant_id:
-        result = False, "Invalid merchant ID"
-    elif received_ipn_mode is None:
-        result = False, "No ipn_mode"
-    elif received_ipn_mode != ipn_mode:
-        result = False, "Invalid ipn_mode"
-    elif http_hmac is None:
-        result = False, "No HTTP HMAC"
-    elif http_hmac != hashed:
-        result = False, "Invalid HTTP HMAC"
-    else:
-        result = True, None
-
-    return result
+    verifier = IPNVerifier(
+        secret=secret, merchant_id=merchant_id, ipn_mode=ipn_mode)
+    return verifier.verify(http_headers, http_post)
+
+
+def _spec_setting(name: str):
+    """
+    A client setting that the precompiled command specs depend on
+    """
+    attr = "_" + name
+
+    def fget(self):
+        return getattr(self, attr)
+
+    def fset(self, value):
+        setattr(self, attr, value)
+        self._specs = {}
+
+    return property(fget, fset)
+
+
+class _Attempts:
+    """
+    The bookkeeping of sending one request until it is done: timing the
+    phases, the circuit breaker and retry decisions
+
+    Clients drive it around their own (blocking or awaited) rate limiting,
+    transport calls and sleeps.
+    """
+
+    def __init__(self, client, cmd: str, request: tuple,
+                 event: RequestEvent = None):
+        """
+        Initialize!
+
+        `request` is the (HTTP method, body, headers) of the request.
+        """
+        self.cmd = cmd
+        self.method, self.body, self.headers = request
+        self.timeout = client.timeouts.get(self.cmd, client.timeout)
+        self.extra = {}
+        self.event = event
+        self.timings = None
+        if event is not None:
+            self.timings = event.timings
+            if getattr(client.transport, "supports_timings", False):
+                self.extra["timings"] = self.timings
+        self.attempt = 0
+        self.start = None
+        self.breaker = client.circuit_breaker
+        self.retry = client.retry
+        self.transport_errors = client.transport_errors
+        self.decoder = client.decoder
+
+    def begin(self):
+        """
+        Start an attempt, before waiting for the rate limiter
+        """
+        if self.timings is not None:
+            self.start = time.perf_counter()
+            self.event.attempts = self.attempt + 1
+
+    def ready(self):
+        """
+        Check the circuit breaker before sending an attempt
+        """
+        if self.breaker is not None:
+            self.breaker.before_call()
+        if self.timings is not None:
+            self.start = add_time(self.timings, "queue", self.start)
+
+    def _retry(self):
+        delay = self.retry.delay(self.cmd, self.attempt)
+        if delay is not None:
+            self.attempt += 1
+        return delay
+
+    def failed(self, exception: BaseException):
+        """
+        Record an attempt that raised exception
+
+        Returns the seconds to wait before the next attempt, or None if the
+        exception should be raised.
+        """
+        if not isinstance(exception, self.transport_errors):
+            if self.breaker is not None:
+                self.breaker.record_abandoned()
+            return None
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        return self._retry()
+
+    def received(self, status: int, body: bytes):
+        """
+        Record the response to an attempt
+
+        Returns the seconds to wait before the next attempt, or None if
+        body is the response.
+        """
+        if self.timings is not None:
+            if not self.extra:
+                add_time(self.timings, "wait", self.start)
+            self.event.status = status
+            self.event.response_size = len(body)
+        if status < 500:
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return None
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        return self._retry()
+
+    def decode(self, body: bytes):
+        """
+        Parse the response body
+        """
+        # error responses carry a JSON body too, so the status is not checked
+        if self.timings is None:
+            return self.decoder(body)
+        start = time.perf_counter()
+        response = self.decoder(body)
+        add_time(self.timings, "decode", start)
+        return response
 
 
 class CoinPayments:
     """
     Coinpayments API handler class
 
+    A client is thread-safe: one client, with its connection pool, cache
+    and other helpers, can be shared by any number of threads.  The params
+    dicts passed to API methods are never modified.
+
     https://www.coinpayments.net/
     """
-
-    def __init__(self, public_key: str, private_key: str, ipn_url: str = ""):
+    public_key = _spec_setting("public_key")
+    ipn_url = _spec_setting("ipn_url")
+    version = _spec_setting("version")
+    format = _spec_setting("format")
+
+    # transport errors after which a request may be retried
+    transport_errors = TRANSPORT_ERRORS
+
+    def __init__(
+            self,
+            public_key: str,
+            private_key: str,
+            ipn_url: str = "",
+            transport: ConnectionPool = None,
+            cache: ResponseCache = None,
+            coalesce: bool = False,
+            rate_limiter: RateLimiter = None,
+            timeout=DEFAULT_TIMEOUT,
+            timeouts: dict = None,
+            retry: RetryPolicy = None,
+            circuit_breaker: CircuitBreaker = None,
+            decoder=None,
+            store: FinalResultStore = None,
+            acquire_timeout: float = None,
+    ):
         """
         Initialize!
+
+        Optional arguments:
+            - transport: sends the HTTP requests, defaults to a thread-safe
+              pool of keep-alive connections
+            - cache: a `ResponseCache` for slowly changing read-only commands
+              such as rates
+            - coalesce: whether identical read-only calls made concurrently
+              share one HTTP request and its (shared) parsed response
+            - rate_limiter: a `RateLimiter` that throttles and prioritises
+              outgoing calls
+            - timeout: seconds to wait for the API, either one number or a
+              (connect, read) tuple
+            - timeouts: per command timeouts overriding `timeout`
+            - retry: a `RetryPolicy` for idempotent commands, defaults to
+              retrying read-only commands up to 3 times
+            - circuit_breaker: a `CircuitBreaker` that makes calls fail fast
+              while the API is unhealthy
+            - decoder: decodes response bodies, defaults to the stdlib json
+              module; see `decoders.get_decoder` for faster and exact
+              (Decimal) decoders
+            - store: a `FinalResultStore` that keeps transaction, withdrawal
+              and conversion results once they are final, and answers
+              lookups of them without calling the API
+            - acquire_timeout: seconds a call may wait for the rate limiter
+              before it raises `RateLimitTimeout`, by default no limit
         """
         self.url = "https://www.coinpayments.net/api.php"
         self.public_key = public_key
@@ -74,21 +244,38 @@ class CoinPayments:
         self.ipn_url = ipn_url
         self.format = "json"
         self.version = 1
-
-    def _package_params(self, params: dict = None):
-        """
-        Helper to package params (for DRYness)
-        """
-        if params is None:
-            params = {}
-
-        params.update({
-            "key": self.public_key,
-            "version": self.version,
-            "format": self.format
-        })
-
-        return params
+        if transport is None:
+            transport = ConnectionPool()
+        self.transport = transport
+        self.cache = cache
+        self.coalesce = coalesce
+        self.rate_limiter = rate_limiter
+        self.acquire_timeout = acquire_timeout
+        self.timeout = timeout
+        self.timeouts = dict(timeouts or {})
+        if retry is None:
+            retry = RetryPolicy()
+        self.retry = retry
+        self.circuit_breaker = circuit_breaker
+        if decoder is None:
+            decoder = stdlib_decoder
+        self.decoder = decoder
+        self.store = store
+        self.listeners = []
+        self._in_flight = self._make_single_flight()
+
+    @property
+    def private_key(self):
+        """
+        The private key used to sign requests
+        """
+        return self._private_key
+
+    @private_key.setter
+    def private_key(self, value: str):
+        self._private_key = value
+        self._signer = Signer(value)
+        self._specs = {}
 
     def create_hmac(self, **params):
         """
@@ -96,101 +283,330 @@ class CoinPayments:
         We generate the encoded url here and return it to request because
         the hmac on both sides depends upon the order of the parameters, any
         change in the order and the hmacs wouldn't match
+
+        The params are encoded once and the HMAC is calculated over those
+        same bytes.
         """
-        encoded = urllib.parse.urlencode(params).encode("utf-8")
-        return encoded, calculate_hmac(secret=self.private_key, **params)
+        return self._signer.sign_params(params)
 
-    def request(self, request_method: str, **params):
+    def _spec(self, cmd: str):
         """
-        The basic request that all API calls use
-        the parameters are joined in the actual api methods so the parameter
-        strings can be passed and merged inside those methods instead of the
-        request method
+        Get the precompiled spec of a command
+        """
+        spec = self._specs.get(cmd)
+        if spec is None:
+            constants = {
+                "version": self.version,
+                "key": self.public_key,
+                "cmd": cmd,
+                "format": self.format,
+            }
+            if self.ipn_url and cmd in IPN_COMMANDS:
+                constants["ipn_url"] = self.ipn_url
+            spec = self._specs[cmd] = CommandSpec(
+                cmd, constants, self._signer)
+        return spec
+
+    def _prepare_request(
+            self,
+            request_method: str,
+            params: dict,
+            event: RequestEvent = None,
+            spec: CommandSpec = None,
+    ):
         """
-        encoded, sig = self.create_hmac(**params)
+        Sign params and build the HTTP request for them
+
+        With a `spec`, params are only the caller's fields of its command.
+
+        Returns a tuple of (HTTP method, body, headers)
+        """
+        if spec is None:
+            encode, sign = encode_params, self._signer.sign
+        else:
+            encode, sign = spec.encode, spec.sign
+        if event is None:
+            encoded = encode(params)
+            sig = sign(encoded)
+        else:
+            start = time.perf_counter()
+            encoded = encode(params)
+            start = add_time(event.timings, "package", start)
+            sig = sign(encoded)
+            add_time(event.timings, "sign", start)
+            event.request_size = len(encoded)
 
         headers = {"Hmac": sig}
 
         if request_method == "get":
-            req = urllib.request.Request(self.url, headers=headers)
-        elif request_method == "post":
+            return "GET", None, headers
+        if request_method == "post":
             headers["Content-type"] = "application/x-www-form-urlencoded"
-            req = urllib.request.Request(
-                self.url, data=encoded, headers=headers)
+            return "POST", encoded, headers
+        raise ValueError("Unsupported request method: {}".format(
+            request_method))
+
+    @staticmethod
+    def _make_single_flight():
+        """
+        Get the coalescer for identical in-flight requests
+        """
+        return SingleFlight()
+
+    def add_listener(self, listener):
+        """
+        Call listener with a `RequestEvent` after each request sent
+
+        Exceptions raised by listeners are ignored.
+        """
+        # replaced rather than appended to, so requests in flight can
+        # iterate over the old list safely
+        self.listeners = self.listeners + [listener]
+
+    def remove_listener(self, listener):
+        """
+        Stop calling listener
+        """
+        self.listeners = [
+            other for other in self.listeners if other != listener]
+
+    def _notify(self, event: RequestEvent):
+        """
+        Pass a finished event to the listeners
+        """
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+    @staticmethod
+    def _cmd(params: dict, spec: CommandSpec = None):
+        """
+        Get the command of a request
+        """
+        return params.get("cmd") if spec is None else spec.cmd
+
+    def _start_event(self, params: dict, spec: CommandSpec = None):
+        """
+        Start timing a request for the listeners
+
+        Returns a tuple of (RequestEvent, perf_counter value at the start)
+        """
+        return RequestEvent(self._cmd(params, spec)), time.perf_counter()
+
+    def _end_event(self, event: RequestEvent, start: float, response=None,
+                   error: BaseException = None):
+        """
+        Finish the event of a request and pass it to the listeners
+        """
+        finish_event(event, start, response, error)
+        self._notify(event)
+
+    def _send(self, request_method: str, params: dict,
+              spec: CommandSpec = None):
+        """
+        Send a request and parse its response, timing it for the listeners
+        """
+        if not self.listeners:
+            return self._perform(request_method, params, spec=spec)
+        event, start = self._start_event(params, spec)
         try:
-            response = urllib.request.urlopen(req)
-        except urllib.error.HTTPError as exception:
-            response_body = exception.read()
-        else:
-            response_body = response.read()
+            response = self._perform(request_method, params, event, spec)
+        except BaseException as exception:
+            self._end_event(event, start, error=exception)
+            raise
+        self._end_event(event, start, response)
+        return response
+
+    def _attempts(
+            self,
+            request_method: str,
+            params: dict,
+            event: RequestEvent = None,
+            spec: CommandSpec = None,
+    ):
+        """
+        Prepare a request for sending, as often as the retry policy allows
+        """
+        return _Attempts(
+            self, self._cmd(params, spec),
+            self._prepare_request(request_method, params, event, spec),
+            event)
+
+    def _perform(
+            self,
+            request_method: str,
+            params: dict,
+            event: RequestEvent = None,
+            spec: CommandSpec = None,
+    ):
+        """
+        Send a request and parse its response
+
+        Idempotent commands are retried on transport errors and 5xx
+        responses according to the retry policy.  With an `event` the
+        phases of the request are timed into it.
+        """
+        attempts = self._attempts(request_method, params, event, spec)
+        while True:
+            attempts.begin()
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(
+                    self.public_key, attempts.cmd,
+                    timeout=self.acquire_timeout)
+            attempts.ready()
+            try:
+                status, response_body = self.transport.request(
+                    attempts.method, self.url, body=attempts.body,
+                    headers=attempts.headers, timeout=attempts.timeout,
+                    **attempts.extra)
+            except BaseException as exception:
+                delay = attempts.failed(exception)
+                if delay is None:
+                    raise
+            else:
+                delay = attempts.received(status, response_body)
+                if delay is None:
+                    return attempts.decode(response_body)
+            time.sleep(delay)
+
+    def _command(self, cmd: str, params: dict = None):
+        """
+        Call a command with the caller's params
+
+        Raises InvalidParamsError if a required param is missing.  The
+        request is built from the command's precompiled spec.
+        """
+        spec = self._spec(cmd)
+        if params is None:
+            params = {}
+        spec.check(params)
+        return self.request("post", spec=spec, **params)
 
-        return json.loads(response_body)
+    def _full_params(self, params: dict, spec: CommandSpec = None):
+        """
+        Get all params of a request if the cache, coalescing or the store
+        need them
 
-    def create_transaction(self, params: dict = None):
+        They key on the full params, so with a `spec` its constant fields
+        are added in; the spec leaves them out again when encoding.
         """
-        Creates a transaction to give to the purchaser
-        https://www.coinpayments.net/apidoc-create-transaction
+        if spec is None or (
+                self.cache is None and self.store is None
+                and not self.coalesce):
+            return params
+        return spec.params(params)
+
+    def _stores(self, params: dict):
+        """
+        Whether the response to params goes through the store
+        """
+        return self.store is not None and self.store.stores(params)
+
+    def _cache_get(self, cmd: str, params: dict):
+        """
+        Look up the cached response to params
+
+        Returns a tuple of:
+            - bool indicating if it was found
+            - the response, if found
+        """
+        if self.cache is None or not self.cache.caches(cmd):
+            return False, None
+        return self.cache.get(params)
+
+    def _cache_set(self, cmd: str, params: dict, response: dict):
+        """
+        Cache a successful response to params, if cmd is cached
+        """
+        if (self.cache is not None and self.cache.caches(cmd)
+                and response.get("error") == "ok"):
+            self.cache.set(params, response)
+
+    def _coalesces(self, cmd: str):
+        """
+        Whether identical in-flight calls of cmd share one request
         """
-        params = self._package_params(params)
+        return self.coalesce and cmd in READ_ONLY_COMMANDS
 
-        if self.ipn_url:
-            params.update({"ipn_url": self.ipn_url})
+    def request(self, request_method: str, spec: CommandSpec = None,
+                **params):
+        """
+        The basic request that all API calls use
 
-        params.update({"cmd": "create_transaction"})
+        `params` are all params of the request, including key and cmd, or
+        with the precompiled `spec` of a command only the caller's own.
+        """
+        params = self._full_params(params, spec)
+        store = self.store
+        if not self._stores(params):
+            return self._fetch(request_method, params, spec)
+        hits, missing = store.lookup(params)
+        response = None
+        if missing is not None:
+            response = self._fetch(request_method, missing, spec)
+        return store.respond(params, hits, response)
+
+    def _fetch(self, request_method: str, params: dict,
+               spec: CommandSpec = None):
+        """
+        Get the response to params from the cache or the API
+        """
+        cmd = self._cmd(params, spec)
+        hit, response = self._cache_get(cmd, params)
+        if hit:
+            return response
+        if self._coalesces(cmd):
+            response = self._in_flight.do(
+                request_key(params), self._send, request_method, params,
+                spec)
+        else:
+            response = self._send(request_method, params, spec)
+        self._cache_set(cmd, params, response)
+        return response
 
-        return self.request("post", **params)
+    def create_transaction(self, params: dict = None):
+        """
+        Creates a transaction to give to the purchaser
+        https://www.coinpayments.net/apidoc-create-transaction
+        """
+        return self._command("create_transaction", params)
 
     def get_basic_info(self, params: dict = None):
         """
         Gets merchant info based on API key (callee)
         https://www.coinpayments.net/apidoc-get-basic-info
         """
-        params = self._package_params(params)
-        params.update({"cmd": "get_basic_info"})
-
-        return self.request("post", **params)
+        return self._command("get_basic_info", params)
 
     def rates(self, params: dict = None):
         """
         Gets current rates for currencies
         https://www.coinpayments.net/apidoc-rates
         """
-        params = self._package_params(params)
-        params.update({"cmd": "rates"})
-
-        return self.request("post", **params)
+        return self._command("rates", params)
 
     def balances(self, params: dict = None):
         """
         Get current wallet balances
         https://www.coinpayments.net/apidoc-balances
         """
-        params = self._package_params(params)
-        params.update({"cmd": "balances"})
-
-        return self.request("post", **params)
+        return self._command("balances", params)
 
     def get_deposit_address(self, params: dict = None):
         """
         Get address for personal deposit use
         https://www.coinpayments.net/apidoc-get-deposit-address
         """
-        params = self._package_params(params)
-        params.update({"cmd": "get_deposit_address"})
-
-        return self.request("post", **params)
+        return self._command("get_deposit_address", params)
 
     def get_callback_address(self, params: dict = None):
         """
         Get a callback address to recieve info about address status
         https://www.coinpayments.net/apidoc-get-callback-address
         """
-        params = self._package_params(params)
-        if self.ipn_url:
-            params.update({"ipn_url": self.ipn_url})
-        params.update({"cmd": "get_callback_address"})
-
-        return self.request("post", **params)
+        return self._command("get_callback_address", params)
 
     def create_transfer(self, params: dict = None):
         """
@@ -199,10 +615,7 @@ class CoinPayments:
         merchant ID
         https://www.coinpayments.net/apidoc-create-transfer
         """
-        params = self._package_params(params)
-        params.update({"cmd": "create_transfer"})
-
-        return self.request("post", **params)
+        return self._command("create_transfer", params)
 
     def create_withdrawal(self, params: dict = None):
         """
@@ -210,60 +623,51 @@ class CoinPayments:
         optionally set a IPN when complete.
         https://www.coinpayments.net/apidoc-create-withdrawal
         """
-        params = self._package_params(params)
-        params.update({"cmd": "create_withdrawal"})
+        return self._command("create_withdrawal", params)
 
-        return self.request("post", **params)
+    def create_mass_withdrawal(self, params: dict = None):
+        """
+        Withdraw coins to many addresses in one call
+        Each withdrawal is given as wd[wdN][param] params, see
+        `payouts.encode_mass_withdrawal`
+        https://www.coinpayments.net/apidoc-create-mass-withdrawal
+        """
+        return self._command("create_mass_withdrawal", params)
 
     def convert_coins(self, params: dict = None):
         """
         Convert your balances from one currency to another
         https://www.coinpayments.net/apidoc-convert
         """
-        params = self._package_params(params)
-        params.update({"cmd": "convert"})
-
-        return self.request("post", **params)
+        return self._command("convert", params)
 
     def get_conversion_limits(self, params: dict = None):
         """
         Get Conversion Limits
         https://www.coinpayments.net/apidoc-convert-limits
         """
-        params = self._package_params(params)
-        params.update({"cmd": "convert_limits"})
-
-        return self.request("post", **params)
+        return self._command("convert_limits", params)
 
     def get_withdrawal_history(self, params: dict = None):
         """
         Get list of recent withdrawals (1-100max)
         https://www.coinpayments.net/apidoc-get-withdrawal-history
         """
-        params = self._package_params(params)
-        params.update({"cmd": "get_withdrawal_history"})
-
-        return self.request("post", **params)
+        return self._command("get_withdrawal_history", params)
 
     def get_withdrawal_info(self, params: dict = None):
         """
         Get information about a specific withdrawal based on withdrawal ID
         https://www.coinpayments.net/apidoc-get-withdrawal-info
         """
-        params = self._package_params(params)
-        params.update({"cmd": "get_withdrawal_info"})
-
-        return self.request("post", **params)
+        return self._command("get_withdrawal_info", params)
 
     def get_conversion_info(self, params: dict = None):
         """
         Get information about a specific conversion based on conversion ID
         https://www.coinpayments.net/apidoc-get-conversion-info
         """
-        params = self._package_params(params)
-        params.update({"cmd": "get_conversion_info"})
-
-        return self.request("post", **params)
+        return self._command("get_conversion_info", params)
 
     def get_tx_info(self, params: dict = None):
         """
@@ -274,10 +678,7 @@ class CoinPayments:
         CoinPayments servers.
         https://www.coinpayments.net/apidoc-get-tx-info
         """
-        params = self._package_params(params)
-        params.update({"cmd": "get_tx_info"})
-
-        return self.request("post", **params)
+        return self._command("get_tx_info", params)
 
     def get_tx_info_multi(self, params: dict = None):
         """
@@ -292,17 +693,99 @@ class CoinPayments:
         CoinPayments servers.
         https://www.coinpayments.net/apidoc-get-tx-info
         """
-        params = self._package_params(params)
-        params.update({"cmd": "get_tx_info_multi"})
+        return self._command("get_tx_info_multi", params)
 
-        return self.request("post", **params)
+    def _get_tx_info_chunk(self, txids: list):
+        """
+        Look up one chunk of a bulk transaction info lookup
+        """
+        try:
+            response = self.get_tx_info_multi({"txid": "|".join(txids)})
+        except Exception as exception:  # pylint: disable=broad-except
+            return TxInfoChunk(txids, None, exception)
+        return make_tx_info_chunk(txids, response)
+
+    def iter_tx_info_bulk(
+            self,
+            txids,
+            max_workers: int = 4,
+            chunk_size: int = TX_INFO_MULTI_LIMIT,
+    ):
+        """
+        Get transaction information for any number of transaction IDs
+
+        `txids` can be any iterable.  It is split into get_tx_info_multi
+        sized chunks which are looked up on at most `max_workers` threads.
+        Yields a `TxInfoChunk` for each chunk as soon as it finishes; a
+        failed chunk is yielded with its error and does not stop the others.
+        """
+        chunks = chunked(txids, chunk_size)
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            pending = {
+                executor.submit(self._get_tx_info_chunk, chunk)
+                for chunk in itertools.islice(chunks, max_workers)
+            }
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    for chunk in itertools.islice(chunks, 1):
+                        pending.add(
+                            executor.submit(self._get_tx_info_chunk, chunk))
+                    yield future.result()
+
+    def get_tx_info_bulk(
+            self,
+            txids,
+            max_workers: int = 4,
+            chunk_size: int = TX_INFO_MULTI_LIMIT,
+    ):
+        """
+        Get transaction information for any number of transaction IDs
+
+        Returns a tuple of:
+            - dict of transaction ID to transaction info
+            - list of the `TxInfoChunk`s that failed
+        """
+        return merge_tx_info_chunks(self.iter_tx_info_bulk(
+            txids, max_workers=max_workers, chunk_size=chunk_size))
 
     def get_tx_list(self, params: dict = None):
         """
         Get Transaction IDs
         https://www.coinpayments.net/apidoc-get-tx-ids
         """
-        params = self._package_params(params)
-        params.update({"cmd": "get_tx_ids"})
+        return self._command("get_tx_ids", params)
+
+    def iter_tx_list(
+            self,
+            params: dict = None,
+            page_size: int = MAX_PAGE_SIZE,
+            prefetch: bool = True,
+    ):
+        """
+        Iterate over the IDs of all transactions, page by page
+
+        Pages are fetched with get_tx_list as the IDs are consumed, with the
+        next page fetched in the background unless `prefetch` is False.
+        `params` can hold any other get_tx_list param, e.g. `newer`.
+        """
+        return iter_pages(
+            self.get_tx_list, params, page_size=page_size, prefetch=prefetch)
+
+    def iter_withdrawal_history(
+            self,
+            params: dict = None,
+            page_size: int = MAX_PAGE_SIZE,
+            prefetch: bool = True,
+    ):
+        """
+        Iterate over all withdrawals, page by page
 
-        return self.request("post", **params)
+        Pages are fetched with get_withdrawal_history as the withdrawals are
+        consumed, with the next page fetched in the background unless
+        `prefetch` is False.
+        """
+        return iter_pages(
+            self.get_withdrawal_history, params, page_size=page_size,
+            prefetch=prefetch)
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Concurrent batches of unrelated API calls
+"""
+import asyncio
+import collections
+import concurrent.futures
+
+from python_coinpayments.commands import API_METHODS
+from python_coinpayments.exceptions import CoinPaymentsError
+
+BatchResult = collections.namedtuple(
+    "BatchResult", "index method params response error")
+BatchResult.__doc__ = """
+The outcome of one job of a batch
+
+`index` is the job's position in the batch and `response` the decoded API
+response, if any.  `error` is the exception the call raised, or a
+CoinPaymentsError if the API answered with an error.
+"""
+
+
+class BatchExecutor:
+    """
+    Runs API calls on a bounded pool of threads sharing one client
+
+    Jobs are (API method name, params) tuples, e.g. ("get_withdrawal_info",
+    {"id": ...}); only the methods that send one command are allowed.  The
+    calls share the client's connection pool, cache, rate limiter and
+    circuit breaker; by default there is one thread per connection the
+    transport keeps alive.  Errors never escape a batch: each job gets a
+    `BatchResult` with its response or error.
+
+    Use as a context manager, or call `shutdown` when done.  For
+    `AsyncCoinPayments`, gather the coroutines with asyncio instead.
+    """
+
+    def __init__(self, client, max_workers: int = None):
+        """
+        Initialize!
+        """
+        if asyncio.iscoroutinefunction(client.request):
+            raise TypeError("Use asyncio.gather to batch asyncio calls")
+        if max_workers is None:
+            max_workers = getattr(client.transport, "maxsize", 8)
+        self.client = client
+        self.max_workers = max_workers
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="coinpayments-batch")
+
+    def _method(self, method: str):
+        """
+        Get an API method of the client by name
+        """
+        if method not in API_METHODS:
+            raise ValueError("Unknown API method: {}".format(method))
+        return getattr(self.client, method)
+
+    @staticmethod
+    def _call(index: int, func, method: str, params: dict):
+        try:
+            response = func(params)
+        except Exception as exception:  # pylint: disable=broad-except
+            return BatchResult(index, method, params, None, exception)
+        error = None
+        if isinstance(response, dict) and response.get("error") != "ok":
+            error = CoinPaymentsError(response.get("error"))
+        return BatchResult(index, method, params, response, error)
+
+    def submit(self, method: str, params: dict = None, index: int = 0):
+        """
+        Start one call
+
+        Returns a future of its BatchResult.  Raises ValueError for unknown
+        methods.
+        """
+        return self._executor.submit(
+            self._call, index, self._method(method), method, params)
+
+    def submit_all(self, jobs):
+        """
+        Start every job of a batch
+
+        All jobs are checked before any is started.  Returns the list of
+        futures of their BatchResults, in job order.
+        """
+        calls = [
+            (self._method(method), method, params) for method, params in jobs]
+        return [
+            self._executor.submit(self._call, index, func, method, params)
+            for index, (func, method, params) in enumerate(calls)
+        ]
+
+    def as_completed(self, jobs):
+        """
+        Run a batch, yielding each BatchResult as soon as its call completes
+        """
+        for future in concurrent.futures.as_completed(self.submit_all(jobs)):
+            yield future.result()
+
+    def run(self, jobs):
+        """
+        Run a batch and get its BatchResults, in job order
+        """
+        return [future.result() for future in self.submit_all(jobs)]
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the threads once the calls started so far are done
+        """
+        self._executor.shutdown(wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
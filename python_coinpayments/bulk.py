@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Helpers for splitting bulk lookups into API sized requests
+"""
+import collections
+import itertools
+
+from python_coinpayments.exceptions import CoinPaymentsError
+
+# the most transaction IDs get_tx_info_multi accepts in one call
+TX_INFO_MULTI_LIMIT = 25
+
+TxInfoChunk = collections.namedtuple("TxInfoChunk", "txids result error")
+TxInfoChunk.__doc__ = """
+The outcome of one get_tx_info_multi call made for a bulk lookup
+
+`result` maps each transaction ID to its info and is None when the call
+failed, in which case `error` holds the exception.
+"""
+
+
+def chunked(iterable, size: int):
+    """
+    Split iterable into lists of at most size items
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def make_tx_info_chunk(txids: list, response: dict):
+    """
+    Turn a get_tx_info_multi response into a TxInfoChunk
+    """
+    if response.get("error") != "ok":
+        return TxInfoChunk(
+            txids, None, CoinPaymentsError(response.get("error")))
+    return TxInfoChunk(txids, response.get("result", {}), None)
+
+
+def merge_tx_info_chunks(chunks):
+    """
+    Merge TxInfoChunks into one mapping
+
+    Returns a tuple of:
+        - dict of transaction ID to transaction info
+        - list of the TxInfoChunks that failed
+    """
+    results = {}
+    failures = []
+    for chunk in chunks:
+        if chunk.error is not None:
+            failures.append(chunk)
+        else:
+            results.update(chunk.result)
+    return results, failures
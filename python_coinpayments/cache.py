@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Response caching for slowly changing API data
+"""
+import collections
+import threading
+import time
+
+from python_coinpayments.commands import READ_ONLY_COMMANDS, request_key
+
+# seconds to cache each command for, by default
+DEFAULT_TTLS = {
+    "rates": 60,
+    "get_basic_info": 300,
+    "convert_limits": 300,
+}
+
+
+class ResponseCache:
+    """
+    Thread-safe TTL cache of API responses
+
+    Responses are keyed by their command and normalized params and kept for
+    the TTL configured for their command; commands without a TTL are never
+    cached.  Only read-only commands can be cached.  Once `maxsize`
+    responses are cached the least recently used one is evicted.
+
+    Cached responses are shared between callers and must not be modified.
+    """
+
+    def __init__(self, ttls: dict = None, maxsize: int = 256):
+        """
+        Initialize!
+
+        `ttls` maps commands to the number of seconds to cache them for and
+        defaults to DEFAULT_TTLS.
+        """
+        if ttls is None:
+            ttls = DEFAULT_TTLS
+        not_read_only = set(ttls) - READ_ONLY_COMMANDS
+        if not_read_only:
+            raise ValueError("Cannot cache commands: {}".format(
+                ", ".join(sorted(not_read_only))))
+        self.ttls = dict(ttls)
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def caches(self, cmd: str):
+        """
+        Whether responses to cmd are cached
+        """
+        return cmd in self.ttls
+
+    def get(self, params: dict):
+        """
+        Get the cached response for params
+
+        Returns a tuple of:
+            - bool indicating if there was a fresh cached response
+            - the response, if any
+        """
+        key = request_key(params)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, response = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return True, response
+                del self._entries[key]
+            self.misses += 1
+        return False, None
+
+    def set(self, params: dict, response: dict):
+        """
+        Cache the response for params
+        """
+        cmd = params.get("cmd")
+        if not self.caches(cmd):
+            return
+        key = request_key(params)
+        expires = time.monotonic() + self.ttls[cmd]
+        with self._lock:
+            self._entries[key] = (expires, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, cmd: str = None):
+        """
+        Drop cached responses for cmd, or every cached response
+        """
+        with self._lock:
+            if cmd is None:
+                self._entries.clear()
+                return
+            for key in [key for key in self._entries
+                        if ("cmd", cmd) in key]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Get the hit and miss counters
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
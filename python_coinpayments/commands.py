@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+CoinPayments API commands
+"""
+from python_coinpayments.exceptions import InvalidParamsError
+from python_coinpayments.signing import Signer, encode_params
+
+# commands that only read data and can safely be repeated
+READ_ONLY_COMMANDS = frozenset({
+    "get_basic_info",
+    "rates",
+    "balances",
+    "convert_limits",
+    "get_withdrawal_history",
+    "get_withdrawal_info",
+    "get_conversion_info",
+    "get_tx_info",
+    "get_tx_info_multi",
+    "get_tx_ids",
+})
+
+# client methods that each send one command
+API_METHODS = frozenset({
+    "create_transaction",
+    "get_basic_info",
+    "rates",
+    "balances",
+    "get_deposit_address",
+    "get_callback_address",
+    "create_transfer",
+    "create_withdrawal",
+    "create_mass_withdrawal",
+    "convert_coins",
+    "get_conversion_limits",
+    "get_withdrawal_history",
+    "get_withdrawal_info",
+    "get_conversion_info",
+    "get_tx_info",
+    "get_tx_info_multi",
+    "get_tx_list",
+})
+
+# params a command cannot do without
+REQUIRED_PARAMS = {
+    "create_transaction": ("amount", "currency1", "currency2", "buyer_email"),
+    "get_deposit_address": ("currency", ),
+    "get_callback_address": ("currency", ),
+    "create_transfer": ("amount", "currency"),
+    "create_withdrawal": ("amount", "currency"),
+    "convert": ("amount", "from", "to"),
+    "convert_limits": ("from", "to"),
+    "get_withdrawal_info": ("id", ),
+    "get_conversion_info": ("id", ),
+    "get_tx_info": ("txid", ),
+    "get_tx_info_multi": ("txid", ),
+}
+
+# commands that send IPNs to the client's ipn_url
+IPN_COMMANDS = frozenset({"create_transaction", "get_callback_address"})
+
+
+class CommandSpec:
+    """
+    A command precompiled for one client
+
+    The constant fields of the command's requests (key, version, format,
+    cmd and ipn_url) are url encoded once, and fed once into a copy of the
+    client's keyed HMAC.  A call then only encodes the caller's fields,
+    appends them to the constant ones and hashes them.  Caller fields that
+    clash with a constant one are left out.  Immutable, so it can be shared
+    between threads.
+    """
+    __slots__ = ("cmd", "constants", "required", "prefix", "_names", "_mac")
+
+    def __init__(self, cmd: str, constants: dict, signer: Signer):
+        """
+        Initialize!
+        """
+        self.cmd = cmd
+        self.constants = dict(constants)
+        self.required = REQUIRED_PARAMS.get(cmd, ())
+        self.prefix = encode_params(self.constants)
+        self._names = frozenset(self.constants)
+        self._mac = signer.new()
+        self._mac.update(self.prefix)
+
+    def check(self, params: dict):
+        """
+        Raise InvalidParamsError if params lack a required field
+        """
+        missing = [name for name in self.required if name not in params]
+        if missing:
+            raise InvalidParamsError("{} requires {}".format(
+                self.cmd, ", ".join(missing)))
+
+    def fields(self, params: dict):
+        """
+        Get the caller's fields that are sent
+        """
+        if self._names.isdisjoint(params):
+            return params
+        return {
+            name: value for name, value in params.items()
+            if name not in self._names
+        }
+
+    def params(self, params: dict):
+        """
+        Get all params of a request, as a new dict
+        """
+        params = dict(self.fields(params))
+        params.update(self.constants)
+        return params
+
+    def encode(self, params: dict):
+        """
+        Get the request body for the caller's params
+        """
+        if not params:
+            return self.prefix
+        fields = self.fields(params)
+        if not fields:
+            return self.prefix
+        return self.prefix + b"&" + encode_params(fields)
+
+    def sign(self, encoded: bytes):
+        """
+        Get the hex HMAC of a request body built by `encode`
+        """
+        mac = self._mac.copy()
+        mac.update(memoryview(encoded)[len(self.prefix):])
+        return mac.hexdigest()
+
+
+def request_key(params: dict):
+    """
+    Normalize request params (including cmd) into a hashable key
+
+    Requests with the same key are identical.
+    """
+    return tuple(sorted((name, str(value)) for name, value in params.items()))
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Pluggable decoding of API responses
+
+A decoder is any callable taking the raw response body (bytes) and
+returning the decoded response.  The client uses the stdlib json module by
+default; faster backends are used when they are installed and asked for.
+"""
+import importlib
+import json
+from decimal import Decimal
+
+# response fields holding amounts of money
+MONETARY_FIELDS = frozenset({
+    "amount",
+    "amountf",
+    "amount1",
+    "amount2",
+    "balance",
+    "balancef",
+    "fee",
+    "feef",
+    "net",
+    "netf",
+    "rate_btc",
+    "received",
+    "receivedf",
+    "received_amount",
+    "tx_fee",
+})
+
+# optional fast backends, fastest first
+FAST_BACKENDS = ("orjson", "ujson", "simplejson")
+
+
+def stdlib_decoder(body: bytes):
+    """
+    Decode with the stdlib json module
+    """
+    return json.loads(body)
+
+
+def _monetary_hook(obj: dict):
+    """
+    Turn monetary string fields of a decoded object into Decimals
+    """
+    for field in MONETARY_FIELDS.intersection(obj):
+        value = obj[field]
+        if isinstance(value, str) and value:
+            try:
+                obj[field] = Decimal(value)
+            except ArithmeticError:
+                pass
+    return obj
+
+
+def decimal_decoder(body: bytes):
+    """
+    Decode with exact amounts
+
+    Numbers with a fraction are parsed straight from their JSON text into
+    Decimal, never going through float, and monetary fields sent as strings
+    (e.g. "amountf": "0.01") are returned as Decimal too.  Integer fields,
+    such as amounts in satoshis, stay ints.
+    """
+    return json.loads(body, parse_float=Decimal, object_hook=_monetary_hook)
+
+
+def _backend_decoder(name: str):
+    """
+    Get the loads function of an optional JSON backend
+    """
+    return importlib.import_module(name).loads
+
+
+def get_decoder(name: str = "json"):
+    """
+    Get a decoder by name
+
+    - json: the stdlib json module
+    - decimal: stdlib json with exact Decimal amounts, see `decimal_decoder`
+    - orjson, ujson, simplejson: that backend, which must be installed
+    - fastest: the fastest installed backend, falling back to json
+
+    Raises ImportError if the named backend is not installed.
+    """
+    if name == "json":
+        return stdlib_decoder
+    if name == "decimal":
+        return decimal_decoder
+    if name in FAST_BACKENDS:
+        return _backend_decoder(name)
+    if name == "fastest":
+        for backend in FAST_BACKENDS:
+            try:
+                return _backend_decoder(backend)
+            except ImportError:
+                continue
+        return stdlib_decoder
+    raise ValueError("Unknown decoder: {}".format(name))
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Exceptions raised by python_coinpayments
+"""
+
+
+class CoinPaymentsError(Exception):
+    """
+    The CoinPayments API answered with an error
+    """
+
+
+class InvalidParamsError(ValueError):
+    """
+    A call lacks a required param, so it was not sent
+    """
+
+
+class RateLimitTimeout(Exception):
+    """
+    A request waited longer than allowed for the client-side rate limiter
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    The circuit breaker is open, calls fail fast until the API recovers
+    """
+
+
+class ReplayError(Exception):
+    """
+    A replayed request is not in the recording
+    """
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+"""
+Durable ingestion of IPNs: verify, queue and acknowledge, process later
+"""
+import concurrent.futures
+import functools
+import json
+import sqlite3
+import threading
+import time
+
+
+class IPNQueue:
+    """
+    Durable queue of IPNs in an SQLite database (in WAL mode)
+
+    Items are leased rather than popped: a leased item is redelivered once
+    its lease expires unless it was acknowledged, so an IPN is processed at
+    least once even if its worker dies.  All methods are thread-safe.
+    """
+
+    def __init__(self, path: str, lease_timeout: float = 300.0):
+        """
+        Initialize!
+        """
+        self.path = path
+        self.lease_timeout = lease_timeout
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS ipn_queue ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " http_post TEXT NOT NULL,"
+            " enqueued_at REAL NOT NULL,"
+            " available_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " dead INTEGER NOT NULL DEFAULT 0)")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS ipn_queue_available"
+            " ON ipn_queue (dead, available_at)")
+
+    def put(self, http_post: dict):
+        """
+        Append an IPN; returns its ID once it is durably queued
+        """
+        now = time.time()
+        with self._lock:
+            return self._db.execute(
+                "INSERT INTO ipn_queue (http_post, enqueued_at, available_at)"
+                " VALUES (?, ?, ?)",
+                (json.dumps(http_post), now, now)).lastrowid
+
+    def lease(self, limit: int = 1):
+        """
+        Lease up to limit available IPNs, oldest first
+
+        Returns a list of (ID, http_post, enqueued_at, attempts) tuples.
+        """
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                rows = self._db.execute(
+                    "SELECT id, http_post, enqueued_at, attempts"
+                    " FROM ipn_queue WHERE dead = 0 AND available_at <= ?"
+                    " ORDER BY id LIMIT ?", (now, limit)).fetchall()
+                self._db.executemany(
+                    "UPDATE ipn_queue SET available_at = ?,"
+                    " attempts = attempts + 1 WHERE id = ?",
+                    [(now + self.lease_timeout, row[0]) for row in rows])
+        return [
+            (id_, json.loads(http_post), enqueued_at, attempts + 1)
+            for id_, http_post, enqueued_at, attempts in rows
+        ]
+
+    def ack(self, id_: int):
+        """
+        Remove a processed IPN
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM ipn_queue WHERE id = ?", (id_, ))
+
+    def nack(self, id_: int, delay: float = 0.0, dead: bool = False):
+        """
+        Release a leased IPN to be retried after delay seconds
+
+        With `dead` it is set aside instead and never redelivered.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE ipn_queue SET available_at = ?, dead = ?"
+                " WHERE id = ?", (time.time() + delay, int(dead), id_))
+
+    def dead_letters(self):
+        """
+        Get the IPNs that were set aside, as (ID, http_post) tuples
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, http_post FROM ipn_queue WHERE dead = 1"
+                " ORDER BY id").fetchall()
+        return [(id_, json.loads(http_post)) for id_, http_post in rows]
+
+    def oldest(self):
+        """
+        Get the time the oldest queued IPN was enqueued, or None
+        """
+        with self._lock:
+            return self._db.execute(
+                "SELECT MIN(enqueued_at) FROM ipn_queue WHERE dead = 0"
+            ).fetchone()[0]
+
+    def close(self):
+        """
+        Close the database
+        """
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM ipn_queue WHERE dead = 0").fetchone()[0]
+
+
+class IPNIngestor:
+    """
+    Verifies and queues IPNs, and processes them on a worker pool
+
+    `submit` is meant to be called from the IPN endpoint: it verifies the
+    IPN, appends it to the durable `queue` and returns, so the endpoint can
+    answer CoinPayments right away.  Between `start` and `stop` a
+    dispatcher thread leases queued IPNs and runs `handler(http_post)` for
+    each of them on `executor`, any `concurrent.futures.Executor` (a
+    `ProcessPoolExecutor` needs a picklable handler).  At most
+    `max_in_flight` IPNs are handed to the executor at a time.
+
+    Delivery is at least once: an IPN is removed from the queue only after
+    its handler returns.  If the handler raises, the IPN is retried after
+    `retry_delay` seconds, and set aside as a dead letter after
+    `max_attempts` attempts, if given.  Handlers should be idempotent.
+
+    Once `max_pending` IPNs are queued, `submit` rejects new ones with
+    "Queue full"; the endpoint should then answer with an error so that
+    CoinPayments sends the IPN again later.
+    """
+
+    def __init__(
+            self,
+            verifier,
+            queue: IPNQueue,
+            handler,
+            executor: concurrent.futures.Executor = None,
+            max_in_flight: int = 4,
+            max_pending: int = 10000,
+            retry_delay: float = 10.0,
+            max_attempts: int = None,
+            poll_interval: float = 0.5,
+    ):
+        """
+        Initialize!
+
+        `verifier` is an `IPNVerifier`.  `executor` defaults to a thread
+        pool of `max_in_flight` threads, which is shut down by `stop` and
+        replaced by the next `start`.
+        """
+        self.verifier = verifier
+        self.queue = queue
+        self.handler = handler
+        self._own_executor = executor is None
+        if executor is None:
+            executor = concurrent.futures.ThreadPoolExecutor(max_in_flight)
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self._pending = len(queue)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def submit(self, http_headers: dict, http_post: dict):
+        """
+        Verify an IPN and queue it for processing
+
+        Returns a tuple of:
+            - bool indicating if the IPN was queued
+            - error message, if any
+        """
+        with self._lock:
+            full = self._pending >= self.max_pending
+            if full:
+                self.rejected += 1
+        if full:
+            return False, "Queue full"
+        authenticated, error = self.verifier.verify(http_headers, http_post)
+        if not authenticated:
+            with self._lock:
+                self.rejected += 1
+            return False, error
+        try:
+            self.queue.put(dict(http_post))
+        except BaseException:
+            # the IPN was marked as seen, so unless it is forgotten its
+            # retry would be refused as a duplicate and it would be lost
+            if self.verifier.deduplicator is not None:
+                self.verifier.deduplicator.forget(http_post)
+            raise
+        with self._lock:
+            self.accepted += 1
+            self._pending += 1
+        self._wakeup.set()
+        return True, None
+
+    def _done(self, id_: int, enqueued_at: float, attempts: int, future):
+        """
+        Acknowledge or release an IPN once its handler finished
+        """
+        if future.exception() is None:
+            self.queue.ack(id_)
+            lag = time.time() - enqueued_at
+            with self._lock:
+                self.processed += 1
+                self._pending -= 1
+                self.lag_total += lag
+                self.lag_max = max(self.lag_max, lag)
+        else:
+            dead = self.max_attempts is not None and \
+                attempts >= self.max_attempts
+            self.queue.nack(id_, delay=self.retry_delay, dead=dead)
+            with self._lock:
+                self.failed += 1
+                if dead:
+                    self._pending -= 1
+        with self._lock:
+            self._in_flight -= 1
+        self._wakeup.set()
+
+    def dispatch(self):
+        """
+        Hand as many queued IPNs to the executor as there is room for
+
+        Returns the number dispatched.
+        """
+        with self._lock:
+            room = self.max_in_flight - self._in_flight
+        if room <= 0:
+            return 0
+        items = self.queue.lease(room)
+        with self._lock:
+            self._in_flight += len(items)
+        for index, (id_, http_post, enqueued_at, attempts) in enumerate(
+                items):
+            try:
+                future = self.executor.submit(self.handler, http_post)
+            except BaseException:
+                # this IPN and the ones after it will not run, so they are
+                # released to be retried
+                for item in items[index:]:
+                    self.queue.nack(item[0], delay=self.retry_delay)
+                with self._lock:
+                    self._in_flight -= len(items) - index
+                raise
+            future.add_done_callback(
+                functools.partial(self._done, id_, enqueued_at, attempts))
+        return len(items)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            if not self.dispatch():
+                self._wakeup.wait(self.poll_interval)
+
+    def start(self):
+        """
+        Start processing queued IPNs on a background thread
+        """
+        if self._own_executor and self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                self.max_in_flight)
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="ipn-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True):
+        """
+        Stop dispatching; IPNs not yet processed stay queued
+
+        With `wait`, returns once the IPNs already dispatched are processed.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._own_executor and self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
+
+    def metrics(self):
+        """
+        Get queue and processing metrics
+
+        `lag` is the age in seconds of the oldest queued IPN and
+        `lag_mean`/`lag_max` are the times from queueing to processing.
+        """
+        oldest = self.queue.oldest()
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "in_flight": self._in_flight,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+                "processed": self.processed,
+                "failed": self.failed,
+                "lag": time.time() - oldest if oldest is not None else 0.0,
+                "lag_mean": (self.lag_total / self.processed
+                             if self.processed else 0.0),
+                "lag_max": self.lag_max,
+            }
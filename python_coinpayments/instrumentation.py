@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+Per-phase timing of API calls
+
+Listeners added with `CoinPayments.add_listener` are called with a
+`RequestEvent` after every request sent to the API.  Without listeners
+nothing is timed.
+"""
+import bisect
+import collections
+import threading
+import time
+
+# the phases of a request, in order
+PHASES = (
+    "package",  # url encoding the params
+    "sign",     # calculating the HMAC
+    "queue",    # waiting for the rate limiter and circuit breaker
+    "connect",  # opening a new connection, if one was needed
+    "wait",     # sending the request and waiting for the response headers
+    "read",     # reading the response body
+    "decode",   # decoding the response body
+)
+
+# request outcomes
+OK = "ok"
+API_ERROR = "api_error"    # the API answered with an error
+HTTP_ERROR = "http_error"  # the API answered with an HTTP error status
+EXCEPTION = "exception"    # the request raised, e.g. on a timeout
+
+# histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+    10.0, 30.0, 60.0,
+)
+
+
+def add_time(timings: dict, phase: str, start: float):
+    """
+    Add the time since start (a perf_counter value) to a phase
+
+    Returns the current perf_counter value, to start the next phase with.
+    """
+    now = time.perf_counter()
+    timings[phase] = timings.get(phase, 0.0) + now - start
+    return now
+
+
+class RequestEvent:  # pylint: disable=too-few-public-methods
+    """
+    Timings and outcome of one request
+
+    `timings` maps phases to seconds, summed over retries; phases that
+    did not happen, or that the transport cannot time, are missing.
+    `duration` is the total time in seconds and `error` the API error
+    message or the exception raised, if any.
+    """
+    __slots__ = (
+        "cmd", "timings", "request_size", "response_size", "status",
+        "attempts", "outcome", "error", "duration",
+    )
+
+    def __init__(self, cmd: str):
+        """
+        Initialize!
+        """
+        self.cmd = cmd
+        self.timings = {}
+        self.request_size = 0
+        self.response_size = 0
+        self.status = None
+        self.attempts = 0
+        self.outcome = None
+        self.error = None
+        self.duration = 0.0
+
+    def __repr__(self):
+        return "RequestEvent(cmd={!r}, outcome={!r}, duration={!r})".format(
+            self.cmd, self.outcome, self.duration)
+
+
+def finish_event(event: RequestEvent, start: float, response=None,
+                 error: BaseException = None):
+    """
+    Set the outcome and duration of an event
+    """
+    event.duration = time.perf_counter() - start
+    if error is not None:
+        event.outcome = EXCEPTION
+        event.error = error
+    elif event.status is not None and event.status >= 400:
+        event.outcome = HTTP_ERROR
+        event.error = "HTTP {}".format(event.status)
+    elif isinstance(response, dict) and response.get("error") != "ok":
+        event.outcome = API_ERROR
+        event.error = response.get("error")
+    else:
+        event.outcome = OK
+
+
+class _CommandStats:  # pylint: disable=too-few-public-methods
+    """
+    Aggregated events of one command
+    """
+    __slots__ = ("count", "buckets", "total", "max", "phases", "outcomes",
+                 "errors", "request_bytes", "response_bytes")
+
+    def __init__(self, buckets: int):
+        self.count = 0
+        self.buckets = [0] * (buckets + 1)
+        self.total = 0.0
+        self.max = 0.0
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.outcomes = collections.Counter()
+        self.errors = collections.Counter()
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class LatencyAggregator:
+    """
+    Listener aggregating events into per command latency histograms
+
+    Keeps, per command, a histogram of the total duration over `buckets`
+    (upper bounds in seconds), the time spent in each phase, outcome and
+    error counters and byte counts.  Adding an event is a few dict and list
+    updates under a lock; `snapshot` exports everything as plain data.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Initialize!
+        """
+        self.buckets = tuple(sorted(buckets))
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, event: RequestEvent):
+        with self._lock:
+            stats = self._stats.get(event.cmd)
+            if stats is None:
+                stats = self._stats[event.cmd] = _CommandStats(
+                    len(self.buckets))
+            stats.count += 1
+            stats.buckets[bisect.bisect_left(
+                self.buckets, event.duration)] += 1
+            stats.total += event.duration
+            if event.duration > stats.max:
+                stats.max = event.duration
+            for phase, seconds in event.timings.items():
+                stats.phases[phase] += seconds
+            stats.outcomes[event.outcome] += 1
+            if event.outcome != OK:
+                error = event.error
+                if isinstance(error, BaseException):
+                    error = type(error).__name__
+                stats.errors[error] += 1
+            stats.request_bytes += event.request_size
+            stats.response_bytes += event.response_size
+
+    def percentile(self, cmd: str, fraction: float):
+        """
+        Estimate a latency percentile of cmd from its histogram
+
+        Returns the upper bound of the bucket holding the percentile (the
+        largest latency seen for the overflow bucket), or None.
+        """
+        with self._lock:
+            stats = self._stats.get(cmd)
+            if stats is None or not stats.count:
+                return None
+            rank = fraction * stats.count
+            seen = 0
+            for index, count in enumerate(stats.buckets):
+                seen += count
+                if seen >= rank and count:
+                    if index < len(self.buckets):
+                        return self.buckets[index]
+                    break
+            return stats.max
+
+    def snapshot(self):
+        """
+        Get the aggregated stats of each command as plain data
+
+        The histogram is a list of (upper bound, count) pairs, the last
+        bound being None for latencies beyond the largest bucket.
+        """
+        with self._lock:
+            return {
+                cmd: {
+                    "count": stats.count,
+                    "total": stats.total,
+                    "max": stats.max,
+                    "histogram": list(zip(
+                        self.buckets + (None, ), stats.buckets)),
+                    "phases": dict(stats.phases),
+                    "outcomes": dict(stats.outcomes),
+                    "errors": dict(stats.errors),
+                    "request_bytes": stats.request_bytes,
+                    "response_bytes": stats.response_bytes,
+                }
+                for cmd, stats in self._stats.items()
+            }
+
+    def reset(self):
+        """
+        Forget everything aggregated so far
+        """
+        with self._lock:
+            self._stats.clear()
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+IPN (Instant Payment Notification) verification
+"""
+import collections
+import concurrent.futures
+import hmac
+import itertools
+import sqlite3
+import threading
+import time
+
+from python_coinpayments.signing import Signer
+
+
+class IPNDeduplicator:
+    """
+    Remembers which IPNs were already processed
+
+    CoinPayments resends an IPN until it is acknowledged, so the same IPN
+    can arrive several times.  IPNs are identified by their (ipn_id, txn_id,
+    status) and the most recent `maxsize` are kept in an LRU index, so a
+    check is O(1).  With `path` they are also recorded in an SQLite database
+    (in WAL mode), so that they are remembered across restarts and processes
+    sharing the database.
+
+    All methods are thread-safe.
+    """
+
+    def __init__(self, maxsize: int = 10000, path: str = None):
+        """
+        Initialize!
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(
+                path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS ipns ("
+                " ipn_id TEXT NOT NULL,"
+                " txn_id TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " seen_at REAL NOT NULL,"
+                " PRIMARY KEY (ipn_id, txn_id, status))")
+
+    @staticmethod
+    def key(http_post: dict):
+        """
+        Get the key identifying an IPN
+        """
+        return (
+            str(http_post.get("ipn_id", "")),
+            str(http_post.get("txn_id", "")),
+            str(http_post.get("status", "")),
+        )
+
+    def _remember(self, key: tuple):
+        """
+        Add key to the LRU index, under the lock
+        """
+        self._seen[key] = None
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+
+    def check_and_mark(self, http_post: dict):
+        """
+        Mark an IPN as processed
+
+        Returns True if it was not processed before, atomically, so of many
+        concurrent handlers of the same IPN only one gets True.
+        """
+        key = self.key(http_post)
+        with self._lock:
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                return False
+            new = True
+            if self._db is not None:
+                new = 1 == self._db.execute(
+                    "INSERT OR IGNORE INTO ipns VALUES (?, ?, ?, ?)",
+                    key + (time.time(), )).rowcount
+            self._remember(key)
+            return new
+
+    def seen(self, http_post: dict):
+        """
+        Whether an IPN was already processed
+        """
+        key = self.key(http_post)
+        with self._lock:
+            if key in self._seen:
+                return True
+            if self._db is None:
+                return False
+            row = self._db.execute(
+                "SELECT 1 FROM ipns"
+                " WHERE ipn_id = ? AND txn_id = ? AND status = ?",
+                key).fetchone()
+            if row is not None:
+                self._remember(key)
+            return row is not None
+
+    def forget(self, http_post: dict):
+        """
+        Unmark an IPN, e.g. because processing it failed
+        """
+        key = self.key(http_post)
+        with self._lock:
+            self._seen.pop(key, None)
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM ipns"
+                    " WHERE ipn_id = ? AND txn_id = ? AND status = ?", key)
+
+    def prune(self, max_age: float):
+        """
+        Drop IPNs seen more than max_age seconds ago from the database
+        """
+        if self._db is None:
+            return 0
+        with self._lock:
+            return self._db.execute(
+                "DELETE FROM ipns WHERE seen_at < ?",
+                (time.time() - max_age, )).rowcount
+
+    def close(self):
+        """
+        Close the database, if any
+        """
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+
+    def __len__(self):
+        return len(self._seen)
+
+
+class IPNVerifier:
+    """
+    Verifies IPN requests for one merchant
+
+    The secret is keyed once, so a verifier should be created once and
+    reused for every IPN.  The cheap merchant and ipn_mode checks run before
+    any hashing, and HMACs are compared in constant time.
+
+    With a `deduplicator`, authentic IPNs that were already verified are
+    rejected with "Duplicate IPN".  They should still be acknowledged to
+    CoinPayments, and an IPN whose processing fails should be passed to
+    `deduplicator.forget` so that its retry is accepted.
+    """
+
+    def __init__(
+            self,
+            secret: str,
+            merchant_id: str,
+            ipn_mode: str = "hmac",
+            deduplicator: IPNDeduplicator = None,
+    ):
+        """
+        Initialize!
+        """
+        self.merchant_id = merchant_id
+        self.ipn_mode = ipn_mode
+        self.deduplicator = deduplicator
+        self._signer = Signer(secret)
+
+    def _check(self, http_hmac: str, http_post: dict):
+        """
+        Run the checks that need no hashing
+
+        Returns the error message, if any
+        """
+        merchant = http_post.get("merchant")
+        received_ipn_mode = http_post.get("ipn_mode")
+
+        if merchant is None:
+            return "No merchant ID"
+        if merchant != self.merchant_id:
+            return "Invalid merchant ID"
+        if received_ipn_mode is None:
+            return "No ipn_mode"
+        if received_ipn_mode != self.ipn_mode:
+            return "Invalid ipn_mode"
+        if http_hmac is None:
+            return "No HTTP HMAC"
+        return None
+
+    def _compare(self, http_hmac: str, hashed: str, http_post: dict):
+        """
+        Compare the received and calculated HMACs and deduplicate
+        """
+        if not hmac.compare_digest(
+                http_hmac.encode("utf-8"), hashed.encode("utf-8")):
+            return False, "Invalid HTTP HMAC"
+
+        if self.deduplicator is not None and \
+                not self.deduplicator.check_and_mark(http_post):
+            return False, "Duplicate IPN"
+
+        return True, None
+
+    def verify(self, http_headers: dict, http_post: dict):
+        """
+        Authenticates the IPN request
+
+        Returns a tuple of:
+            - bool indicating if authenticated or not
+            - error message, if any
+        """
+        http_hmac = http_headers.get("HTTP_HMAC")
+        error = self._check(http_hmac, http_post)
+        if error is not None:
+            return False, error
+
+        _, hashed = self._signer.sign_params(http_post)
+        return self._compare(http_hmac, hashed, http_post)
+
+    def new_hmac(self):
+        """
+        Get a keyed HMAC to feed a raw IPN body into as it is read
+        """
+        return self._signer.new()
+
+    def verify_signed(self, http_hmac: str, hashed: str, http_post: dict):
+        """
+        Authenticates an IPN whose raw body was already hashed
+
+        `hashed` is the hex digest of an HMAC from `new_hmac` fed with the
+        raw body that `http_post` was parsed from.  Returns the same as
+        `verify`.
+        """
+        error = self._check(http_hmac, http_post)
+        if error is not None:
+            return False, error
+        return self._compare(http_hmac, hashed, http_post)
+
+    def iter_verify(self, requests, max_workers: int = None):
+        """
+        Verify a stream of IPN requests
+
+        `requests` is an iterable of (http_headers, http_post) tuples.  Yields
+        the result of `verify` for each of them, in order.  If `max_workers`
+        is given the requests are verified on a pool of that many threads,
+        with a bounded number of requests in flight so that arbitrarily long
+        streams can be verified.
+        """
+        if not max_workers:
+            for http_headers, http_post in requests:
+                yield self.verify(http_headers, http_post)
+            return
+
+        requests = iter(requests)
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            pending = collections.deque(
+                executor.submit(self.verify, *request)
+                for request in itertools.islice(requests, max_workers * 2))
+            while pending:
+                result = pending.popleft().result()
+                for request in itertools.islice(requests, 1):
+                    pending.append(executor.submit(self.verify, *request))
+                yield result
+
+    def verify_many(self, requests, max_workers: int = None):
+        """
+        Verify a batch of IPN requests
+
+        Returns a list with the result of `verify` for each of the
+        (http_headers, http_post) tuples in `requests`, in order.
+        """
+        return list(self.iter_verify(requests, max_workers=max_workers))
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+WSGI and ASGI receivers of IPNs
+
+Both read the form body once, in chunks, feeding each chunk to the HMAC and
+to an incremental parser, verify the IPN with an `IPNVerifier` and pass the
+verified form data to a callback.
+"""
+import inspect
+import urllib.parse
+
+from python_coinpayments.aio import get_running_loop
+
+# IPNs are small; anything much bigger is not an IPN
+DEFAULT_MAX_BODY = 64 * 1024
+CHUNK_SIZE = 8192
+
+RESPONSES = {
+    200: "200 OK",
+    400: "400 Bad Request",
+    404: "404 Not Found",
+    405: "405 Method Not Allowed",
+    411: "411 Length Required",
+    413: "413 Payload Too Large",
+    500: "500 Internal Server Error",
+}
+
+
+class FormParser:
+    """
+    Incremental parser of application/x-www-form-urlencoded bodies
+    """
+
+    def __init__(self):
+        """
+        Initialize!
+        """
+        self.fields = {}
+        self._rest = b""
+
+    def _add(self, pair: bytes):
+        if not pair:
+            return
+        name, _, value = pair.partition(b"=")
+        self.fields[urllib.parse.unquote_plus(name.decode("latin-1"))] = \
+            urllib.parse.unquote_plus(value.decode("latin-1"))
+
+    def feed(self, chunk: bytes):
+        """
+        Parse the complete fields in chunk
+        """
+        pairs = (self._rest + chunk).split(b"&")
+        self._rest = pairs.pop()
+        for pair in pairs:
+            self._add(pair)
+
+    def close(self):
+        """
+        Parse the last field and get all fields as a dict
+        """
+        self._add(self._rest)
+        self._rest = b""
+        return self.fields
+
+
+class _Reader:
+    """
+    Feeds a body to the verifier's HMAC and a FormParser
+    """
+
+    def __init__(self, verifier, max_body: int):
+        self.mac = verifier.new_hmac()
+        self.parser = FormParser()
+        self.max_body = max_body
+        self.size = 0
+
+    def feed(self, chunk: bytes):
+        """
+        Take the next chunk; returns False once the body is too large
+        """
+        self.size += len(chunk)
+        if self.size > self.max_body:
+            return False
+        self.mac.update(chunk)
+        self.parser.feed(chunk)
+        return True
+
+
+def _status(error: str):
+    """
+    Get the HTTP status to answer a verification error with
+    """
+    # repeats are authentic and must be acknowledged to stop the resends
+    return 200 if error == "Duplicate IPN" else 400
+
+
+class WSGIIPNReceiver:
+    """
+    WSGI application receiving IPNs
+
+    Verified IPNs are passed to `callback(http_post)` and acknowledged with
+    200 once it returns.  Requests that fail verification get 400 and the
+    error message; a callback that raises gets 500, and with a
+    deduplicator the IPN is forgotten so that its resend is accepted.
+
+    With `path`, only requests to that path are IPNs and the others are
+    passed to `app` (or get 404), so it can wrap an existing application.
+    """
+
+    def __init__(
+            self,
+            verifier,
+            callback,
+            path: str = None,
+            app=None,
+            max_body: int = DEFAULT_MAX_BODY,
+    ):
+        """
+        Initialize!
+        """
+        self.verifier = verifier
+        self.callback = callback
+        self.path = path
+        self.app = app
+        self.max_body = max_body
+
+    @staticmethod
+    def _respond(start_response, status: int, message: str):
+        body = message.encode("utf-8")
+        start_response(RESPONSES[status], [
+            ("Content-Type", "text/plain; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+        ])
+        return [body]
+
+    def receive(self, environ: dict):
+        """
+        Read and verify the IPN in environ and run the callback
+
+        Returns a tuple of (HTTP status, message)
+        """
+        if environ.get("REQUEST_METHOD") != "POST":
+            return 405, "Method not allowed"
+        try:
+            length = int(environ.get("CONTENT_LENGTH") or "")
+        except ValueError:
+            return 411, "Length required"
+        if length > self.max_body:
+            return 413, "Payload too large"
+
+        reader = _Reader(self.verifier, self.max_body)
+        stream = environ["wsgi.input"]
+        while length > 0:
+            chunk = stream.read(min(length, CHUNK_SIZE))
+            if not chunk:
+                break
+            length -= len(chunk)
+            reader.feed(chunk)
+        http_post = reader.parser.close()
+
+        authenticated, error = self.verifier.verify_signed(
+            environ.get("HTTP_HMAC"), reader.mac.hexdigest(), http_post)
+        if not authenticated:
+            return _status(error), error
+        try:
+            self.callback(http_post)
+        except Exception:  # pylint: disable=broad-except
+            if self.verifier.deduplicator is not None:
+                self.verifier.deduplicator.forget(http_post)
+            return 500, "IPN processing failed"
+        return 200, "IPN OK"
+
+    def __call__(self, environ: dict, start_response):
+        if self.path is not None and environ.get("PATH_INFO") != self.path:
+            if self.app is not None:
+                return self.app(environ, start_response)
+            return self._respond(start_response, 404, "Not found")
+        status, message = self.receive(environ)
+        return self._respond(start_response, status, message)
+
+
+class ASGIIPNReceiver:
+    """
+    ASGI application receiving IPNs
+
+    Behaves like `WSGIIPNReceiver`.  `callback` can be a coroutine function,
+    which is awaited; any other callable is run on `executor` (the loop's
+    default executor if None) so that it never blocks the event loop.  So is
+    deduplication, which may query a database.
+    """
+
+    def __init__(
+            self,
+            verifier,
+            callback,
+            path: str = None,
+            app=None,
+            max_body: int = DEFAULT_MAX_BODY,
+            executor=None,
+    ):
+        """
+        Initialize!
+        """
+        self.verifier = verifier
+        self.callback = callback
+        self.path = path
+        self.app = app
+        self.max_body = max_body
+        self.executor = executor
+
+    @staticmethod
+    async def _respond(send, status: int, message: str):
+        body = message.encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"text/plain; charset=utf-8"),
+                (b"content-length", str(len(body)).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    @staticmethod
+    async def _lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _run(self, func, *args):
+        """
+        Run a blocking function on the executor
+        """
+        loop = get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def receive(self, scope: dict, receive):
+        """
+        Read and verify the IPN of an http scope and run the callback
+
+        Returns a tuple of (HTTP status, message)
+        """
+        if scope.get("method") != "POST":
+            return 405, "Method not allowed"
+        http_hmac = None
+        for name, value in scope.get("headers", ()):
+            if name.lower() == b"hmac":
+                http_hmac = value.decode("latin-1")
+
+        reader = _Reader(self.verifier, self.max_body)
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return 400, "Client disconnected"
+            more_body = message.get("more_body", False)
+            if not reader.feed(message.get("body", b"")):
+                return 413, "Payload too large"
+        http_post = reader.parser.close()
+
+        args = (http_hmac, reader.mac.hexdigest(), http_post)
+        if self.verifier.deduplicator is None:
+            authenticated, error = self.verifier.verify_signed(*args)
+        else:
+            authenticated, error = await self._run(
+                self.verifier.verify_signed, *args)
+        if not authenticated:
+            return _status(error), error
+        try:
+            if inspect.iscoroutinefunction(self.callback):
+                await self.callback(http_post)
+            else:
+                await self._run(self.callback, http_post)
+        except Exception:  # pylint: disable=broad-except
+            if self.verifier.deduplicator is not None:
+                await self._run(
+                    self.verifier.deduplicator.forget, http_post)
+            return 500, "IPN processing failed"
+        return 200, "IPN OK"
+
+    async def __call__(self, scope: dict, receive, send):
+        is_ipn = scope["type"] == "http" and (
+            self.path is None or scope.get("path") == self.path)
+        if not is_ipn:
+            if self.app is not None:
+                return await self.app(scope, receive, send)
+            if scope["type"] == "lifespan":
+                return await self._lifespan(receive, send)
+            if scope["type"] == "http":
+                return await self._respond(send, 404, "Not found")
+            return None
+        status, message = await self.receive(scope, receive)
+        return await self._respond(send, status, message)
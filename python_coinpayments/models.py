@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+"""
+Compact typed models of API results
+
+The API methods return plain dicts.  When many results are kept around,
+e.g. for reconciliation, these models use less memory: each object only
+holds a tuple of the raw values, and a field is converted (to Decimal,
+int, ...) each time it is read, so nothing converted is kept.  Fields the
+model does not know about are dropped.
+"""
+from decimal import Decimal
+
+from python_coinpayments.exceptions import CoinPaymentsError
+
+
+def to_decimal(value):
+    """
+    Convert an API amount to Decimal
+    """
+    if value is None or value == "":
+        return None
+    if isinstance(value, float):
+        value = repr(value)
+    return Decimal(value)
+
+
+def to_int(value):
+    """
+    Convert an API integer to int
+    """
+    if value is None or value == "":
+        return None
+    return int(value)
+
+
+def to_str(value):
+    """
+    Convert an API value to str
+    """
+    if value is None:
+        return None
+    return str(value)
+
+
+class Model:
+    """
+    Base class of the result models
+
+    Subclasses define FIELDS, a tuple of (name, converter) pairs, and empty
+    __slots__; each field becomes a property converting its raw value.
+    """
+    __slots__ = ("_raw", )
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for index, (name, converter) in enumerate(cls.FIELDS):
+            setattr(cls, name, property(
+                lambda self, index=index, converter=converter:
+                converter(self._raw[index]),
+                doc="The {} field".format(name)))
+
+    def __init__(self, raw: tuple):
+        """
+        Initialize from the raw values of FIELDS, in order
+        """
+        self._raw = raw
+
+    @classmethod
+    def from_dict(cls, data: dict, **extra):
+        """
+        Build a model from a decoded result dict
+
+        `extra` supplies fields that are not in data, such as the key the
+        result was found under.
+        """
+        extra = {
+            name: value for name, value in extra.items() if value is not None
+        }
+        if extra:
+            data = dict(data, **extra)
+        return cls(tuple(data.get(name) for name, _ in cls.FIELDS))
+
+    def as_dict(self):
+        """
+        Get all fields as a dict
+        """
+        return {name: getattr(self, name) for name, _ in self.FIELDS}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return self._raw == other._raw
+
+    def __hash__(self):
+        return hash(self._raw)
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join(
+            "{}={!r}".format(name, value)
+            for (name, _), value in zip(self.FIELDS, self._raw)
+            if value is not None))
+
+
+class TransactionInfo(Model):
+    """
+    Result of get_tx_info, or one entry of get_tx_info_multi
+    """
+    FIELDS = (
+        ("txn_id", to_str),
+        ("error", to_str),
+        ("time_created", to_int),
+        ("time_expires", to_int),
+        ("status", to_int),
+        ("status_text", to_str),
+        ("type", to_str),
+        ("coin", to_str),
+        ("amount", to_int),
+        ("amountf", to_decimal),
+        ("received", to_int),
+        ("receivedf", to_decimal),
+        ("recv_confirms", to_int),
+        ("payment_address", to_str),
+    )
+    __slots__ = ()
+
+
+class Balance(Model):
+    """
+    One coin of the balances result
+    """
+    FIELDS = (
+        ("coin", to_str),
+        ("balance", to_int),
+        ("balancef", to_decimal),
+        ("status", to_str),
+        ("coin_status", to_str),
+    )
+    __slots__ = ()
+
+
+class WithdrawalInfo(Model):
+    """
+    Result of get_withdrawal_info
+    """
+    FIELDS = (
+        ("id", to_str),
+        ("time_created", to_int),
+        ("status", to_int),
+        ("status_text", to_str),
+        ("coin", to_str),
+        ("amount", to_int),
+        ("amountf", to_decimal),
+        ("send_address", to_str),
+        ("send_txid", to_str),
+    )
+    __slots__ = ()
+
+
+class ConversionInfo(Model):
+    """
+    Result of get_conversion_info
+    """
+    FIELDS = (
+        ("id", to_str),
+        ("time_created", to_int),
+        ("status", to_int),
+        ("status_text", to_str),
+        ("coin1", to_str),
+        ("coin2", to_str),
+        ("amount_sent", to_int),
+        ("amount_sentf", to_decimal),
+        ("received", to_int),
+        ("receivedf", to_decimal),
+    )
+    __slots__ = ()
+
+
+class Rate(Model):
+    """
+    One coin of the rates result
+    """
+    FIELDS = (
+        ("coin", to_str),
+        ("name", to_str),
+        ("is_fiat", to_int),
+        ("rate_btc", to_decimal),
+        ("last_update", to_int),
+        ("tx_fee", to_decimal),
+        ("status", to_str),
+        ("confirms", to_int),
+        ("can_convert", to_int),
+    )
+    __slots__ = ()
+
+
+def _result(response: dict):
+    """
+    Get the result of a response, raising CoinPaymentsError on API errors
+    """
+    if response.get("error") != "ok":
+        raise CoinPaymentsError(response.get("error"))
+    return response.get("result") or {}
+
+
+def parse_tx_info(response: dict, txn_id: str = None):
+    """
+    Get a TransactionInfo from a get_tx_info response
+    """
+    return TransactionInfo.from_dict(_result(response), txn_id=txn_id)
+
+
+def parse_tx_info_multi(response: dict):
+    """
+    Get a dict of transaction ID to TransactionInfo from a get_tx_info_multi
+    response
+    """
+    return {
+        txn_id: TransactionInfo.from_dict(info, txn_id=txn_id)
+        for txn_id, info in _result(response).items()
+    }
+
+
+def parse_balances(response: dict):
+    """
+    Get a dict of coin to Balance from a balances response
+    """
+    return {
+        coin: Balance.from_dict(balance, coin=coin)
+        for coin, balance in _result(response).items()
+    }
+
+
+def parse_rates(response: dict):
+    """
+    Get a dict of coin to Rate from a rates response
+    """
+    return {
+        coin: Rate.from_dict(rate, coin=coin)
+        for coin, rate in _result(response).items()
+    }
+
+
+def parse_withdrawal_info(response: dict, withdrawal_id: str = None):
+    """
+    Get a WithdrawalInfo from a get_withdrawal_info response
+    """
+    return WithdrawalInfo.from_dict(_result(response), id=withdrawal_id)
+
+
+def parse_conversion_info(response: dict, conversion_id: str = None):
+    """
+    Get a ConversionInfo from a get_conversion_info response
+    """
+    return ConversionInfo.from_dict(_result(response), id=conversion_id)
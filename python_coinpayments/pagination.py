@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Lazy iteration over paginated API commands
+"""
+import asyncio
+import concurrent.futures
+
+from python_coinpayments.exceptions import CoinPaymentsError
+
+# the largest page get_tx_ids and get_withdrawal_history return
+MAX_PAGE_SIZE = 100
+
+
+def _page_params(params: dict, page_size: int, start: int):
+    """
+    Get the params for the page starting at start
+    """
+    page_params = dict(params or {})
+    page_params.update({"limit": page_size, "start": start})
+    return page_params
+
+
+def _page_records(response: dict):
+    """
+    Get the records of a page, raising CoinPaymentsError on API errors
+    """
+    if response.get("error") != "ok":
+        raise CoinPaymentsError(response.get("error"))
+    return response.get("result") or []
+
+
+def iter_pages(
+        fetch,
+        params: dict = None,
+        page_size: int = MAX_PAGE_SIZE,
+        prefetch: bool = True,
+):
+    """
+    Yield the records of every page of a paginated command
+
+    `fetch` is the client method for the command.  With `prefetch` the next
+    page is fetched on a background thread while the current one is being
+    consumed.  At most two pages are held in memory at a time, and
+    iteration stops after the first page that is not full.
+    """
+    if not 0 < page_size <= MAX_PAGE_SIZE:
+        raise ValueError("page_size must be between 1 and {}".format(
+            MAX_PAGE_SIZE))
+
+    def get_page(start):
+        return _page_records(fetch(_page_params(params, page_size, start)))
+
+    if not prefetch:
+        start = 0
+        while True:
+            records = get_page(start)
+            yield from records
+            if len(records) < page_size:
+                return
+            start += page_size
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        start = 0
+        records = get_page(start)
+        while True:
+            following = None
+            if len(records) == page_size:
+                start += page_size
+                following = executor.submit(get_page, start)
+            try:
+                yield from records
+            except GeneratorExit:
+                if following is not None:
+                    following.cancel()
+                raise
+            if following is None:
+                return
+            records = following.result()
+
+
+async def aiter_pages(
+        fetch,
+        params: dict = None,
+        page_size: int = MAX_PAGE_SIZE,
+        prefetch: bool = True,
+):
+    """
+    Async generator yielding the records of every page of a command
+
+    The asyncio counterpart of `iter_pages`; `fetch` returns coroutines and
+    the next page is prefetched in a task.
+    """
+    if not 0 < page_size <= MAX_PAGE_SIZE:
+        raise ValueError("page_size must be between 1 and {}".format(
+            MAX_PAGE_SIZE))
+
+    async def get_page(start):
+        return _page_records(
+            await fetch(_page_params(params, page_size, start)))
+
+    start = 0
+    records = await get_page(start)
+    while True:
+        following = None
+        if len(records) == page_size:
+            start += page_size
+            following = get_page(start)
+            if prefetch:
+                following = asyncio.ensure_future(following)
+        try:
+            for record in records:
+                yield record
+        except BaseException:
+            if following is not None:
+                if prefetch:
+                    following.cancel()
+                else:
+                    following.close()
+            raise
+        if following is None:
+            return
+        records = await following
@@ -0,0 +1,363 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk payouts with idempotency keys
+"""
+import collections
+import concurrent.futures
+import itertools
+import json
+import sqlite3
+import threading
+import time
+
+from python_coinpayments.exceptions import (
+    CircuitOpenError, CoinPaymentsError, InvalidParamsError, RateLimitTimeout,
+)
+from python_coinpayments.resilience import TRANSPORT_ERRORS
+
+# errors raised before anything was sent
+NOT_SENT_ERRORS = (CircuitOpenError, InvalidParamsError, RateLimitTimeout)
+
+# errors that may have been raised after the request was sent: the
+# connection failed or the response could not be decoded (decoders raise
+# ValueError); any other error means nothing was sent
+UNCERTAIN_ERRORS = TRANSPORT_ERRORS + (ValueError, )
+
+# payout outcomes
+SENT = "sent"            # the withdrawal was created by this run
+DUPLICATE = "duplicate"  # it was created before, nothing was sent
+FAILED = "failed"        # the API refused it, it can be retried
+UNKNOWN = "unknown"      # it may or may not have been created
+
+PayoutResult = collections.namedtuple(
+    "PayoutResult", "key status result error")
+PayoutResult.__doc__ = """
+The outcome of one payout
+
+`status` is SENT, DUPLICATE, FAILED or UNKNOWN.  `result` is the API's
+result for the withdrawal (with its `id`) when it was created, and `error`
+is an exception describing why it was not or may not have been.
+"""
+
+
+def encode_mass_withdrawal(withdrawals):
+    """
+    Encode create_withdrawal params for create_mass_withdrawal
+
+    `withdrawals` is a list of create_withdrawal params; withdrawal n
+    (counting from 1) is named wdn in the response.
+    """
+    params = {}
+    for number, withdrawal in enumerate(withdrawals, 1):
+        for name, value in withdrawal.items():
+            params["wd[wd{}][{}]".format(number, name)] = value
+    return params
+
+
+class PayoutLedger:
+    """
+    Record of payouts by idempotency key, in an SQLite database
+
+    A key is reserved before its payout is sent, so a payout is sent at most
+    once even if a run is retried, runs concurrently or crashes.  Payouts
+    whose outcome is unknown (e.g. the connection dropped after sending)
+    stay reserved until they are reconciled by hand with `resolve`.
+
+    The default in-memory database only protects a single process; use a
+    file to keep the ledger across runs.  All methods are thread-safe.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        """
+        Initialize!
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS payouts ("
+            " key TEXT PRIMARY KEY,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " updated_at REAL NOT NULL)")
+
+    def reserve(self, key: str):
+        """
+        Reserve a key for sending its payout
+
+        Returns None if it was reserved, else the PayoutResult recorded for
+        it: DUPLICATE if it was sent, UNKNOWN if it is in flight or its
+        outcome is unknown.  Keys of FAILED payouts can be reserved again.
+        """
+        now = time.time()
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN IMMEDIATE")
+                row = self._db.execute(
+                    "SELECT status, result, error FROM payouts"
+                    " WHERE key = ?", (key, )).fetchone()
+                if row is None or row[0] == FAILED:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO payouts"
+                        " VALUES (?, ?, NULL, NULL, ?)", (key, UNKNOWN, now))
+                    return None
+        status, result, error = row
+        if status == SENT:
+            return PayoutResult(key, DUPLICATE, json.loads(result), None)
+        return PayoutResult(key, UNKNOWN, None, CoinPaymentsError(
+            error or "Payout in progress or outcome unknown"))
+
+    def record(self, result: PayoutResult):
+        """
+        Record the outcome of a reserved payout
+        """
+        row = (
+            result.status if result.status != DUPLICATE else SENT,
+            json.dumps(result.result, default=str)
+            if result.result is not None else None,
+            str(result.error) if result.error is not None else None,
+            time.time(),
+            result.key,
+        )
+        with self._lock:
+            self._db.execute(
+                "UPDATE payouts SET status = ?, result = ?, error = ?,"
+                " updated_at = ? WHERE key = ?", row)
+
+    def resolve(self, key: str, result: dict = None):
+        """
+        Settle a payout whose outcome was unknown
+
+        Pass the withdrawal's result if it was created, or None if it was
+        not, which lets the payout be sent again.
+        """
+        status = SENT if result is not None else FAILED
+        self.record(PayoutResult(key, status, result, None))
+
+    def status(self, key: str):
+        """
+        Get the recorded status of a key, or None
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status FROM payouts WHERE key = ?",
+                (key, )).fetchone()
+        return row[0] if row is not None else None
+
+    def close(self):
+        """
+        Close the database
+        """
+        with self._lock:
+            self._db.close()
+
+
+class _StatusRecorder:
+    """
+    Request listener remembering the HTTP status of the last
+    create_mass_withdrawal sent by each thread
+    """
+
+    def __init__(self):
+        """
+        Initialize!
+        """
+        self._local = threading.local()
+
+    def __call__(self, event):
+        if event.cmd == "create_mass_withdrawal":
+            self._local.status = event.status
+
+    def pop(self):
+        """
+        Get and forget the calling thread's last status, or None
+        """
+        status = getattr(self._local, "status", None)
+        self._local.status = None
+        return status
+
+
+class PayoutEngine:
+    """
+    Sends streams of payouts with bounded concurrency
+
+    Payouts are grouped into create_mass_withdrawal calls of up to
+    `batch_size` withdrawals, at most `max_workers` calls at a time.  If a
+    mass withdrawal call is refused by the API as a whole (an error in a
+    2xx response), nothing was created, so its payouts are sent with
+    parallel create_withdrawal calls instead.  A call that fails in transit,
+    gets an error in any other response or fails with any error other than
+    the circuit breaker or rate limiter refusing it is never resent, since
+    its withdrawals may have been created: its payouts are reported UNKNOWN
+    and stay reserved in the ledger.  The HTTP status is read through a
+    request listener, so a client without `add_listener` never falls back.
+    With `use_mass` False every payout is sent with create_withdrawal.
+    """
+
+    def __init__(
+            self,
+            client,
+            ledger: PayoutLedger = None,
+            batch_size: int = 50,
+            max_workers: int = 4,
+            use_mass: bool = True,
+    ):
+        """
+        Initialize!
+        """
+        self.client = client
+        if ledger is None:
+            ledger = PayoutLedger()
+        self.ledger = ledger
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.use_mass = use_mass
+
+    def _finish(self, results: list):
+        for result in results:
+            self.ledger.record(result)
+        return results
+
+    def _send_one(self, key: str, params: dict):
+        """
+        Send one payout with create_withdrawal
+
+        Returns a list with its PayoutResult
+        """
+        try:
+            response = self.client.create_withdrawal(dict(params))
+        except NOT_SENT_ERRORS as exception:
+            return self._finish([PayoutResult(key, FAILED, None, exception)])
+        except UNCERTAIN_ERRORS as exception:
+            return self._finish([PayoutResult(key, UNKNOWN, None, exception)])
+        except Exception as exception:  # pylint: disable=broad-except
+            return self._finish([PayoutResult(key, FAILED, None, exception)])
+        if response.get("error") != "ok":
+            return self._finish([PayoutResult(
+                key, FAILED, None, CoinPaymentsError(response.get("error")))])
+        return self._finish([
+            PayoutResult(key, SENT, response.get("result"), None)])
+
+    def _send_mass(self, batch: list, statuses: _StatusRecorder):
+        """
+        Send a batch of (key, params) with create_mass_withdrawal
+
+        Returns a tuple of:
+            - list of PayoutResults
+            - list of (key, params) to send one by one instead
+        """
+        statuses.pop()
+        try:
+            response = self.client.create_mass_withdrawal(
+                encode_mass_withdrawal([params for _, params in batch]))
+        except NOT_SENT_ERRORS as exception:
+            return self._finish([
+                PayoutResult(key, FAILED, None, exception)
+                for key, _ in batch]), []
+        except UNCERTAIN_ERRORS as exception:
+            return self._finish([
+                PayoutResult(key, UNKNOWN, None, exception)
+                for key, _ in batch]), []
+        except Exception as exception:  # pylint: disable=broad-except
+            return self._finish([
+                PayoutResult(key, FAILED, None, exception)
+                for key, _ in batch]), []
+        status = statuses.pop()
+        if response.get("error") != "ok":
+            if status is not None and 200 <= status < 300:
+                return [], batch
+            error = CoinPaymentsError(response.get("error"))
+            return self._finish([
+                PayoutResult(key, UNKNOWN, None, error)
+                for key, _ in batch]), []
+
+        results = []
+        items = response.get("result") or {}
+        for number, (key, _) in enumerate(batch, 1):
+            item = items.get("wd{}".format(number))
+            if item is None:
+                results.append(PayoutResult(key, UNKNOWN, None,
+                                            CoinPaymentsError("No result")))
+            elif item.get("error", "ok") != "ok":
+                results.append(PayoutResult(
+                    key, FAILED, None, CoinPaymentsError(item["error"])))
+            else:
+                results.append(PayoutResult(key, SENT, item, None))
+        return self._finish(results), []
+
+    def _send(self, batch: list, statuses: _StatusRecorder):
+        if self.use_mass and len(batch) > 1:
+            return self._send_mass(batch, statuses)
+        key, params = batch[0]
+        return self._send_one(key, params), []
+
+    def _batches(self, payouts, skipped: collections.deque):
+        """
+        Reserve payouts and group the reserved ones into batches
+
+        Payouts that cannot be reserved are appended to skipped.
+        """
+        batch_size = self.batch_size if self.use_mass else 1
+        batch = []
+        for key, params in payouts:
+            previous = self.ledger.reserve(key)
+            if previous is not None:
+                skipped.append(previous)
+                continue
+            batch.append((key, params))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def iter_pay(self, payouts):
+        """
+        Send payouts, yielding a PayoutResult for each as it completes
+
+        `payouts` is any iterable of (idempotency key, create_withdrawal
+        params) tuples and is consumed as capacity frees up.
+        """
+        skipped = collections.deque()
+        batches = self._batches(payouts, skipped)
+        statuses = _StatusRecorder()
+        if self.use_mass and hasattr(self.client, "add_listener"):
+            self.client.add_listener(statuses)
+        try:
+            with concurrent.futures.ThreadPoolExecutor(
+                    self.max_workers) as executor:
+                pending = {
+                    executor.submit(self._send, batch, statuses)
+                    for batch in itertools.islice(batches, self.max_workers)
+                }
+                while skipped:
+                    yield skipped.popleft()
+                while pending:
+                    done, pending = concurrent.futures.wait(
+                        pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        results, fallback = future.result()
+                        for payout in fallback:
+                            pending.add(executor.submit(
+                                self._send, [payout], statuses))
+                        for batch in itertools.islice(batches, 1):
+                            pending.add(executor.submit(
+                                self._send, batch, statuses))
+                        while skipped:
+                            yield skipped.popleft()
+                        for result in results:
+                            yield result
+        finally:
+            if self.use_mass and hasattr(self.client, "add_listener"):
+                self.client.remove_listener(statuses)
+
+    def pay(self, payouts):
+        """
+        Send payouts and get the list of their PayoutResults
+        """
+        return list(self.iter_pay(payouts))
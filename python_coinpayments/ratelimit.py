@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""
+Client-side rate limiting and prioritisation of API calls
+"""
+import asyncio
+import bisect
+import itertools
+import threading
+import time
+
+from python_coinpayments.exceptions import RateLimitTimeout
+
+# lower priorities are served first
+PRIORITY_CRITICAL = 0
+PRIORITY_NORMAL = 50
+PRIORITY_BACKGROUND = 100
+
+DEFAULT_PRIORITIES = {
+    "create_transaction": PRIORITY_CRITICAL,
+    "get_callback_address": PRIORITY_CRITICAL,
+    "rates": PRIORITY_CRITICAL,
+    "get_tx_ids": PRIORITY_BACKGROUND,
+    "get_tx_info_multi": PRIORITY_BACKGROUND,
+    "get_withdrawal_history": PRIORITY_BACKGROUND,
+}
+
+# how often an asyncio waiter that is queued behind others checks again
+_ASYNC_POLL_INTERVAL = 0.005
+
+
+class TokenBucket:
+    """
+    Token bucket allowing `rate` calls per second on average and bursts of
+    up to `burst` calls
+
+    Not thread-safe on its own; RateLimiter guards its buckets with a lock.
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        """
+        Initialize!
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, int(rate))
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        """
+        Add the tokens accrued since the last refill
+        """
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """
+        Seconds until a token is available, as of the last refill
+        """
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Waiter:  # pylint: disable=too-few-public-methods
+    """
+    A call queued for the rate limiter
+    """
+    __slots__ = ("order", "key", "cmd", "buckets")
+
+    def __init__(self, order: tuple, key: str, cmd: str, buckets: list):
+        self.order = order
+        self.key = key
+        self.cmd = cmd
+        self.buckets = buckets
+
+    def __lt__(self, other):
+        return self.order < other.order
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket rate limiter with a priority queue
+
+    Each API key gets a bucket allowing `rate` calls per second (with bursts
+    of `burst` calls); `key_limits` overrides that for specific keys, as a
+    mapping of key to (rate, burst).  `command_limits` adds a (rate, burst)
+    bucket per key for specific commands.
+
+    When calls have to wait, the one with the lowest priority number goes
+    first, so checkout-critical commands are not stuck behind background
+    polling.  Priorities come from `priorities`, a mapping of command to
+    priority, and default to `DEFAULT_PRIORITIES`.
+    """
+
+    def __init__(
+            self,
+            rate: float = 5,
+            burst: int = None,
+            key_limits: dict = None,
+            command_limits: dict = None,
+            priorities: dict = None,
+            default_priority: int = PRIORITY_NORMAL,
+    ):
+        """
+        Initialize!
+        """
+        self.rate = rate
+        self.burst = burst
+        self.key_limits = dict(key_limits or {})
+        self.command_limits = dict(command_limits or {})
+        self.priorities = dict(
+            DEFAULT_PRIORITIES if priorities is None else priorities)
+        self.default_priority = default_priority
+        self._buckets = {}
+        self._waiters = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._metrics = {
+            "acquired": 0,
+            "timeouts": 0,
+            "max_queue_depth": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+        self._command_metrics = {}
+
+    def _get_buckets(self, key: str, cmd: str):
+        """
+        Get the buckets a call has to take a token from
+        """
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(
+                *self.key_limits.get(key, (self.rate, self.burst)))
+        buckets = [bucket]
+        if cmd in self.command_limits:
+            cmd_bucket = self._buckets.get((key, cmd))
+            if cmd_bucket is None:
+                cmd_bucket = self._buckets[(key, cmd)] = TokenBucket(
+                    *self.command_limits[cmd])
+            buckets.append(cmd_bucket)
+        return buckets
+
+    @staticmethod
+    def _ready(waiter: _Waiter, now: float):
+        """
+        Whether all of a waiter's buckets have a token
+        """
+        for bucket in waiter.buckets:
+            bucket.refill(now)
+        return all(bucket.tokens >= 1 for bucket in waiter.buckets)
+
+    def _try_take(self, waiter: _Waiter):
+        """
+        Take tokens for waiter if it is its turn
+
+        Must be called with the lock held.  Returns None once the tokens are
+        taken, otherwise the number of seconds to wait before trying again
+        (0 meaning "until another waiter goes").
+        """
+        now = time.monotonic()
+        for other in self._waiters:
+            if other is waiter:
+                break
+            if other.key == waiter.key and self._ready(other, now):
+                # a more urgent call for the same key can go first
+                return 0
+        if not self._ready(waiter, now):
+            return max(bucket.wait_time() for bucket in waiter.buckets)
+        for bucket in waiter.buckets:
+            bucket.tokens -= 1
+        self._waiters.remove(waiter)
+        return None
+
+    def _enqueue(self, key: str, cmd: str, priority: int = None):
+        """
+        Queue a call, must be called with the lock held
+        """
+        if priority is None:
+            priority = self.priorities.get(cmd, self.default_priority)
+        waiter = _Waiter(
+            (priority, next(self._counter)), key, cmd,
+            self._get_buckets(key, cmd))
+        bisect.insort(self._waiters, waiter)
+        self._metrics["max_queue_depth"] = max(
+            self._metrics["max_queue_depth"], len(self._waiters))
+        return waiter
+
+    def _record(self, cmd: str, waited: float):
+        """
+        Record a call that got its tokens, must be called with the lock held
+        """
+        for metrics in (self._metrics, self._command_metrics.setdefault(
+                cmd, {"acquired": 0, "wait_time_total": 0.0,
+                      "wait_time_max": 0.0})):
+            metrics["acquired"] += 1
+            metrics["wait_time_total"] += waited
+            metrics["wait_time_max"] = max(metrics["wait_time_max"], waited)
+
+    def _give_up(self, waiter: _Waiter):
+        """
+        Remove a waiter that will not take its tokens, with the lock held
+        """
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        self._condition.notify_all()
+
+    def acquire(
+            self,
+            key: str,
+            cmd: str,
+            priority: int = None,
+            timeout: float = None,
+    ):
+        """
+        Block until a call of cmd with key may be made
+
+        Raises RateLimitTimeout if that takes longer than `timeout` seconds.
+        Returns the number of seconds waited.
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._condition:
+            waiter = self._enqueue(key, cmd, priority)
+            try:
+                while True:
+                    wait = self._try_take(waiter)
+                    if wait is None:
+                        break
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._metrics["timeouts"] += 1
+                            raise RateLimitTimeout(
+                                "Waited more than {}s for {}".format(
+                                    timeout, cmd))
+                        wait = min(wait, remaining) if wait else remaining
+                    self._condition.wait(wait or None)
+            except BaseException:
+                self._give_up(waiter)
+                raise
+            waited = time.monotonic() - start
+            self._record(cmd, waited)
+            # the next waiter in line may be able to go now
+            self._condition.notify_all()
+        return waited
+
+    async def acquire_async(
+            self,
+            key: str,
+            cmd: str,
+            priority: int = None,
+            timeout: float = None,
+    ):
+        """
+        Wait, without blocking the event loop, until a call may be made
+
+        The asyncio counterpart of `acquire`.
+        """
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        with self._lock:
+            waiter = self._enqueue(key, cmd, priority)
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_take(waiter)
+                    if wait is None:
+                        waited = time.monotonic() - start
+                        self._record(cmd, waited)
+                        self._condition.notify_all()
+                        return waited
+                wait = wait or _ASYNC_POLL_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        with self._lock:
+                            self._metrics["timeouts"] += 1
+                        raise RateLimitTimeout(
+                            "Waited more than {}s for {}".format(
+                                timeout, cmd))
+                    wait = min(wait, remaining)
+                await asyncio.sleep(wait)
+        except BaseException:
+            with self._lock:
+                self._give_up(waiter)
+            raise
+
+    def metrics(self):
+        """
+        Get queue depth and wait time metrics
+
+        Wait times are in seconds; `commands` has the per command figures.
+        """
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["queue_depth"] = len(self._waiters)
+            metrics["commands"] = {
+                cmd: dict(values)
+                for cmd, values in self._command_metrics.items()
+            }
+        return metrics
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Indexed exchange rates for fast currency conversion
+"""
+import array
+import math
+from decimal import ROUND_HALF_UP, Decimal
+
+from python_coinpayments.exceptions import CoinPaymentsError
+from python_coinpayments.models import to_decimal
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+class RatesSnapshot:
+    """
+    Exchange rates from a rates() response, indexed for conversion
+
+    Every coin gets a fixed index into an array of its BTC rate, kept both
+    as Decimal (for exact conversion) and as a float array (for vectorised
+    conversion with NumPy).  `update` applies a newer rates() response in
+    place: only the rates that changed are touched and new coins are
+    appended, so existing indexes stay valid.
+    """
+
+    def __init__(self, response: dict = None):
+        """
+        Initialize, optionally from a rates() response
+        """
+        self.coins = []
+        self.version = 0
+        self._index = {}
+        self._rates = []
+        self._floats = array.array("d")
+        if response is not None:
+            self.update(response)
+
+    @classmethod
+    def from_client(cls, client):
+        """
+        Get a snapshot of the current rates
+        """
+        return cls(client.rates())
+
+    def refresh(self, client):
+        """
+        Update from the current rates; returns the coins that changed
+        """
+        return self.update(client.rates())
+
+    def update(self, response: dict):
+        """
+        Apply a rates() response
+
+        Coins missing from the response, or whose rate is not a valid
+        number, lose their rate.  Returns the set of coins whose rate
+        changed.
+        """
+        if response.get("error") != "ok":
+            raise CoinPaymentsError(response.get("error"))
+        result = response.get("result") or {}
+        changed = set()
+        for coin, info in result.items():
+            try:
+                rate = to_decimal(info.get("rate_btc"))
+            except (ArithmeticError, TypeError, ValueError):
+                rate = None
+            if not rate or not rate.is_finite():
+                # a zero rate cannot be converted from or to
+                rate = None
+            index = self._index.get(coin)
+            if index is None:
+                self._index[coin] = len(self.coins)
+                self.coins.append(coin)
+                self._rates.append(rate)
+                self._floats.append(
+                    float(rate) if rate is not None else math.nan)
+                changed.add(coin)
+            elif self._rates[index] != rate:
+                self._rates[index] = rate
+                self._floats[index] = \
+                    float(rate) if rate is not None else math.nan
+                changed.add(coin)
+        for coin in set(self._index) - set(result):
+            index = self._index[coin]
+            if self._rates[index] is not None:
+                self._rates[index] = None
+                self._floats[index] = math.nan
+                changed.add(coin)
+        if changed:
+            self.version += 1
+        return changed
+
+    def __contains__(self, coin: str):
+        index = self._index.get(coin)
+        return index is not None and self._rates[index] is not None
+
+    def __len__(self):
+        return len(self.coins)
+
+    def index(self, coin: str):
+        """
+        Get the index of coin, raising KeyError if it has no rate
+        """
+        index = self._index.get(coin)
+        if index is None or self._rates[index] is None:
+            raise KeyError("No rate for {}".format(coin))
+        return index
+
+    def rate(self, from_coin: str, to_coin: str):
+        """
+        Get the price of one from_coin in to_coin, as a Decimal
+        """
+        return self._rates[self.index(from_coin)] / \
+            self._rates[self.index(to_coin)]
+
+    def convert(
+            self,
+            amount,
+            from_coin: str,
+            to_coin: str,
+            places: int = 8,
+            rounding: str = ROUND_HALF_UP,
+    ):
+        """
+        Convert amount from from_coin to to_coin, rounded to places
+        """
+        return self.convert_many(
+            [(amount, from_coin, to_coin)], places=places,
+            rounding=rounding)[0]
+
+    def convert_many(
+            self,
+            conversions,
+            places: int = 8,
+            rounding: str = ROUND_HALF_UP,
+            use_numpy: bool = False,
+    ):
+        """
+        Convert many (amount, from_coin, to_coin) triples in one call
+
+        Returns a list of Decimals rounded to `places` decimal places.  By
+        default the conversion is done in Decimal, computing the rate of
+        each currency pair once.  With `use_numpy` (NumPy must be installed)
+        it is vectorised in float64 and only the results are turned into
+        Decimal, which is much faster for large batches but limited to
+        float precision (about 15 significant digits).
+        """
+        quantum = Decimal(1).scaleb(-places)
+        conversions = list(conversions)
+        if use_numpy:
+            return self._convert_many_numpy(conversions, quantum, rounding)
+
+        pair_rates = {}
+        converted = []
+        for amount, from_coin, to_coin in conversions:
+            pair = (from_coin, to_coin)
+            rate = pair_rates.get(pair)
+            if rate is None:
+                rate = pair_rates[pair] = self.rate(from_coin, to_coin)
+            converted.append(
+                (to_decimal(amount) * rate).quantize(quantum, rounding))
+        return converted
+
+    def _convert_many_numpy(self, conversions, quantum, rounding):
+        """
+        Vectorised convert_many
+        """
+        if numpy is None:
+            raise ImportError("use_numpy needs NumPy to be installed")
+        if not conversions:
+            return []
+        amounts, from_coins, to_coins = zip(*conversions)
+        rates = numpy.frombuffer(self._floats, dtype=numpy.float64)
+        from_index = numpy.fromiter(
+            (self.index(coin) for coin in from_coins), dtype=numpy.intp,
+            count=len(conversions))
+        to_index = numpy.fromiter(
+            (self.index(coin) for coin in to_coins), dtype=numpy.intp,
+            count=len(conversions))
+        values = numpy.asarray(amounts, dtype=numpy.float64) * \
+            rates[from_index] / rates[to_index]
+        return [
+            Decimal(repr(value)).quantize(quantum, rounding)
+            for value in values.tolist()
+        ]
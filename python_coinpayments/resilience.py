@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Deadlines, retries and circuit breaking for API calls
+"""
+import http.client
+import random
+import threading
+import time
+
+from python_coinpayments.commands import READ_ONLY_COMMANDS
+from python_coinpayments.exceptions import CircuitOpenError
+
+# (connect, read) timeouts in seconds used when none are configured
+DEFAULT_TIMEOUT = (10.0, 60.0)
+
+# errors raised by transports when the API could not be reached or did not
+# answer in time
+TRANSPORT_ERRORS = (OSError, http.client.HTTPException)
+
+
+def split_timeout(timeout):
+    """
+    Split a timeout into (connect, read) timeouts
+
+    A timeout can be a number of seconds used for both, a (connect, read)
+    tuple, or None for no timeout.
+    """
+    if isinstance(timeout, (tuple, list)):
+        return tuple(timeout)
+    return timeout, timeout
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff for idempotent commands
+
+    Calls of `commands` (by default the read-only commands) that fail with a
+    transport error or a 5xx response are tried up to `max_attempts` times
+    in total.  Before retry n the client sleeps for a random time between 0
+    and min(`max_backoff`, `backoff` * 2 ** n) seconds ("full jitter"), so
+    clients retrying at the same time spread out.
+    """
+
+    def __init__(
+            self,
+            max_attempts: int = 3,
+            backoff: float = 0.1,
+            max_backoff: float = 2.0,
+            commands=READ_ONLY_COMMANDS,
+    ):
+        """
+        Initialize!
+        """
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.commands = frozenset(commands)
+
+    def delay(self, cmd: str, attempt: int):
+        """
+        Get the seconds to wait before retrying a failed attempt
+
+        `attempt` counts from 0.  Returns None if the call should not be
+        retried.
+        """
+        if cmd not in self.commands or attempt + 1 >= self.max_attempts:
+            return None
+        return random.uniform(
+            0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker
+
+    After `failure_threshold` consecutive failures the circuit opens and
+    calls fail fast with CircuitOpenError.  Once `reset_timeout` seconds
+    have passed one trial call is let through (half open): if it succeeds
+    the circuit closes, otherwise it opens again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        """
+        Initialize!
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """
+        Check that a call may be made, raising CircuitOpenError if not
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.OPEN:
+                retry_in = self.opened_at + self.reset_timeout - \
+                    time.monotonic()
+                if retry_in > 0:
+                    raise CircuitOpenError(
+                        "Circuit open, retry in {:.1f}s".format(retry_in))
+                self.state = self.HALF_OPEN
+            if self._trial_in_flight:
+                raise CircuitOpenError("Circuit half open, trial in flight")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        """
+        Record a successful call
+        """
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_abandoned(self):
+        """
+        Record a call that ended without telling if the API is healthy
+        """
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        """
+        Record a failed call
+        """
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if (self.state == self.HALF_OPEN
+                    or self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of identical in-flight calls
+"""
+import asyncio
+import threading
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    """
+    An in-flight call that other callers are waiting on
+    """
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Lets concurrent threads making the same call share one execution
+
+    The first caller for a key runs the call; callers arriving with the same
+    key while it is in flight wait for it and get the same result (or
+    exception).  Once the call finishes the next caller runs it again.
+    """
+
+    def __init__(self):
+        """
+        Initialize!
+        """
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        """
+        Run func(*args), or wait for the in-flight call with the same key
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+        except BaseException as exception:
+            call.error = exception
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """
+    Lets concurrent tasks making the same call share one execution
+
+    The asyncio counterpart of `SingleFlight`.  The shared call runs in its
+    own task, so cancelling one of the waiting callers does not cancel it
+    for the others.
+    """
+
+    def __init__(self):
+        """
+        Initialize!
+        """
+        self._calls = {}
+
+    async def do(self, key, func, *args):
+        """
+        Await func(*args), or the in-flight call with the same key
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._calls)
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+"""
+Persistent store of transaction, withdrawal and conversion results that
+will not change any more
+"""
+import json
+import sqlite3
+import threading
+import time
+
+from python_coinpayments.decoders import stdlib_decoder
+from python_coinpayments.tracker import STATUS_COMPLETE, parse_status
+
+# SQLite allows 999 variables per statement in older versions
+_MAX_VARIABLES = 500
+
+
+def is_final_tx(status: int):
+    """
+    Whether a transaction status will not change any more
+
+    100 or above is complete and negative statuses are cancelled or timed
+    out.  Unlike for tracking, 2 (queued for payout) is not final: it still
+    becomes complete.
+    """
+    return status is not None and (status < 0 or status >= STATUS_COMPLETE)
+
+
+def is_final_transfer(status: int):
+    """
+    Whether a withdrawal or conversion status will not change any more
+
+    2 is complete and negative statuses are failures.
+    """
+    return status is not None and (status < 0 or status == 2)
+
+
+# command: (kind, ID param, whether the param holds many |-separated IDs)
+COMMANDS = {
+    "get_tx_info": ("tx", "txid", False),
+    "get_tx_info_multi": ("tx", "txid", True),
+    "get_withdrawal_info": ("withdrawal", "id", False),
+    "get_conversion_info": ("conversion", "id", False),
+}
+
+FINAL_STATUS = {
+    "tx": is_final_tx,
+    "withdrawal": is_final_transfer,
+    "conversion": is_final_transfer,
+}
+
+
+class FinalResultStore:
+    """
+    Thread-safe SQLite store of final results
+
+    Pass one to the client as `store` and get_tx_info, get_tx_info_multi,
+    get_withdrawal_info and get_conversion_info are answered from it when
+    they can; only IDs without a stored result are sent to the API.  Only
+    results in a final status (complete, cancelled, failed, ...) are stored,
+    since those never change.
+
+    The database is opened in WAL mode.  Results stored more than `max_age`
+    seconds ago, and the oldest results beyond `max_entries`, are evicted
+    every `compact_every` writes and by `compact`.
+
+    `decoder` turns stored results back into objects and should be the
+    client's decoder.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            max_entries: int = None,
+            max_age: float = None,
+            compact_every: int = 1000,
+            decoder=None,
+    ):
+        """
+        Initialize!
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.compact_every = compact_every
+        if decoder is None:
+            decoder = stdlib_decoder
+        self.decoder = decoder
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " kind TEXT NOT NULL,"
+            " id TEXT NOT NULL,"
+            " result BLOB NOT NULL,"
+            " stored_at REAL NOT NULL,"
+            " PRIMARY KEY (kind, id))")
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS results_stored_at"
+            " ON results (stored_at)")
+
+    def get_many(self, kind: str, ids):
+        """
+        Get the stored results for many IDs of one kind
+
+        Returns a dict of ID to result for the IDs that were found.
+        """
+        ids = list(ids)
+        rows = []
+        with self._lock:
+            for start in range(0, len(ids), _MAX_VARIABLES):
+                chunk = ids[start:start + _MAX_VARIABLES]
+                rows.extend(self._db.execute(
+                    "SELECT id, result FROM results"
+                    " WHERE kind = ? AND id IN ({})".format(
+                        ",".join("?" * len(chunk))),
+                    [kind] + chunk))
+        return {id_: self.decoder(result) for id_, result in rows}
+
+    def get(self, kind: str, id_: str):
+        """
+        Get the stored result for an ID, or None
+        """
+        return self.get_many(kind, [id_]).get(id_)
+
+    def put_many(self, kind: str, results: dict):
+        """
+        Store the final ones of many results of one kind
+
+        `results` maps IDs to results.  Returns the number stored.
+        """
+        final = FINAL_STATUS[kind]
+        now = time.time()
+        rows = [
+            (kind, id_, json.dumps(result, default=str).encode("utf-8"), now)
+            for id_, result in results.items()
+            if final(parse_status(result))
+        ]
+        if not rows:
+            return 0
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    rows)
+            self._writes += len(rows)
+            if self._writes >= self.compact_every:
+                self._evict()
+        return len(rows)
+
+    def _evict(self):
+        """
+        Apply the eviction policy, under the lock
+        """
+        self._writes = 0
+        removed = 0
+        if self.max_age is not None:
+            removed += self._db.execute(
+                "DELETE FROM results WHERE stored_at < ?",
+                (time.time() - self.max_age, )).rowcount
+        if self.max_entries is not None:
+            removed += self._db.execute(
+                "DELETE FROM results WHERE rowid IN ("
+                " SELECT rowid FROM results"
+                " ORDER BY stored_at DESC, rowid DESC"
+                " LIMIT -1 OFFSET ?)", (self.max_entries, )).rowcount
+        return removed
+
+    def evict(self):
+        """
+        Evict expired and excess results; returns the number evicted
+        """
+        with self._lock:
+            return self._evict()
+
+    def compact(self):
+        """
+        Evict, then shrink the database and its write-ahead log
+        """
+        with self._lock:
+            self._evict()
+            self._db.execute("VACUUM")
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def clear(self):
+        """
+        Remove every stored result
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM results")
+
+    def close(self):
+        """
+        Close the database
+        """
+        with self._lock:
+            self._db.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM results").fetchone()[0]
+
+    @staticmethod
+    def stores(params: dict):
+        """
+        Whether the request with params can be answered from the store
+        """
+        # full=1 asks for checkout and shipping info too
+        return params.get("cmd") in COMMANDS and not params.get("full")
+
+    def lookup(self, params: dict):
+        """
+        Look up the IDs requested by params
+
+        Returns a tuple of:
+            - dict of ID to stored result
+            - params to request the other IDs with, or None if all were
+              found
+        """
+        kind, name, multi = COMMANDS[params["cmd"]]
+        ids = str(params.get(name, ""))
+        ids = ids.split("|") if multi else [ids]
+        hits = self.get_many(kind, ids)
+        missing = [id_ for id_ in ids if id_ not in hits]
+        if not missing:
+            return hits, None
+        if len(missing) < len(ids):
+            params = dict(params, **{name: "|".join(missing)})
+        return hits, params
+
+    def respond(self, params: dict, hits: dict, response: dict = None):
+        """
+        Store the final results of response and merge in the stored hits
+
+        `params` are the params originally requested and `response` the
+        answer to the params returned by `lookup`, if any.  Returns the
+        response to the original request.
+        """
+        kind, name, multi = COMMANDS[params["cmd"]]
+        if response is not None and response.get("error") != "ok":
+            return response
+        fetched = (response or {}).get("result") or {}
+
+        if not multi:
+            if response is None:
+                return {"error": "ok", "result": hits[str(params[name])]}
+            self.put_many(kind, {str(params[name]): fetched})
+            return response
+
+        # entries carry their own error field, which is not stored
+        self.put_many(kind, {
+            id_: {
+                field: value for field, value in result.items()
+                if field != "error"
+            }
+            for id_, result in fetched.items()
+            if result.get("error", "ok") == "ok"
+        })
+        results = {}
+        for id_ in str(params[name]).split("|"):
+            if id_ in hits:
+                results[id_] = dict(hits[id_], error="ok")
+            elif id_ in fetched:
+                results[id_] = fetched[id_]
+        return {"error": "ok", "result": results}
@@ -0,0 +1,301 @@
+# -*- coding: utf-8 -*-
+"""
+Tracking of transaction status with adaptive polling
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from python_coinpayments.bulk import TX_INFO_MULTI_LIMIT
+
+# payment statuses, see https://www.coinpayments.net/merchant-tools-ipn
+STATUS_WAITING = 0
+STATUS_CONFIRMING = 1
+STATUS_QUEUED = 2
+STATUS_COMPLETE = 100
+
+
+def parse_status(result: dict):
+    """
+    Get the status of a result or IPN as an int, or None if it has none
+    """
+    try:
+        return int(result["status"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def is_final(status: int):
+    """
+    Whether a payment status will not change any more
+
+    Negative statuses are cancelled or timed out payments; 2 (queued for
+    payout) and 100 or above count as complete.
+    """
+    return status is not None and (
+        status < 0 or status == STATUS_QUEUED or status >= STATUS_COMPLETE)
+
+
+class _Tracked:  # pylint: disable=too-few-public-methods
+    """
+    A transaction being tracked
+    """
+    __slots__ = ("status", "since", "due", "updated")
+
+    def __init__(self, status: int, since: float, due: float):
+        self.status = status
+        self.since = since
+        self.due = due
+        self.updated = since
+
+
+class TransactionTracker:
+    """
+    Follows the status of transactions until they are final
+
+    Transactions are registered with `track` and polled with batched
+    get_tx_info_multi calls, each only when it is due.  The poll interval
+    depends on the status and age of the transaction: payments with coins
+    received are polled every `min_interval` seconds, while payments still
+    waiting for funds are polled less often as they get older, up to
+    `max_interval`.  Transactions are dropped once their status is final.
+
+    `on_change(txn_id, old_status, new_status, info)` is called for each
+    status change, outside of the tracker's lock.  IPNs given to `feed_ipn`
+    count as a poll, so transactions with working IPNs are rarely polled.
+
+    All methods are thread-safe; `run` polls in a loop, typically on its own
+    thread.
+    """
+
+    def __init__(
+            self,
+            client,
+            on_change=None,
+            min_interval: float = 15.0,
+            max_interval: float = 300.0,
+            age_factor: float = 0.1,
+            max_workers: int = 1,
+            clock=time.monotonic,
+    ):
+        """
+        Initialize!
+        """
+        self.client = client
+        self.on_change = on_change
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.age_factor = age_factor
+        self.max_workers = max_workers
+        self.clock = clock
+        self._tracked = {}
+        self._queue = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def interval(self, status: int, age: float):
+        """
+        Seconds until a transaction with status and age is polled again
+        """
+        if status is not None and status > STATUS_WAITING:
+            return self.min_interval
+        return min(self.max_interval,
+                   max(self.min_interval, age * self.age_factor))
+
+    def _schedule(self, txn_id: str, tracked: _Tracked, now: float):
+        tracked.due = now + self.interval(tracked.status, now - tracked.since)
+        heapq.heappush(
+            self._queue, (tracked.due, next(self._counter), txn_id))
+
+    def track(self, txn_id: str, status: int = None, age: float = 0.0):
+        """
+        Start tracking a transaction
+
+        `status` is its last known status, if any, and `age` how many
+        seconds ago it was created.  Transactions with a final status are
+        not tracked.  The first poll happens right away unless a status is
+        given.
+        """
+        if is_final(status):
+            return
+        with self._lock:
+            if txn_id in self._tracked:
+                return
+            now = self.clock()
+            tracked = self._tracked[txn_id] = _Tracked(status, now - age, now)
+            if status is None:
+                heapq.heappush(
+                    self._queue, (now, next(self._counter), txn_id))
+            else:
+                self._schedule(txn_id, tracked, now)
+        self._wakeup.set()
+
+    def untrack(self, txn_id: str):
+        """
+        Stop tracking a transaction
+        """
+        with self._lock:
+            # its queue entry is skipped when it comes up
+            self._tracked.pop(txn_id, None)
+
+    def __contains__(self, txn_id: str):
+        return txn_id in self._tracked
+
+    def __len__(self):
+        return len(self._tracked)
+
+    def status(self, txn_id: str):
+        """
+        Get the last known status of a tracked transaction
+        """
+        return self._tracked[txn_id].status
+
+    def _update(self, txn_id: str, status: int, info, now: float,
+                since: float):
+        """
+        Record the status of a transaction, under the lock
+
+        Updates older than `since` are ignored.  Returns the change as an
+        (txn_id, old_status, new_status, info) tuple, or None.
+        """
+        tracked = self._tracked.get(txn_id)
+        if tracked is None or tracked.updated > since:
+            return None
+        old_status = tracked.status
+        tracked.updated = now
+        if is_final(status):
+            del self._tracked[txn_id]
+        else:
+            tracked.status = status
+            self._schedule(txn_id, tracked, now)
+        if status == old_status:
+            return None
+        return txn_id, old_status, status, info
+
+    def _notify(self, changes):
+        if self.on_change is None:
+            return
+        for txn_id, old_status, new_status, info in changes:
+            self.on_change(txn_id, old_status, new_status, info)
+
+    def feed_ipn(self, http_post: dict):
+        """
+        Apply an authenticated IPN to the tracked transactions
+
+        The IPN counts as a poll of its transaction.  Returns whether it
+        was applied: IPNs of untracked transactions, or without a valid
+        status, are ignored.
+        """
+        txn_id = http_post.get("txn_id")
+        status = parse_status(http_post)
+        if txn_id is None or status is None:
+            return False
+        with self._lock:
+            if txn_id not in self._tracked:
+                return False
+            now = self.clock()
+            change = self._update(txn_id, status, http_post, now, now)
+        if change:
+            self._notify([change])
+        return True
+
+    def _pop_due(self, now: float):
+        """
+        Take the IDs of the transactions due for a poll
+        """
+        due = []
+        with self._lock:
+            queue = self._queue
+            while queue and queue[0][0] <= now:
+                when, _, txn_id = heapq.heappop(queue)
+                tracked = self._tracked.get(txn_id)
+                # skip entries superseded by a reschedule or untrack
+                if tracked is not None and tracked.due == when:
+                    due.append(txn_id)
+        return due
+
+    def poll(self):
+        """
+        Poll the transactions that are due
+
+        Returns the set of transaction IDs whose status changed.
+        """
+        started = self.clock()
+        due = self._pop_due(started)
+        if not due:
+            return set()
+        results, _ = self.client.get_tx_info_bulk(
+            due, max_workers=self.max_workers,
+            chunk_size=TX_INFO_MULTI_LIMIT)
+
+        changes = []
+        with self._lock:
+            now = self.clock()
+            for txn_id in due:
+                info = results.get(txn_id)
+                status = None
+                if info is not None and info.get("error", "ok") == "ok":
+                    status = parse_status(info)
+                if status is None:
+                    # failed lookups, and results without a valid status,
+                    # are retried at the usual interval
+                    tracked = self._tracked.get(txn_id)
+                    if tracked is not None and tracked.updated <= started:
+                        self._schedule(txn_id, tracked, now)
+                    continue
+                change = self._update(txn_id, status, info, now, started)
+                if change:
+                    changes.append(change)
+        self._notify(changes)
+        return {change[0] for change in changes}
+
+    def next_poll(self):
+        """
+        Seconds until the next poll is due
+
+        None if nothing is tracked, or if every tracked transaction is being
+        polled right now.
+        """
+        with self._lock:
+            if not self._tracked:
+                return None
+            queue = self._queue
+            while queue and (
+                    queue[0][2] not in self._tracked
+                    or self._tracked[queue[0][2]].due != queue[0][0]):
+                heapq.heappop(queue)
+            if not queue:
+                return None
+            return max(0.0, queue[0][0] - self.clock())
+
+    def run(self, until_empty: bool = False):
+        """
+        Poll as transactions become due, until `stop` is called
+
+        With `until_empty` it also returns once nothing is tracked.
+        """
+        self._stopped = False
+        while not self._stopped:
+            # cleared first so that a track() from now on wakes us up
+            self._wakeup.clear()
+            wait = self.next_poll()
+            if wait is None:
+                with self._lock:
+                    empty = not self._tracked
+                if until_empty and empty:
+                    return
+                wait = self.max_interval
+            if wait > 0:
+                self._wakeup.wait(wait)
+            else:
+                self.poll()
+
+    def stop(self):
+        """
+        Make `run` return
+        """
+        self._stopped = True
+        self._wakeup.set()
@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+"""
+HTTP transports used by the CoinPayments client
+"""
+import builtins
+import collections
+import concurrent.futures
+import http.client
+import json
+import select
+import socket
+import ssl
+import threading
+import time
+import urllib.parse
+
+from python_coinpayments.exceptions import ReplayError
+from python_coinpayments.instrumentation import add_time
+from python_coinpayments.resilience import split_timeout
+
+# errors that mean a kept-alive connection was closed by the server while
+# it sat idle in the pool; they are only safe to retry if they happened
+# while the request was being written, since once it was sent the server
+# may have acted on it
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+def _is_dropped(conn):
+    """
+    Check whether the server closed an idle connection
+
+    An idle connection has nothing to read, so a readable socket means the
+    server closed it (or sent something unexpected).
+    """
+    if conn.sock is None:
+        return True
+    readable, _, _ = select.select([conn.sock], [], [], 0)
+    return bool(readable)
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of persistent HTTP/1.1 connections
+
+    Connections are kept alive between requests and handed out per
+    (scheme, host, port).  At most `maxsize` idle connections are kept per
+    host, connections idle for longer than `idle_timeout` seconds are
+    closed.  Idle connections the server has closed are dropped before
+    they are reused, and a request that cannot be written to a reused
+    connection is retried up to `max_retries` times on a fresh connection.
+    Requests are never resent once they were written, as the server may
+    have acted on them.
+    """
+    # request() records connect, wait and read times into a `timings` dict
+    supports_timings = True
+
+    def __init__(
+            self,
+            maxsize: int = 10,
+            idle_timeout: float = 60.0,
+            max_retries: int = 1,
+            timeout=None,
+            ssl_context: ssl.SSLContext = None,
+    ):
+        """
+        Initialize!
+        """
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _new_connection(
+            self,
+            scheme: str,
+            host: str,
+            port: int,
+            connect_timeout: float = None,
+    ):
+        """
+        Open a new connection
+        """
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(
+                host, port, timeout=connect_timeout,
+                context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(
+                host, port, timeout=connect_timeout)
+        conn.connect()
+        # requests are small and latency bound; do not let Nagle's algorithm
+        # hold back a write while waiting for a delayed ACK
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return conn
+
+    def _get_connection(self, origin: tuple):
+        """
+        Get an idle connection for origin, or None if there is none
+
+        Connections that have been idle for too long are closed on the way.
+        """
+        now = time.monotonic()
+        expired = []
+        conn = None
+        with self._lock:
+            idle = self._idle.get(origin)
+            while idle:
+                candidate, last_used = idle.pop()
+                if now - last_used > self.idle_timeout or \
+                        _is_dropped(candidate):
+                    expired.append(candidate)
+                    continue
+                conn = candidate
+                break
+            # whatever is left at the bottom of the stack is even older
+            while idle and now - idle[0][1] > self.idle_timeout:
+                expired.append(idle.popleft()[0])
+        for stale in expired:
+            stale.close()
+        return conn
+
+    def _put_connection(self, origin: tuple, conn):
+        """
+        Return a connection to the pool, closing it if the pool is full
+        """
+        with self._lock:
+            idle = self._idle.setdefault(origin, collections.deque())
+            if len(idle) < self.maxsize:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def request(
+            self,
+            method: str,
+            url: str,
+            body: bytes = None,
+            headers: dict = None,
+            timeout=None,
+            timings: dict = None,
+    ):
+        """
+        Send a request and read the whole response
+
+        `timeout` is in seconds, either one number or a (connect, read)
+        tuple, and defaults to the pool's timeout.  The read timeout applies
+        to each read from the socket.  If `timings` is given the seconds
+        spent connecting, waiting for the response and reading it are added
+        to it.
+
+        Returns a tuple of:
+            - the HTTP status code
+            - the response body as bytes
+        """
+        parsed = urllib.parse.urlsplit(url)
+        scheme = parsed.scheme or "https"
+        port = parsed.port or (443 if scheme == "https" else 80)
+        origin = (scheme, parsed.hostname, port)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = "{}?{}".format(path, parsed.query)
+
+        connect_timeout, read_timeout = split_timeout(
+            self.timeout if timeout is None else timeout)
+
+        retries = 0
+        while True:
+            conn = self._get_connection(origin)
+            reused = conn is not None
+            if conn is None:
+                start = time.perf_counter()
+                conn = self._new_connection(*origin, connect_timeout)
+                if timings is not None:
+                    add_time(timings, "connect", start)
+            sent = False
+            try:
+                start = time.perf_counter()
+                conn.sock.settimeout(read_timeout)
+                conn.request(method, path, body=body, headers=headers or {})
+                sent = True
+                response = conn.getresponse()
+                if timings is not None:
+                    start = add_time(timings, "wait", start)
+                response_body = response.read()
+                if timings is not None:
+                    add_time(timings, "read", start)
+            except STALE_CONNECTION_ERRORS:
+                conn.close()
+                if sent or not reused or retries >= self.max_retries:
+                    raise
+                retries += 1
+                continue
+            except BaseException:
+                conn.close()
+                raise
+
+            if response.will_close:
+                conn.close()
+            else:
+                self._put_connection(origin, conn)
+            return response.status, response_body
+
+    def clear(self):
+        """
+        Close all idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    close = clear
+
+
+# request params that are never written to a recording
+REDACTED_PARAMS = ("key", )
+REDACTED = "REDACTED"
+
+
+def redact_body(body: bytes, params=REDACTED_PARAMS):
+    """
+    Replace the values of secret params in a form encoded body
+
+    Returns the redacted body as a str
+    """
+    if not body:
+        return ""
+    fields = urllib.parse.parse_qsl(
+        body.decode("utf-8"), keep_blank_values=True)
+    return urllib.parse.urlencode([
+        (name, REDACTED if name in params else value)
+        for name, value in fields
+    ])
+
+
+class RecordingTransport:
+    """
+    Transport that records the requests sent through another one
+
+    Each request is appended to the file at `path` as one compact JSON
+    line: its start time (a Unix timestamp) and duration in seconds,
+    the method, URL and body, and the response status and body, or the
+    name of the exception raised.  Headers, which carry the HMAC, are not
+    recorded and the values of `redact` params (the public key) are
+    replaced.  Thread-safe.
+    """
+
+    def __init__(self, transport, path: str, redact=REDACTED_PARAMS):
+        """
+        Initialize!
+        """
+        self.transport = transport
+        self.path = path
+        self.redact = tuple(redact)
+        # timings are passed on to transports that support them
+        self.supports_timings = getattr(transport, "supports_timings", False)
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def _record(self, started: float, start: float, method: str, url: str,
+                body: bytes,
+                status: int = None, response: bytes = None,
+                error: BaseException = None):
+        """
+        Append one request to the recording
+        """
+        entry = {
+            "t": round(started, 6),
+            "d": round(time.perf_counter() - start, 6),
+            "m": method,
+            "u": url,
+            "q": redact_body(body, self.redact),
+        }
+        if error is not None:
+            entry["x"] = type(error).__name__
+        else:
+            entry["s"] = status
+            # surrogateescape keeps bodies that are not valid UTF-8 intact
+            entry["r"] = response.decode("utf-8", "surrogateescape")
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def request(self, method: str, url: str, body: bytes = None,
+                headers: dict = None, timeout=None, **kwargs):
+        """
+        Send a request with the wrapped transport and record it
+        """
+        started, start = time.time(), time.perf_counter()
+        try:
+            status, response = self.transport.request(
+                method, url, body=body, headers=headers, timeout=timeout,
+                **kwargs)
+        except Exception as exception:
+            self._record(
+                started, start, method, url, body, error=exception)
+            raise
+        self._record(started, start, method, url, body, status, response)
+        return status, response
+
+    def close(self):
+        """
+        Close the recording and the wrapped transport
+        """
+        with self._lock:
+            self._file.close()
+        close = getattr(self.transport, "close", None)
+        if close is not None:
+            close()
+
+
+def _exception(name: str):
+    """
+    Rebuild a recorded exception from its name
+    """
+    cls = getattr(builtins, name, None)
+    if not (isinstance(cls, type) and issubclass(cls, OSError)):
+        cls = getattr(http.client, name, None)
+        if not (isinstance(cls, type)
+                and issubclass(cls, http.client.HTTPException)):
+            cls = OSError
+    return cls("Replayed {}".format(name))
+
+
+def read_recording(path: str):
+    """
+    Read the entries of a recording, in the order they were started
+    """
+    with open(path, encoding="utf-8") as recording:
+        entries = [json.loads(line) for line in recording if line.strip()]
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+class ReplayTransport:
+    """
+    Transport that answers requests from a recording, offline
+
+    A request gets the response recorded for the same redacted body (the
+    next one, if it was recorded several times), or else for the same
+    command, after the recorded duration divided by `speed`.  With `speed`
+    None responses are immediate.  Recorded exceptions are raised again.
+    Raises ReplayError for requests that are not in the recording.
+    Thread-safe.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0,
+                 redact=REDACTED_PARAMS):
+        """
+        Initialize!
+        """
+        self.path = path
+        self.speed = speed
+        self.redact = tuple(redact)
+        self.entries = read_recording(path)
+        self._by_body = collections.defaultdict(collections.deque)
+        self._by_cmd = collections.defaultdict(collections.deque)
+        for entry in self.entries:
+            self._by_body[entry["q"]].append(entry)
+            self._by_cmd[dict(urllib.parse.parse_qsl(
+                entry["q"])).get("cmd")].append(entry)
+        self._lock = threading.Lock()
+
+    def _lookup(self, body: bytes):
+        """
+        Find the recorded entry answering body, and its delay in seconds
+        """
+        redacted = redact_body(body, self.redact)
+        with self._lock:
+            entries = self._by_body.get(redacted)
+            if not entries:
+                entries = self._by_cmd.get(dict(
+                    urllib.parse.parse_qsl(redacted)).get("cmd"))
+            if not entries:
+                raise ReplayError(
+                    "Request not in the recording: {}".format(redacted))
+            entry = entries[0]
+            # keep the last answer around for any further repeats
+            if len(entries) > 1:
+                entries.popleft()
+        delay = entry["d"] / self.speed if self.speed else 0
+        return entry, delay
+
+    @staticmethod
+    def _response(entry: dict):
+        if "x" in entry:
+            raise _exception(entry["x"])
+        return entry["s"], entry["r"].encode("utf-8", "surrogateescape")
+
+    def request(self, method: str, url: str, body: bytes = None,
+                headers: dict = None, timeout=None):
+        # pylint: disable=unused-argument
+        """
+        Answer a request from the recording
+        """
+        entry, delay = self._lookup(body)
+        if delay:
+            time.sleep(delay)
+        return self._response(entry)
+
+
+def replay_calls(client, path: str, speed: float = 1.0,
+                 max_workers: int = 10):
+    """
+    Make the calls of a recording through client, at their recorded pace
+
+    Each call is started at its recorded time (divided by `speed`, or
+    immediately with `speed` None) on up to `max_workers` threads, so the
+    client sees the recorded traffic pattern.  Pair it with a
+    ReplayTransport to compare client versions fully offline.
+
+    Returns a list of (cmd, latency in seconds, response or exception)
+    tuples, in recorded order.
+    """
+    def call(params: dict):
+        start = time.perf_counter()
+        try:
+            response = client.request("post", **params)
+        except Exception as exception:  # pylint: disable=broad-except
+            response = exception
+        return params.get("cmd"), time.perf_counter() - start, response
+
+    entries = read_recording(path)
+    start = time.perf_counter()
+    futures = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        for entry in entries:
+            if speed:
+                delay = (entry["t"] - entries[0]["t"]) / speed \
+                    - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            params = dict(urllib.parse.parse_qsl(
+                entry["q"], keep_blank_values=True))
+            if params.get("key") == REDACTED:
+                params["key"] = client.public_key
+            futures.append(executor.submit(call, params))
+    return [future.result() for future in futures]
@@ -12,6 +12,10 @@ with open('HISTORY.rst') as history_file:
 
 requirements = []
 
+extra_requirements = {
+    'fast': ['orjson'],
+}
+
 setup_requirements = ['pytest-runner', ]
 
 test_requirements = [
@@ -42,6 +46,7 @@ setup(
     ],
     description="CoinPayments payment gateway API client for Python.",
     install_requires=requirements,
+    extras_require=extra_requirements,
     license="MIT license",
     long_description=readme + '\n\n' + history,
     include_package_data=True,
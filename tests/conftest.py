@@ -0,0 +1,94 @@
+"""
+Shared test fixtures
+"""
+import http.server
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+import pytest
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Echo handler that keeps connections alive
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Echo back the request body, or send the server's canned response
+        """
+        drop_connection = self.server.drop_after_response
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        self.server.requests += 1
+        self.server.bodies.append(body)
+        self.server.headers.append(self.headers)
+        if self.server.reset_requests:
+            # reset the connection once the request is in, before answering
+            self.server.reset_requests -= 1
+            self.connection.setsockopt(
+                socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.close_connection = True
+            return
+        if self.server.delay:
+            time.sleep(self.server.delay)
+        if self.server.response is not None:
+            body = self.server.response
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        if self.server.close_after_response:
+            self.send_header("Connection", "close")
+        self.end_headers()
+        self.wfile.write(body)
+        if drop_connection:
+            # close without telling the client, like an idle timeout would
+            self.close_connection = True
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """
+        Keep test output quiet
+        """
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    Local test server that counts connections and requests
+    """
+    daemon_threads = True
+    request_queue_size = 64
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.connections = 0
+        self.requests = 0
+        self.close_after_response = False
+        self.drop_after_response = False
+        self.reset_requests = 0
+        self.bodies = []
+        self.headers = []
+        self.delay = 0
+        self.response = None
+
+    def process_request(self, request, client_address):
+        self.connections += 1
+        super().process_request(request, client_address)
+
+
+@pytest.fixture
+def server():
+    """
+    Run a local keep-alive HTTP server for the duration of a test
+    """
+    httpd = _Server()
+    thread = threading.Thread(
+        target=httpd.serve_forever, args=(0.01, ), daemon=True)
+    thread.start()
+    httpd.url = "http://127.0.0.1:{}/api.php".format(httpd.server_port)
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
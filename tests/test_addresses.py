@@ -0,0 +1,124 @@
+"""
+Tests for the callback address pool
+"""
+import itertools
+import threading
+import time
+
+import pytest
+
+from python_coinpayments.addresses import CallbackAddressPool
+from python_coinpayments.exceptions import CoinPaymentsError
+
+
+class FakeClient:
+    """
+    Hands out numbered callback addresses
+    """
+
+    def __init__(self):
+        self.counter = itertools.count(1)
+        self.calls = []
+        self.lock = threading.Lock()
+        self.error = None
+
+    def get_callback_address(self, params: dict):
+        """
+        Get a new callback address
+        """
+        with self.lock:
+            self.calls.append(params)
+            number = next(self.counter)
+        if self.error:
+            return {"error": self.error, "result": []}
+        return {"error": "ok", "result": {
+            "address": "{}-{}".format(params["currency"], number)}}
+
+
+class TestCallbackAddressPool:
+    """
+    Test class for CallbackAddressPool
+    """
+
+    def test_acquire(self):
+        """
+        Test that addresses come from the pool without API calls
+        """
+        client = FakeClient()
+        pool = CallbackAddressPool(
+            client, {"BTC": 4, "LTC": 2}, params={"label": "shop"})
+        assert 6 == pool.refill()
+        assert {"BTC": 4, "LTC": 2} == pool.levels()
+        assert {"currency": "BTC", "label": "shop"} in client.calls
+
+        addresses = {pool.acquire("BTC")["address"] for _ in range(4)}
+        assert 4 == len(addresses)
+        assert 6 == len(client.calls)
+        assert 0 == pool.refill("LTC")
+
+        # an empty pool falls back to the API
+        assert pool.acquire("BTC")["address"].startswith("BTC-")
+        assert pool.acquire("DOGE")["address"].startswith("DOGE-")
+        assert 8 == len(client.calls)
+        assert (4, 2) == (pool.hits, pool.misses)
+
+    def test_low_water(self):
+        """
+        Test that only currencies at their low water are refilled
+        """
+        pool = CallbackAddressPool(FakeClient(), {"BTC": 4, "LTC": 4})
+        pool.refill()
+        pool.acquire("BTC")
+        assert 0 == pool.refill()
+        pool.acquire("BTC")
+        assert 2 == pool.refill()
+        assert {"BTC": 4, "LTC": 4} == pool.levels()
+
+    def test_errors(self):
+        """
+        Test that failed refills are skipped and direct calls raise
+        """
+        client = FakeClient()
+        client.error = "Invalid currency"
+        pool = CallbackAddressPool(client, {"BTC": 2})
+        assert 0 == pool.refill()
+        with pytest.raises(CoinPaymentsError):
+            pool.acquire("BTC")
+        # only configured currencies are pooled
+        with pytest.raises(ValueError):
+            pool.refill("LTC")
+
+    def test_persistence(self, tmp_path):
+        """
+        Test that unused addresses survive a restart, in order
+        """
+        path = str(tmp_path / "addresses.db")
+        pool = CallbackAddressPool(FakeClient(), {"BTC": 3}, path=path)
+        pool.refill()
+        first = pool.acquire("BTC")
+        pool.close()
+
+        pool = CallbackAddressPool(FakeClient(), {"BTC": 3}, path=path)
+        assert {"BTC": 2} == pool.levels()
+        assert first != pool.acquire("BTC")
+        assert not pool.client.calls
+
+    def test_background_refill(self):
+        """
+        Test that the background thread fills and refills the pools
+        """
+        pool = CallbackAddressPool(FakeClient(), {"BTC": 2})
+        pool.start()
+        try:
+            deadline = time.monotonic() + 5
+            while pool.levels()["BTC"] < 2:
+                assert time.monotonic() < deadline
+                time.sleep(0.005)
+            pool.acquire("BTC")
+            pool.acquire("BTC")
+            while pool.levels()["BTC"] < 2:
+                assert time.monotonic() < deadline
+                time.sleep(0.005)
+        finally:
+            pool.stop()
+        assert 4 == len(pool.client.calls)
@@ -0,0 +1,188 @@
+"""
+Tests for the asyncio client
+"""
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.aio import (
+    ASYNC_TRANSPORT_ERRORS, AsyncCoinPayments, AsyncConnectionPool,
+)
+
+
+def run(coroutine):
+    """
+    Run a coroutine on a fresh event loop
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def make_client(server, **kwargs):
+    """
+    Get an AsyncCoinPayments client that talks to the local test server
+    """
+    client = AsyncCoinPayments(
+        public_key="public key", private_key="private key", **kwargs)
+    client.url = server.url
+    return client
+
+
+class TestAsyncConnectionPool:
+    """
+    Test class for AsyncConnectionPool
+    """
+
+    def test_keep_alive(self, server):
+        """
+        Test that consecutive requests reuse one connection
+        """
+        pool = AsyncConnectionPool()
+
+        async def requests():
+            return [
+                await pool.request("POST", server.url, body=str(i).encode())
+                for i in range(5)
+            ]
+
+        assert [(200, str(i).encode()) for i in range(5)] == run(requests())
+        assert 1 == server.connections
+
+    def test_stale_connection_retry(self, server):
+        """
+        Test that a request on a connection the server dropped is retried
+        """
+        pool = AsyncConnectionPool()
+
+        async def requests():
+            server.drop_after_response = True
+            await pool.request("POST", server.url, body=b"x")
+            server.drop_after_response = False
+            await asyncio.sleep(0.05)
+            return await pool.request("POST", server.url, body=b"again")
+
+        assert (200, b"again") == run(requests())
+        assert 2 == server.connections
+        assert 2 == server.requests
+
+    def test_no_resend_after_write(self, server):
+        """
+        Test that a request is not resent when the connection is reset after
+        it was written, as the server may have acted on it
+        """
+        server.response = b'{"error": "ok", "result": {}}'
+        client = AsyncCoinPayments(
+            public_key="public key", private_key="private key")
+        client.url = server.url
+
+        async def requests():
+            await client.rates()
+            server.reset_requests = 1
+            with pytest.raises(ASYNC_TRANSPORT_ERRORS):
+                await client.create_withdrawal(
+                    {"amount": 1, "currency": "BTC"})
+
+        run(requests())
+        assert 2 == server.requests
+        assert 1 == server.connections
+
+    def test_closing_connection_not_reused(self):
+        """
+        Test that idle connections are checked through their transport,
+        which StreamWriter.is_closing wraps from Python 3.7 on
+        """
+        pool = AsyncConnectionPool()
+        origin = ("http", "example.com", 80)
+        reader = MagicMock()
+        reader.at_eof.return_value = False
+        open_writer, closing_writer = (
+            MagicMock(spec=["transport", "close"]) for _ in range(2))
+        open_writer.transport.is_closing.return_value = False
+        closing_writer.transport.is_closing.return_value = True
+        pool._put_connection(origin, reader, open_writer)
+        pool._put_connection(origin, reader, closing_writer)
+        assert (reader, open_writer) == pool._get_connection(origin)
+        closing_writer.close.assert_called_once_with()
+
+    def test_cancelled_connection_not_reused(self, server):
+        """
+        Test that a connection is dropped when its request is cancelled
+        """
+        server.delay = 0.2
+        pool = AsyncConnectionPool()
+
+        async def requests():
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    pool.request("POST", server.url, body=b"slow"), 0.05)
+            server.delay = 0
+            return await pool.request("POST", server.url, body=b"fast")
+
+        assert (200, b"fast") == run(requests())
+        assert 2 == server.connections
+
+
+class TestAsyncCoinPayments:
+    """
+    Test class for AsyncCoinPayments
+    """
+
+    def test_same_methods(self):
+        """
+        Test that every CoinPayments API method is available
+        """
+        methods = {
+            name for name in dir(CoinPayments) if not name.startswith("_")
+        }
+        assert methods <= set(dir(AsyncCoinPayments))
+
+    def test_request(self, server):
+        """
+        Test that API methods are signed like the sync client and awaited
+        """
+        server.response = b'{"error": "ok", "result": {}}'
+        client = make_client(server)
+        sync_client = CoinPayments(
+            public_key="public key", private_key="private key")
+
+        assert {"error": "ok", "result": {}} == run(client.rates())
+        encoded, sig = sync_client.create_hmac(
+            version=1, key="public key", cmd="rates", format="json")
+        assert encoded == server.bodies[0]
+        assert sig == server.headers[0]["Hmac"]
+
+    def test_concurrent_requests(self, server):
+        """
+        Test that many requests run concurrently on one event loop
+        """
+        server.response = b'{"error": "ok", "result": {}}'
+        server.delay = 0.1
+        client = make_client(server)
+
+        async def requests():
+            loop = asyncio.get_event_loop()
+            start = loop.time()
+            results = await asyncio.gather(
+                *[client.get_tx_info({"txid": str(i)}) for i in range(10)])
+            return results, loop.time() - start
+
+        results, elapsed = run(requests())
+        assert 10 == len(results)
+        # ten 100ms requests in sequence would take a second
+        assert elapsed < 0.5
+
+    def test_timeout(self, server):
+        """
+        Test the client wide timeout
+        """
+        server.response = b'{"error": "ok", "result": {}}'
+        server.delay = 0.2
+        client = make_client(server, timeout=0.05)
+
+        with pytest.raises(asyncio.TimeoutError):
+            run(client.balances())
@@ -0,0 +1,137 @@
+"""
+Tests for batches of API calls and thread safety of the client
+"""
+import threading
+import urllib.parse
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments import (
+    AsyncCoinPayments, CoinPayments, ConnectionPool,
+)
+from python_coinpayments.batch import BatchExecutor
+from python_coinpayments.commands import API_METHODS
+from python_coinpayments.exceptions import CoinPaymentsError
+from python_coinpayments.signing import calculate_hmac
+
+
+def echo_decoder(body: bytes):
+    """
+    Decode an echoed request body into a response holding its params
+    """
+    return {
+        "error": "ok",
+        "result": dict(urllib.parse.parse_qsl(body.decode("utf-8"))),
+    }
+
+
+def make_client(server, **kwargs):
+    """
+    Get a client whose responses echo the params it sent
+    """
+    client = CoinPayments(
+        public_key="public key", private_key="private key",
+        decoder=echo_decoder, **kwargs)
+    client.url = server.url
+    return client
+
+
+def test_thread_safety(server):
+    """
+    Test that concurrent calls through one client get their own responses
+    and correct signatures, and leave the params passed in untouched
+    """
+    client = make_client(server, transport=ConnectionPool(maxsize=16))
+    jobs = [
+        ("get_withdrawal_info", {"id": "CWD{}".format(i)}) for i in range(100)
+    ] + [
+        ("get_conversion_info", {"id": "CON{}".format(i)}) for i in range(50)
+    ] + [("balances", {"all": 1})] * 50
+
+    with BatchExecutor(client, max_workers=16) as executor:
+        results = executor.run(jobs)
+
+    assert list(range(200)) == [result.index for result in results]
+    for (method, params), result in zip(jobs, results):
+        assert method == result.method
+        assert result.error is None
+        sent = result.response["result"]
+        assert method == sent.pop("cmd")
+        assert {"key", "version", "format"} <= set(sent)
+        assert {
+            name: str(value) for name, value in params.items()
+        } == {name: sent[name] for name in params}
+    # the shared params dict was never modified
+    assert {"all": 1} == jobs[-1][1]
+    assert all(len(params) == 1 for _, params in jobs)
+
+    for headers, body in zip(server.headers, server.bodies):
+        params = urllib.parse.parse_qsl(body.decode("utf-8"))
+        assert calculate_hmac("private key", **dict(params)) == \
+            headers["HMAC"]
+    # calls share the connection pool
+    assert server.connections <= 16
+
+
+def test_as_completed():
+    """
+    Test that results stream in as calls complete, with per-job errors
+    """
+    client = CoinPayments(public_key="public key", private_key="private key")
+    release = threading.Event()
+
+    def request(method, url, body=None, headers=None, timeout=None):
+        if b"cmd=rates" in body:
+            release.wait(5)
+            return 200, b'{"error": "ok", "result": {}}'
+        if b"cmd=balances" in body:
+            raise ValueError("boom")
+        return 200, b'{"error": "Invalid API public key"}'
+
+    client.transport = MagicMock(spec=["request"])
+    client.transport.request.side_effect = request
+    executor = BatchExecutor(client, max_workers=3)
+    results = executor.as_completed([
+        ("rates", None), ("balances", None), ("get_basic_info", {}),
+    ])
+    first = {next(results).method, next(results).method}
+    assert {"balances", "get_basic_info"} == first
+    release.set()
+    last = next(results)
+    assert "rates" == last.method
+    assert last.error is None
+    executor.shutdown()
+
+    results = {result.method: result for result in BatchExecutor(
+        client).run([("balances", None), ("get_basic_info", None)])}
+    assert isinstance(results["balances"].error, ValueError)
+    assert isinstance(results["get_basic_info"].error, CoinPaymentsError)
+    assert "Invalid API public key" == \
+        str(results["get_basic_info"].error)
+
+
+def test_invalid_jobs():
+    """
+    Test that unknown methods are refused before anything is sent
+    """
+    client = CoinPayments(public_key="public key", private_key="private key")
+    # one thread per pooled connection
+    with BatchExecutor(client) as executor:
+        assert client.transport.maxsize == executor.max_workers
+
+    client.transport = MagicMock(spec=["request"])
+    with BatchExecutor(client) as executor:
+        for method in ("no_such_command", "_send", "public_key", "request",
+                       "add_listener", "close", "get_tx_info_bulk"):
+            with pytest.raises(ValueError):
+                executor.run([("rates", None), (method, None)])
+    client.transport.request.assert_not_called()
+
+    with pytest.raises(TypeError):
+        BatchExecutor(AsyncCoinPayments("public key", "private key"))
+
+    # every allowed method exists on both clients
+    for method in API_METHODS:
+        assert callable(getattr(CoinPayments, method))
+        assert callable(getattr(AsyncCoinPayments, method))
@@ -0,0 +1,93 @@
+"""
+Tests for bulk transaction lookups
+"""
+import asyncio
+from unittest.mock import patch
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.aio import AsyncCoinPayments
+from python_coinpayments.bulk import chunked
+from python_coinpayments.exceptions import CoinPaymentsError
+
+TXIDS = ["CP{:04d}".format(i) for i in range(60)]
+
+
+def fake_tx_info_multi(params: dict = None):
+    """
+    Answer get_tx_info_multi, failing the chunk that contains CP0030
+    """
+    txids = params["txid"].split("|")
+    assert len(txids) <= 25
+    if "CP0030" in txids:
+        return {"error": "Server busy", "result": {}}
+    return {
+        "error": "ok",
+        "result": {txid: {"error": "ok", "status": 100} for txid in txids},
+    }
+
+
+class TestBulk:
+    """
+    Test class for bulk lookups
+    """
+
+    def test_chunked(self):
+        """
+        Test splitting iterables into chunks
+        """
+        assert [[0, 1], [2, 3], [4]] == list(chunked(iter(range(5)), 2))
+        assert [] == list(chunked([], 2))
+
+    @patch.object(CoinPayments, "get_tx_info_multi")
+    def test_get_tx_info_bulk(self, mocked):
+        """
+        Test that lookups are chunked, merged and failures reported
+        """
+        mocked.side_effect = fake_tx_info_multi
+        client = CoinPayments(public_key="public", private_key="private")
+
+        results, failures = client.get_tx_info_bulk(
+            txid for txid in TXIDS)
+
+        assert 3 == mocked.call_count
+        assert set(TXIDS[:25] + TXIDS[50:]) == set(results)
+        assert 1 == len(failures)
+        assert TXIDS[25:50] == failures[0].txids
+        assert isinstance(failures[0].error, CoinPaymentsError)
+
+    @patch.object(CoinPayments, "get_tx_info_multi")
+    def test_iter_tx_info_bulk_exception(self, mocked):
+        """
+        Test that an exception only fails its own chunk
+        """
+        mocked.side_effect = [
+            {"error": "ok", "result": {"a": {}}},
+            OSError("connection refused"),
+        ]
+        client = CoinPayments(public_key="public", private_key="private")
+
+        chunks = list(client.iter_tx_info_bulk(
+            ["a", "b"], max_workers=1, chunk_size=1))
+
+        assert [["a"], ["b"]] == [chunk.txids for chunk in chunks]
+        assert {"a": {}} == chunks[0].result
+        assert isinstance(chunks[1].error, OSError)
+
+    def test_async_get_tx_info_bulk(self):
+        """
+        Test the asyncio bulk lookup
+        """
+        client = AsyncCoinPayments(public_key="public", private_key="private")
+
+        async def get_tx_info_multi(params: dict = None):
+            await asyncio.sleep(0)
+            return fake_tx_info_multi(params)
+
+        loop = asyncio.new_event_loop()
+        with patch.object(client, "get_tx_info_multi", get_tx_info_multi):
+            results, failures = loop.run_until_complete(
+                client.get_tx_info_bulk(TXIDS, max_workers=2))
+        loop.close()
+
+        assert 35 == len(results)
+        assert TXIDS[25:50] == failures[0].txids
@@ -0,0 +1,121 @@
+"""
+Tests for the response cache
+"""
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.cache import ResponseCache
+
+# the params create_transaction requires
+TRANSACTION = {
+    "amount": 1,
+    "currency1": "USD",
+    "currency2": "BTC",
+    "buyer_email": "buyer@example.com",
+}
+
+
+def make_client(cache: ResponseCache, body: bytes = b'{"error": "ok"}'):
+    """
+    Get a client with a cache and a mocked transport
+    """
+    transport = MagicMock()
+    transport.request.return_value = (200, body)
+    return CoinPayments(
+        public_key="public key",
+        private_key="private key",
+        transport=transport,
+        cache=cache)
+
+
+class TestResponseCache:
+    """
+    Test class for ResponseCache
+    """
+
+    def test_cached_command(self):
+        """
+        Test that rates are fetched once and then served from the cache
+        """
+        cache = ResponseCache()
+        client = make_client(cache)
+        assert {"error": "ok"} == client.rates()
+        assert {"error": "ok"} == client.rates()
+        assert 1 == client.transport.request.call_count
+        assert {"hits": 1, "misses": 1, "size": 1} == cache.stats()
+
+        # different params are cached separately
+        client.rates({"short": 1})
+        assert 2 == client.transport.request.call_count
+
+    def test_uncached_commands(self):
+        """
+        Test that commands without a TTL are always sent
+        """
+        client = make_client(ResponseCache())
+        client.create_transaction(TRANSACTION)
+        client.create_transaction(TRANSACTION)
+        client.balances()
+        client.balances()
+        assert 4 == client.transport.request.call_count
+        assert 0 == len(client.cache)
+
+    def test_mutating_commands_rejected(self):
+        """
+        Test that mutating commands can never be configured for caching
+        """
+        for cmd in ("create_transaction", "create_withdrawal",
+                    "create_transfer", "convert"):
+            with pytest.raises(ValueError):
+                ResponseCache(ttls={cmd: 60})
+
+    def test_errors_not_cached(self):
+        """
+        Test that error responses are not cached
+        """
+        client = make_client(ResponseCache(), b'{"error": "Busy"}')
+        client.rates()
+        client.rates()
+        assert 2 == client.transport.request.call_count
+
+    def test_ttl(self):
+        """
+        Test that expired responses are fetched again
+        """
+        client = make_client(ResponseCache(ttls={"rates": 0}))
+        client.rates()
+        client.rates()
+        assert 2 == client.transport.request.call_count
+
+    def test_lru_eviction(self):
+        """
+        Test that the least recently used response is evicted
+        """
+        cache = ResponseCache(ttls={"get_tx_info": 60}, maxsize=2)
+        client = make_client(cache)
+        client.get_tx_info({"txid": "a"})
+        client.get_tx_info({"txid": "b"})
+        client.get_tx_info({"txid": "a"})
+        client.get_tx_info({"txid": "c"})  # evicts b
+        assert 3 == client.transport.request.call_count
+        client.get_tx_info({"txid": "a"})
+        assert 3 == client.transport.request.call_count
+        client.get_tx_info({"txid": "b"})
+        assert 4 == client.transport.request.call_count
+
+    def test_invalidate(self):
+        """
+        Test explicit invalidation
+        """
+        cache = ResponseCache()
+        client = make_client(cache)
+        client.rates()
+        client.get_basic_info()
+        cache.invalidate("rates")
+        assert 1 == len(cache)
+        cache.invalidate()
+        assert 0 == len(cache)
+        client.rates()
+        assert 3 == client.transport.request.call_count
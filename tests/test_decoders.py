@@ -0,0 +1,76 @@
+"""
+Tests for response decoders
+"""
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.decoders import (
+    decimal_decoder, get_decoder, stdlib_decoder,
+)
+
+BODY = b"""{
+    "error": "ok",
+    "result": {
+        "BTC": {"balance": 10000000, "balancef": "0.10000000"},
+        "LTC": {"balance": 0, "balancef": "0.00000000", "coin_status": "x"},
+        "tx": {"amount": 1.10, "fee": "", "status_text": "1.5"}
+    }
+}"""
+
+
+class TestDecoders:
+    """
+    Test class for the response decoders
+    """
+
+    def test_decimal_decoder(self):
+        """
+        Test that amounts are decoded exactly
+        """
+        result = decimal_decoder(BODY)["result"]
+        assert 10000000 == result["BTC"]["balance"]
+        assert isinstance(result["BTC"]["balance"], int)
+        assert Decimal("0.10000000") == result["BTC"]["balancef"]
+        assert isinstance(result["BTC"]["balancef"], Decimal)
+        assert Decimal("1.10") == result["tx"]["amount"]
+        # only monetary fields are converted, and only if they hold a number
+        assert "" == result["tx"]["fee"]
+        assert "1.5" == result["tx"]["status_text"]
+
+    def test_get_decoder(self):
+        """
+        Test getting decoders by name
+        """
+        assert stdlib_decoder is get_decoder("json")
+        assert decimal_decoder is get_decoder("decimal")
+        for name in ("fastest", "json"):
+            assert "ok" == get_decoder(name)(BODY)["error"]
+        with pytest.raises(ValueError):
+            get_decoder("yaml")
+
+    def test_missing_backend(self):
+        """
+        Test that fastest falls back to json and named backends are required
+        """
+        with patch("python_coinpayments.decoders.importlib.import_module",
+                   side_effect=ImportError):
+            assert stdlib_decoder is get_decoder("fastest")
+            with pytest.raises(ImportError):
+                get_decoder("orjson")
+
+    def test_client_decoder(self):
+        """
+        Test that the client decodes responses with its decoder
+        """
+        transport = MagicMock()
+        transport.request.return_value = (200, BODY)
+        client = CoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport,
+            decoder=get_decoder("decimal"))
+        balances = client.balances()
+        assert Decimal("0.1") == balances["result"]["BTC"]["balancef"]
@@ -0,0 +1,214 @@
+"""
+Tests for IPN ingestion
+"""
+import sqlite3
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments import IPNVerifier
+from python_coinpayments.ingest import IPNIngestor, IPNQueue
+from python_coinpayments.ipn import IPNDeduplicator
+from tests.test_ipn import HMAC, MERCHANT, PARAMS, SECRET
+
+
+def wait_for(condition, timeout: float = 5.0):
+    """
+    Wait until condition() is true
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+
+class TestIPNQueue:
+    """
+    Test class for IPNQueue
+    """
+
+    def test_lease_ack(self, tmp_path):
+        """
+        Test that leased IPNs are redelivered unless acknowledged
+        """
+        queue = IPNQueue(str(tmp_path / "queue.db"), lease_timeout=0)
+        first = queue.put({"ipn_id": "1"})
+        queue.put({"ipn_id": "2"})
+        assert 2 == len(queue)
+
+        leased = queue.lease(1)
+        assert [(first, {"ipn_id": "1"})] == [item[:2] for item in leased]
+        queue.ack(first)
+
+        # the lease expired at once, so "2" is redelivered
+        assert [("2", 1)] == [
+            (item[1]["ipn_id"], item[3]) for item in queue.lease(5)]
+        assert [("2", 2)] == [
+            (item[1]["ipn_id"], item[3]) for item in queue.lease(5)]
+
+    def test_durable(self, tmp_path):
+        """
+        Test that queued and leased IPNs survive a restart
+        """
+        path = str(tmp_path / "queue.db")
+        queue = IPNQueue(path, lease_timeout=60)
+        queue.put({"ipn_id": "1"})
+        queue.put({"ipn_id": "2"})
+        assert 1 == len(queue.lease(1))
+        queue.close()
+
+        queue = IPNQueue(path, lease_timeout=60)
+        assert 2 == len(queue)
+        assert [{"ipn_id": "2"}] == [item[1] for item in queue.lease(5)]
+        assert queue.oldest() <= time.time()
+
+    def test_dead_letters(self, tmp_path):
+        """
+        Test that IPNs can be set aside
+        """
+        queue = IPNQueue(str(tmp_path / "queue.db"))
+        id_ = queue.put({"ipn_id": "1"})
+        queue.lease()
+        queue.nack(id_, dead=True)
+        assert 0 == len(queue)
+        assert [] == queue.lease()
+        assert [(id_, {"ipn_id": "1"})] == queue.dead_letters()
+
+
+class TestIPNIngestor:
+    """
+    Test class for IPNIngestor
+    """
+
+    def make_ingestor(self, tmp_path, handler, **kwargs):
+        """
+        Get an ingestor with a real verifier and queue
+        """
+        return IPNIngestor(
+            IPNVerifier(secret=SECRET, merchant_id=MERCHANT),
+            IPNQueue(str(tmp_path / "queue.db")), handler, **kwargs)
+
+    def test_submit_and_process(self, tmp_path):
+        """
+        Test that IPNs are verified, queued and processed in the background
+        """
+        handled = []
+        ingestor = self.make_ingestor(tmp_path, handled.append)
+        assert (True, None) == ingestor.submit({"HTTP_HMAC": HMAC}, PARAMS)
+        assert (False, "Invalid HTTP HMAC") == ingestor.submit(
+            {"HTTP_HMAC": "wrong"}, PARAMS)
+        assert 1 == ingestor.metrics()["pending"]
+        assert not handled
+
+        ingestor.start()
+        wait_for(lambda: ingestor.metrics()["processed"] == 1)
+        ingestor.stop()
+        assert [PARAMS] == handled
+        metrics = ingestor.metrics()
+        assert 0 == metrics["pending"]
+        assert 0 == len(ingestor.queue)
+        assert 1 == metrics["accepted"] and 1 == metrics["rejected"]
+        assert 0 == metrics["lag"]
+        assert 0 < metrics["lag_max"]
+
+    def test_queue_failure(self, tmp_path):
+        """
+        Test that an IPN that could not be queued is accepted when resent
+        """
+        verifier = IPNVerifier(
+            secret=SECRET, merchant_id=MERCHANT,
+            deduplicator=IPNDeduplicator())
+        queue = IPNQueue(str(tmp_path / "queue.db"))
+        ingestor = IPNIngestor(verifier, queue, MagicMock())
+        put = queue.put
+        queue.put = MagicMock(side_effect=sqlite3.OperationalError("full"))
+        with pytest.raises(sqlite3.OperationalError):
+            ingestor.submit({"HTTP_HMAC": HMAC}, PARAMS)
+        assert 0 == ingestor.metrics()["pending"]
+
+        queue.put = put
+        assert (True, None) == ingestor.submit({"HTTP_HMAC": HMAC}, PARAMS)
+        assert 1 == len(queue)
+
+    def test_retry_and_dead_letter(self, tmp_path):
+        """
+        Test that failing IPNs are retried, then set aside
+        """
+        calls = []
+
+        def handler(http_post):
+            calls.append(http_post)
+            raise ValueError("database down")
+
+        ingestor = self.make_ingestor(
+            tmp_path, handler, retry_delay=0, max_attempts=3,
+            poll_interval=0.01)
+        ingestor.submit({"HTTP_HMAC": HMAC}, PARAMS)
+        ingestor.start()
+        wait_for(lambda: ingestor.metrics()["failed"] == 3)
+        ingestor.stop()
+        assert 3 == len(calls)
+        assert 0 == ingestor.metrics()["pending"]
+        assert 1 == len(ingestor.queue.dead_letters())
+
+    def test_restart(self, tmp_path):
+        """
+        Test that an ingestor can be started again after a stop
+        """
+        handled = []
+        ingestor = self.make_ingestor(
+            tmp_path, handled.append, poll_interval=0.01)
+        for _ in range(2):
+            ingestor.start()
+            ingestor.submit({"HTTP_HMAC": HMAC}, PARAMS)
+            wait_for(lambda: ingestor.metrics()["pending"] == 0)
+            ingestor.stop()
+        assert 2 == len(handled)
+        assert 0 == ingestor.metrics()["in_flight"]
+
+    def test_executor_refusal(self, tmp_path):
+        """
+        Test that IPNs the executor refuses are released, not held
+        """
+        executor = MagicMock()
+        executor.submit.side_effect = RuntimeError("shut down")
+        ingestor = self.make_ingestor(
+            tmp_path, MagicMock(), executor=executor, retry_delay=0)
+        ingestor.submit({"HTTP_HMAC": HMAC}, PARAMS)
+        ingestor.submit({"HTTP_HMAC": HMAC}, PARAMS)
+        with pytest.raises(RuntimeError):
+            ingestor.dispatch()
+        assert 0 == ingestor.metrics()["in_flight"]
+        assert 2 == len(ingestor.queue.lease(5))
+
+    def test_backpressure(self, tmp_path):
+        """
+        Test that submissions are rejected while the queue is full, and
+        in-flight IPNs are bounded
+        """
+        release = threading.Event()
+        running = []
+
+        def handler(http_post):
+            running.append(http_post)
+            release.wait(5)
+
+        ingestor = self.make_ingestor(
+            tmp_path, handler, max_pending=3, max_in_flight=2)
+        for _ in range(3):
+            assert (True, None) == ingestor.submit(
+                {"HTTP_HMAC": HMAC}, PARAMS)
+        assert (False, "Queue full") == ingestor.submit(
+            {"HTTP_HMAC": HMAC}, PARAMS)
+
+        ingestor.start()
+        wait_for(lambda: len(running) == 2)
+        time.sleep(0.05)
+        assert 2 == len(running)
+        assert 2 == ingestor.metrics()["in_flight"]
+        release.set()
+        wait_for(lambda: ingestor.metrics()["processed"] == 3)
+        ingestor.stop()
+        assert (True, None) == ingestor.submit({"HTTP_HMAC": HMAC}, PARAMS)
@@ -0,0 +1,166 @@
+"""
+Tests for the request instrumentation
+"""
+import asyncio
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.aio import AsyncCoinPayments
+from python_coinpayments.instrumentation import (
+    API_ERROR, EXCEPTION, OK, LatencyAggregator, RequestEvent,
+)
+
+OK_RESPONSE = b'{"error": "ok", "result": {}}'
+
+
+def make_client(server, client_class=CoinPayments):
+    """
+    Get a client talking to the local test server, with a listener
+
+    Returns a tuple of (client, list of received events)
+    """
+    server.response = OK_RESPONSE
+    client = client_class(public_key="public key", private_key="private key")
+    client.url = server.url
+    events = []
+    client.add_listener(events.append)
+    return client, events
+
+
+def test_event_phases(server):
+    """
+    Test that a request is timed phase by phase
+    """
+    client, events = make_client(server)
+    assert "ok" == client.rates()["error"]
+    assert 1 == len(events)
+    event = events[0]
+    assert "rates" == event.cmd
+    assert OK == event.outcome
+    assert 200 == event.status
+    assert 1 == event.attempts
+    assert len(server.bodies[0]) == event.request_size
+    assert len(OK_RESPONSE) == event.response_size
+    assert {
+        "package", "sign", "queue", "connect", "wait", "read", "decode",
+    } == set(event.timings)
+    assert sum(event.timings.values()) <= event.duration
+
+    client.rates()
+    # the connection is kept alive, so the second request does not connect
+    assert "connect" not in events[1].timings
+
+
+def test_async_event_phases(server):
+    """
+    Test that the asyncio client times requests phase by phase
+    """
+    client, events = make_client(server, AsyncCoinPayments)
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(client.rates())
+    finally:
+        loop.close()
+    assert OK == events[0].outcome
+    assert {
+        "package", "sign", "queue", "connect", "wait", "read", "decode",
+    } == set(events[0].timings)
+
+
+def test_no_listeners():
+    """
+    Test that nothing is timed and no timings are passed without listeners
+    """
+    client = CoinPayments(public_key="public key", private_key="private key")
+    client.transport = MagicMock(supports_timings=True)
+    client.transport.request.return_value = (200, OK_RESPONSE)
+    client.rates()
+    assert "timings" not in client.transport.request.call_args[1]
+
+
+def test_transport_without_timings():
+    """
+    Test that transports that cannot time requests are timed as a whole
+    """
+    client = CoinPayments(public_key="public key", private_key="private key")
+    client.transport = MagicMock(spec=["request"])
+    client.transport.request.return_value = (
+        200, b'{"error": "Invalid command"}')
+    events = []
+    client.add_listener(events.append)
+    client.rates()
+    assert "timings" not in client.transport.request.call_args[1]
+    assert API_ERROR == events[0].outcome
+    assert "Invalid command" == events[0].error
+    assert {"package", "sign", "queue", "wait", "decode"} == set(
+        events[0].timings)
+
+    client.remove_listener(events.append)
+    client.rates()
+    assert 1 == len(events)
+
+
+def test_exception():
+    """
+    Test that failed requests are reported, and that listeners that raise
+    do not break requests
+    """
+    client = CoinPayments(public_key="public key", private_key="private key")
+    client.transport = MagicMock(spec=["request"])
+    client.transport.request.side_effect = OSError("refused")
+    events = []
+    client.add_listener(MagicMock(side_effect=ValueError))
+    client.add_listener(events.append)
+    with pytest.raises(OSError):
+        client.rates()
+    assert EXCEPTION == events[0].outcome
+    assert isinstance(events[0].error, OSError)
+    assert events[0].status is None
+
+
+def make_event(cmd, duration, outcome=OK, error=None):
+    """
+    Build a finished event
+    """
+    event = RequestEvent(cmd)
+    event.duration = duration
+    event.outcome = outcome
+    event.error = error
+    event.timings = {"wait": duration}
+    event.request_size = 10
+    event.response_size = 100
+    return event
+
+
+def test_latency_aggregator():
+    """
+    Test LatencyAggregator
+    """
+    aggregator = LatencyAggregator(buckets=(0.01, 0.1, 1.0))
+    for _ in range(90):
+        aggregator(make_event("rates", 0.005))
+    for _ in range(9):
+        aggregator(make_event("rates", 0.05))
+    aggregator(make_event("rates", 3.0, EXCEPTION, OSError("down")))
+    aggregator(make_event("balances", 0.5, API_ERROR, "Invalid key"))
+
+    assert 0.01 == aggregator.percentile("rates", 0.5)
+    assert 0.1 == aggregator.percentile("rates", 0.99)
+    assert 3.0 == aggregator.percentile("rates", 1.0)
+    assert aggregator.percentile("get_basic_info", 0.5) is None
+
+    snapshot = aggregator.snapshot()
+    rates = snapshot["rates"]
+    assert 100 == rates["count"]
+    assert [(0.01, 90), (0.1, 9), (1.0, 0), (None, 1)] == rates["histogram"]
+    assert 3.0 == rates["max"]
+    assert {OK: 99, EXCEPTION: 1} == rates["outcomes"]
+    assert {"OSError": 1} == rates["errors"]
+    assert 1000 == rates["request_bytes"]
+    assert pytest.approx(0.45 + 0.45 + 3.0) == rates["phases"]["wait"]
+    assert {"Invalid key": 1} == snapshot["balances"]["errors"]
+
+    aggregator.reset()
+    assert {} == aggregator.snapshot()
@@ -0,0 +1,164 @@
+"""
+Tests for IPN verification
+"""
+import concurrent.futures
+from unittest.mock import patch
+
+from python_coinpayments import IPNVerifier
+from python_coinpayments.ipn import IPNDeduplicator
+
+SECRET = "mosh"
+MERCHANT = "8d683f17575a9544c6180206f52d4a9c"
+HMAC = "8c38725cfa6175938c216beecfd6b56284590b857a27fe4c0ad2438aa88e3d8289aa493c7f9e7a5a721c34b92de5c31c5f7534f215a9c17f1121c29508634861"  # noqa
+PARAMS = dict(
+    ipn_version="1.0",
+    ipn_id="ce041097ff2647f3c01375eacdc90e1d",
+    ipn_mode="hmac",
+    merchant=MERCHANT,
+    ipn_type="api",
+    txn_id="CPCH5TRXAUDLO6ANAV2UCKDFN2",
+    status="0",
+    status_text="Waiting for buyer funds...",
+    currency1="USD",
+    currency2="BTC",
+    amount1="1",
+    amount2="1",
+    fee="0.006",
+    buyer_name="CoinPayments API",
+    invoice="128fee28-2d37-448e-a339-71980a8950c1",
+    received_amount="0",
+    received_confirms="0",
+)
+
+
+class TestIPNVerifier:
+    """
+    Test class for IPNVerifier
+    """
+
+    def test_verify(self):
+        """
+        Test verifying a single IPN
+        """
+        verifier = IPNVerifier(secret=SECRET, merchant_id=MERCHANT)
+        assert (True, None) == verifier.verify({"HTTP_HMAC": HMAC}, PARAMS)
+        assert (False, "Invalid HTTP HMAC") == verifier.verify(
+            {"HTTP_HMAC": "wrong"}, PARAMS)
+        assert (False, "Invalid HTTP HMAC") == verifier.verify(
+            {"HTTP_HMAC": "ünïcödé"}, PARAMS)
+
+    def test_cheap_checks_skip_hashing(self):
+        """
+        Test that merchant and ipn_mode are checked before any hashing
+        """
+        verifier = IPNVerifier(secret=SECRET, merchant_id=MERCHANT)
+        bad_merchant = dict(PARAMS, merchant="wrong")
+        bad_mode = dict(PARAMS, ipn_mode="httpauth")
+        with patch.object(verifier._signer, "sign_params") as mocked:
+            assert (False, "Invalid merchant ID") == verifier.verify(
+                {"HTTP_HMAC": HMAC}, bad_merchant)
+            assert (False, "Invalid ipn_mode") == verifier.verify(
+                {"HTTP_HMAC": HMAC}, bad_mode)
+            assert (False, "No HTTP HMAC") == verifier.verify({}, PARAMS)
+            assert not mocked.called
+
+    def test_verify_many(self):
+        """
+        Test verifying a batch, with and without a thread pool
+        """
+        verifier = IPNVerifier(secret=SECRET, merchant_id=MERCHANT)
+        requests = [
+            ({"HTTP_HMAC": HMAC}, PARAMS),
+            ({"HTTP_HMAC": "wrong"}, PARAMS),
+            ({"HTTP_HMAC": HMAC}, dict(PARAMS, merchant="wrong")),
+        ] * 20
+        expected = [
+            (True, None),
+            (False, "Invalid HTTP HMAC"),
+            (False, "Invalid merchant ID"),
+        ] * 20
+        assert expected == verifier.verify_many(requests)
+        assert expected == verifier.verify_many(requests, max_workers=4)
+
+    def test_iter_verify_is_lazy(self):
+        """
+        Test that streams are consumed as results are read
+        """
+        verifier = IPNVerifier(secret=SECRET, merchant_id=MERCHANT)
+        consumed = []
+
+        def stream():
+            for i in range(1000):
+                consumed.append(i)
+                yield {"HTTP_HMAC": HMAC}, PARAMS
+
+        results = verifier.iter_verify(stream(), max_workers=2)
+        assert (True, None) == next(results)
+        assert len(consumed) < 10
+        results.close()
+
+
+class TestIPNDeduplicator:
+    """
+    Test class for IPNDeduplicator
+    """
+
+    def test_check_and_mark(self):
+        """
+        Test that an IPN is new once per ipn_id, txn_id and status
+        """
+        dedup = IPNDeduplicator(maxsize=2)
+        assert not dedup.seen(PARAMS)
+        assert dedup.check_and_mark(PARAMS)
+        assert dedup.seen(PARAMS)
+        assert not dedup.check_and_mark(PARAMS)
+        assert dedup.check_and_mark(dict(PARAMS, status="100"))
+
+        dedup.forget(PARAMS)
+        assert dedup.check_and_mark(PARAMS)
+
+        # the least recently seen IPN is dropped beyond maxsize
+        dedup.check_and_mark(dict(PARAMS, ipn_id="other"))
+        assert 2 == len(dedup)
+        assert not dedup.seen(dict(PARAMS, status="100"))
+
+    def test_concurrent(self):
+        """
+        Test that only one of many concurrent handlers gets the IPN
+        """
+        dedup = IPNDeduplicator()
+        with concurrent.futures.ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(
+                dedup.check_and_mark, [PARAMS] * 100))
+        assert 1 == results.count(True)
+
+    def test_persistent(self, tmp_path):
+        """
+        Test that IPNs are remembered beyond the LRU and across restarts
+        """
+        path = str(tmp_path / "ipns.db")
+        dedup = IPNDeduplicator(maxsize=1, path=path)
+        assert dedup.check_and_mark(PARAMS)
+        assert dedup.check_and_mark(dict(PARAMS, ipn_id="other"))
+        assert not dedup.check_and_mark(PARAMS)
+        dedup.close()
+
+        dedup = IPNDeduplicator(path=path)
+        assert dedup.seen(PARAMS)
+        assert not dedup.check_and_mark(dict(PARAMS, ipn_id="other"))
+        assert 2 == dedup.prune(-1)
+        dedup.forget(PARAMS)
+        assert dedup.check_and_mark(PARAMS)
+
+    def test_verifier(self):
+        """
+        Test deduplication on the verification path
+        """
+        verifier = IPNVerifier(
+            secret=SECRET, merchant_id=MERCHANT,
+            deduplicator=IPNDeduplicator())
+        assert (False, "Invalid HTTP HMAC") == verifier.verify(
+            {"HTTP_HMAC": "wrong"}, PARAMS)
+        assert (True, None) == verifier.verify({"HTTP_HMAC": HMAC}, PARAMS)
+        assert (False, "Duplicate IPN") == verifier.verify(
+            {"HTTP_HMAC": HMAC}, PARAMS)
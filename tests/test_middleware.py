@@ -0,0 +1,192 @@
+"""
+Tests for the WSGI and ASGI IPN receivers
+"""
+import asyncio
+import io
+import threading
+from wsgiref.util import setup_testing_defaults
+
+from python_coinpayments import IPNVerifier
+from python_coinpayments.ipn import IPNDeduplicator
+from python_coinpayments.middleware import (
+    ASGIIPNReceiver, FormParser, WSGIIPNReceiver,
+)
+from python_coinpayments.signing import encode_params
+from tests.test_ipn import HMAC, MERCHANT, PARAMS, SECRET
+
+BODY = encode_params(PARAMS)
+
+
+def make_environ(body: bytes = BODY, hmac: str = HMAC, **extra):
+    """
+    Get the WSGI environ of an IPN request
+    """
+    environ = {
+        "REQUEST_METHOD": "POST",
+        "PATH_INFO": "/ipn",
+        "CONTENT_LENGTH": str(len(body)),
+        "HTTP_HMAC": hmac,
+        "wsgi.input": io.BytesIO(body),
+    }
+    environ.update(extra)
+    setup_testing_defaults(environ)
+    return environ
+
+
+def call_wsgi(app, environ: dict):
+    """
+    Call a WSGI app, returning (status, body)
+    """
+    statuses = []
+    body = b"".join(app(environ, lambda status, headers: statuses.append(
+        status)))
+    return statuses[0], body
+
+
+def call_asgi(app, body: bytes = BODY, hmac: str = HMAC, chunk: int = 100,
+              path: str = "/ipn", method: str = "POST"):
+    """
+    Call an ASGI app with body sent in chunks, returning (status, body)
+    """
+    chunks = [body[i:i + chunk] for i in range(0, len(body), chunk)] or [b""]
+    messages = [
+        {"type": "http.request", "body": part,
+         "more_body": index < len(chunks) - 1}
+        for index, part in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": method, "path": path,
+        "headers": [(b"content-type", b"x"), (b"hmac", hmac.encode())],
+    }
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(app(scope, receive, send))
+    finally:
+        loop.close()
+    return sent[0]["status"], sent[1]["body"]
+
+
+class TestFormParser:
+    """
+    Test class for FormParser
+    """
+
+    def test_chunks(self):
+        """
+        Test that any chunking gives the same fields as parsing at once
+        """
+        body = encode_params(dict(PARAMS, note="a&b=c d/é"))
+        for size in (1, 3, 7, len(body)):
+            parser = FormParser()
+            for start in range(0, len(body), size):
+                parser.feed(body[start:start + size])
+            assert dict(PARAMS, note="a&b=c d/é") == parser.close()
+
+
+class TestWSGIIPNReceiver:
+    """
+    Test class for WSGIIPNReceiver
+    """
+
+    def test_receive(self):
+        """
+        Test that verified IPNs reach the callback and others do not
+        """
+        received = []
+        app = WSGIIPNReceiver(
+            IPNVerifier(secret=SECRET, merchant_id=MERCHANT),
+            received.append)
+        assert ("200 OK", b"IPN OK") == call_wsgi(app, make_environ())
+        assert [PARAMS] == received
+        assert ("400 Bad Request", b"Invalid HTTP HMAC") == call_wsgi(
+            app, make_environ(hmac="wrong"))
+        assert "405 Method Not Allowed" == call_wsgi(
+            app, make_environ(REQUEST_METHOD="GET"))[0]
+        assert "413 Payload Too Large" == call_wsgi(
+            app, make_environ(body=b"x" * 70000))[0]
+        assert 1 == len(received)
+
+    def test_path_and_app(self):
+        """
+        Test that other paths go to the wrapped app
+        """
+        def other(environ, start_response):
+            start_response("200 OK", [])
+            return [b"other"]
+
+        app = WSGIIPNReceiver(
+            IPNVerifier(secret=SECRET, merchant_id=MERCHANT),
+            lambda http_post: None, path="/ipn", app=other)
+        assert b"other" == call_wsgi(
+            app, make_environ(PATH_INFO="/shop"))[1]
+        assert b"IPN OK" == call_wsgi(app, make_environ())[1]
+
+    def test_duplicates_and_failures(self):
+        """
+        Test that repeats are acknowledged and failed IPNs can be resent
+        """
+        calls = []
+
+        def callback(http_post):
+            calls.append(http_post)
+            if len(calls) == 1:
+                raise ValueError("database down")
+
+        app = WSGIIPNReceiver(
+            IPNVerifier(secret=SECRET, merchant_id=MERCHANT,
+                        deduplicator=IPNDeduplicator()),
+            callback)
+        assert "500 Internal Server Error" == call_wsgi(
+            app, make_environ())[0]
+        assert ("200 OK", b"IPN OK") == call_wsgi(app, make_environ())
+        assert ("200 OK", b"Duplicate IPN") == call_wsgi(
+            app, make_environ())
+        assert 2 == len(calls)
+
+
+class TestASGIIPNReceiver:
+    """
+    Test class for ASGIIPNReceiver
+    """
+
+    def test_sync_callback(self):
+        """
+        Test that sync callbacks run off the event loop thread
+        """
+        threads = []
+        app = ASGIIPNReceiver(
+            IPNVerifier(secret=SECRET, merchant_id=MERCHANT),
+            lambda http_post: threads.append(
+                (http_post, threading.current_thread())))
+        assert (200, b"IPN OK") == call_asgi(app, chunk=37)
+        assert PARAMS == threads[0][0]
+        assert threading.current_thread() is not threads[0][1]
+        assert (400, b"Invalid HTTP HMAC") == call_asgi(app, hmac="wrong")
+        assert 405 == call_asgi(app, method="GET")[0]
+        assert 413 == call_asgi(app, body=b"x" * 70000, chunk=8192)[0]
+
+    def test_async_callback(self):
+        """
+        Test that coroutine callbacks are awaited
+        """
+        received = []
+
+        async def callback(http_post):
+            received.append(http_post)
+
+        app = ASGIIPNReceiver(
+            IPNVerifier(secret=SECRET, merchant_id=MERCHANT,
+                        deduplicator=IPNDeduplicator()),
+            callback, path="/ipn")
+        assert (200, b"IPN OK") == call_asgi(app)
+        assert (200, b"Duplicate IPN") == call_asgi(app)
+        assert (404, b"Not found") == call_asgi(app, path="/other")
+        assert [PARAMS] == received
@@ -0,0 +1,124 @@
+"""
+Tests for the typed result models
+"""
+import pickle
+import sys
+from decimal import Decimal
+
+import pytest
+
+from python_coinpayments.exceptions import CoinPaymentsError
+from python_coinpayments.models import (
+    Balance, Model, TransactionInfo, parse_balances, parse_conversion_info,
+    parse_rates, parse_tx_info, parse_tx_info_multi, parse_withdrawal_info,
+)
+
+TX_INFO = {
+    "time_created": 1553366870,
+    "time_expires": 1553376870,
+    "status": 100,
+    "status_text": "Complete",
+    "type": "coins",
+    "coin": "BTC",
+    "amount": 123456,
+    "amountf": "0.00123456",
+    "received": 123456,
+    "receivedf": "0.00123456",
+    "recv_confirms": 3,
+    "payment_address": "3PH6wBTHcXyYBLKhbVxSGEJ5GDgtRJYvA5",
+    "unknown": "dropped",
+}
+
+
+class TestModels:
+    """
+    Test class for the result models
+    """
+
+    def test_tx_info(self):
+        """
+        Test that fields are converted when read
+        """
+        info = parse_tx_info({"error": "ok", "result": TX_INFO}, "CPTX")
+        assert "CPTX" == info.txn_id
+        assert 100 == info.status
+        assert Decimal("0.00123456") == info.amountf
+        assert info.error is None
+        assert not hasattr(info, "__dict__")
+        with pytest.raises(AttributeError):
+            info.unknown  # pylint: disable=pointless-statement
+
+    def test_not_cached(self):
+        """
+        Test that fields are converted on each read and never kept
+        """
+        info = TransactionInfo.from_dict(TX_INFO)
+        first = info.amountf
+        assert first == info.amountf
+        assert first is not info.amountf
+        assert ("_raw", ) == Model.__slots__
+        assert () == TransactionInfo.__slots__
+        with pytest.raises(AttributeError):
+            info.amountf = Decimal(1)
+
+    def test_multi_and_collections(self):
+        """
+        Test the helpers for responses holding many results
+        """
+        infos = parse_tx_info_multi({
+            "error": "ok",
+            "result": {"A": TX_INFO, "B": {"error": "Invalid txid"}},
+        })
+        assert "A" == infos["A"].txn_id
+        assert "Invalid txid" == infos["B"].error
+
+        balances = parse_balances({
+            "error": "ok",
+            "result": {"BTC": {"balance": 1, "balancef": "0.00000001"}},
+        })
+        assert Balance.from_dict(
+            {"balance": 1, "balancef": "0.00000001"}, coin="BTC") == \
+            balances["BTC"]
+        assert Decimal("0.00000001") == balances["BTC"].balancef
+
+        rates = parse_rates({
+            "error": "ok",
+            "result": {"LTC": {"rate_btc": "0.0125", "is_fiat": 0}},
+        })
+        assert Decimal("0.0125") == rates["LTC"].rate_btc
+        assert 0 == rates["LTC"].is_fiat
+
+        withdrawal = parse_withdrawal_info(
+            {"error": "ok", "result": {"amountf": "1.5", "status": 2}}, "W")
+        assert ("W", 2, Decimal("1.5")) == (
+            withdrawal.id, withdrawal.status, withdrawal.amountf)
+
+        conversion = parse_conversion_info(
+            {"error": "ok", "result": {"receivedf": "2"}}, "C")
+        assert Decimal(2) == conversion.receivedf
+
+    def test_errors(self):
+        """
+        Test that API errors are raised
+        """
+        with pytest.raises(CoinPaymentsError):
+            parse_tx_info({"error": "Invalid txid", "result": []})
+
+    def test_as_dict_and_pickle(self):
+        """
+        Test converting to a dict and pickling
+        """
+        info = TransactionInfo.from_dict(TX_INFO, txn_id="CPTX")
+        as_dict = info.as_dict()
+        assert Decimal("0.00123456") == as_dict["amountf"]
+        assert "unknown" not in as_dict
+        assert info == pickle.loads(pickle.dumps(info))
+        assert "TransactionInfo(txn_id='CPTX'" in repr(info)
+
+    def test_smaller_than_dict(self):
+        """
+        Test that a model is smaller than the dict it was built from
+        """
+        info = TransactionInfo.from_dict(TX_INFO)
+        size = sys.getsizeof(info) + sys.getsizeof(info._raw)
+        assert size < sys.getsizeof(TX_INFO)
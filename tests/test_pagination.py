@@ -0,0 +1,103 @@
+"""
+Tests for paginated iteration
+"""
+import asyncio
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from python_coinpayments import AsyncCoinPayments, CoinPayments
+from python_coinpayments.exceptions import CoinPaymentsError
+
+TXIDS = ["CP{:04d}".format(i) for i in range(250)]
+
+
+def fake_get_tx_list(params: dict = None):
+    """
+    Answer get_tx_ids from TXIDS
+    """
+    start, limit = params["start"], params["limit"]
+    return {"error": "ok", "result": TXIDS[start:start + limit]}
+
+
+class TestPagination:
+    """
+    Test class for the pagination iterators
+    """
+
+    @patch.object(CoinPayments, "get_tx_list")
+    def test_iter_tx_list(self, mocked):
+        """
+        Test that all pages are walked and iteration stops at the end
+        """
+        mocked.side_effect = fake_get_tx_list
+        client = CoinPayments(public_key="public", private_key="private")
+        for prefetch in (True, False):
+            mocked.reset_mock()
+            assert TXIDS == list(client.iter_tx_list(
+                {"newer": 1}, prefetch=prefetch))
+            assert 3 == mocked.call_count
+            assert {"newer": 1, "limit": 100, "start": 200} == \
+                mocked.call_args[0][0]
+
+    @patch.object(CoinPayments, "get_tx_list")
+    def test_exact_multiple(self, mocked):
+        """
+        Test a history that ends exactly at a page boundary
+        """
+        mocked.side_effect = fake_get_tx_list
+        client = CoinPayments(public_key="public", private_key="private")
+        assert TXIDS == list(client.iter_tx_list(page_size=50))
+        # the last full page needs one more, empty, page to be sure
+        assert 6 == mocked.call_count
+
+    @patch.object(CoinPayments, "get_withdrawal_history")
+    def test_prefetch(self, mocked):
+        """
+        Test that the next page is fetched while the current one is consumed
+        """
+        fetched = threading.Event()
+
+        def fetch(params: dict = None):
+            if params["start"]:
+                fetched.set()
+                return {"error": "ok", "result": []}
+            return {"error": "ok", "result": [{"id": i} for i in range(10)]}
+
+        mocked.side_effect = fetch
+        client = CoinPayments(public_key="public", private_key="private")
+        withdrawals = client.iter_withdrawal_history(page_size=10)
+        assert {"id": 0} == next(withdrawals)
+        assert fetched.wait(1)
+        assert 9 == len(list(withdrawals))
+
+    @patch.object(CoinPayments, "get_tx_list")
+    def test_error(self, mocked):
+        """
+        Test that API errors are raised
+        """
+        mocked.return_value = {"error": "Invalid API key", "result": []}
+        client = CoinPayments(public_key="public", private_key="private")
+        with pytest.raises(CoinPaymentsError):
+            list(client.iter_tx_list())
+        with pytest.raises(ValueError):
+            list(client.iter_tx_list(page_size=101))
+
+    def test_async_iter_tx_list(self):
+        """
+        Test the async iterator
+        """
+        client = AsyncCoinPayments(public_key="public", private_key="private")
+
+        async def get_tx_list(params: dict = None):
+            await asyncio.sleep(0)
+            return fake_get_tx_list(params)
+
+        async def collect():
+            return [txid async for txid in client.iter_tx_list()]
+
+        loop = asyncio.new_event_loop()
+        with patch.object(client, "get_tx_list", get_tx_list):
+            assert TXIDS == loop.run_until_complete(collect())
+        loop.close()
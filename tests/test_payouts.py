@@ -0,0 +1,242 @@
+"""
+Tests for bulk payouts
+"""
+import json
+import re
+import threading
+from unittest.mock import MagicMock
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.exceptions import CircuitOpenError
+from python_coinpayments.instrumentation import RequestEvent
+from python_coinpayments.payouts import (
+    DUPLICATE, FAILED, SENT, UNKNOWN, PayoutEngine, PayoutLedger,
+    encode_mass_withdrawal,
+)
+
+PAYOUTS = [
+    ("payout-{}".format(i), {"amount": i, "currency": "BTC",
+                             "address": "addr{}".format(i)})
+    for i in range(1, 8)
+]
+
+
+class FakeClient:
+    """
+    Answers create_mass_withdrawal and create_withdrawal
+    """
+
+    def __init__(self, mass_error: str = None):
+        self.mass_error = mass_error
+        self.mass_calls = []
+        self.single_calls = []
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def add_listener(self, listener):
+        """
+        Call listener after each mass withdrawal
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Stop calling listener
+        """
+        self.listeners.remove(listener)
+
+    def create_mass_withdrawal(self, params: dict):
+        """
+        Create withdrawals, refusing addr3, or fail as a whole
+        """
+        with self.lock:
+            self.mass_calls.append(params)
+        event = RequestEvent("create_mass_withdrawal")
+        event.status = 200
+        for listener in self.listeners:
+            listener(event)
+        if self.mass_error:
+            return {"error": self.mass_error, "result": {}}
+        result = {}
+        for name, value in params.items():
+            number, field = re.match(r"wd\[(wd\d+)\]\[(\w+)\]", name).groups()
+            if field == "address":
+                result[number] = (
+                    {"error": "Invalid address"} if value == "addr3" else
+                    {"error": "ok", "id": "WD-" + value, "status": 0})
+        return {"error": "ok", "result": result}
+
+    def create_withdrawal(self, params: dict):
+        """
+        Create one withdrawal, refusing addr3
+        """
+        with self.lock:
+            self.single_calls.append(params)
+        if params["address"] == "addr3":
+            return {"error": "Invalid address", "result": []}
+        return {"error": "ok",
+                "result": {"id": "WD-" + params["address"], "status": 0}}
+
+
+def by_key(results):
+    """
+    Index PayoutResults by key
+    """
+    return {result.key: result for result in results}
+
+
+class TestPayouts:
+    """
+    Test class for the payout engine
+    """
+
+    def test_encode_mass_withdrawal(self):
+        """
+        Test the wd[wdN][param] encoding
+        """
+        assert {
+            "wd[wd1][amount]": 1, "wd[wd1][currency]": "BTC",
+            "wd[wd2][amount]": 2,
+        } == encode_mass_withdrawal([
+            {"amount": 1, "currency": "BTC"}, {"amount": 2}])
+
+    def test_mass(self):
+        """
+        Test that payouts are batched into mass withdrawals
+        """
+        client = FakeClient()
+        engine = PayoutEngine(client, batch_size=3, max_workers=2)
+        results = by_key(engine.iter_pay(iter(PAYOUTS)))
+
+        # 3 + 3 in mass withdrawals, the last one on its own
+        assert 2 == len(client.mass_calls)
+        assert ["addr7"] == [
+            params["address"] for params in client.single_calls]
+        assert len(PAYOUTS) == len(results)
+        assert SENT == results["payout-1"].status
+        assert "WD-addr1" == results["payout-1"].result["id"]
+        assert FAILED == results["payout-3"].status
+        assert "Invalid address" == str(results["payout-3"].error)
+
+    def test_idempotency(self):
+        """
+        Test that a rerun only resends payouts that failed
+        """
+        client = FakeClient()
+        engine = PayoutEngine(client, use_mass=False)
+        engine.pay(PAYOUTS)
+        assert 7 == len(client.single_calls)
+
+        results = by_key(engine.pay(PAYOUTS + PAYOUTS[:1]))
+        assert 7 + 1 == len(client.single_calls)
+        assert "addr3" == client.single_calls[-1]["address"]
+        assert DUPLICATE == results["payout-1"].status
+        assert "WD-addr1" == results["payout-1"].result["id"]
+        assert FAILED == results["payout-3"].status
+
+    def test_fallback_on_api_error(self):
+        """
+        Test that a refused mass withdrawal falls back to single ones
+        """
+        client = FakeClient(mass_error="Permission denied")
+        engine = PayoutEngine(client, batch_size=10)
+        results = by_key(engine.pay(PAYOUTS))
+        assert 1 == len(client.mass_calls)
+        assert 7 == len(client.single_calls)
+        assert SENT == results["payout-7"].status
+        assert FAILED == results["payout-3"].status
+        assert not client.listeners
+
+    def test_no_fallback_on_server_error(self):
+        """
+        Test that an error in a 5xx response leaves the batch unknown
+        """
+        client = CoinPayments(
+            public_key="public key", private_key="private key")
+        client.transport = MagicMock(spec=["request"])
+        client.transport.request.return_value = (
+            503, b'{"error": "Service temporarily unavailable"}')
+        engine = PayoutEngine(client)
+        results = engine.pay(PAYOUTS[:2])
+        assert [UNKNOWN, UNKNOWN] == [result.status for result in results]
+        assert "Service temporarily unavailable" == str(results[0].error)
+        assert 1 == client.transport.request.call_count
+        body = client.transport.request.call_args[1]["body"]
+        assert b"cmd=create_mass_withdrawal" in body
+        assert not client.listeners
+
+    def test_no_fallback_on_network_error(self, tmp_path):
+        """
+        Test that payouts whose outcome is unknown are never resent
+        """
+        client = MagicMock()
+        client.create_mass_withdrawal.side_effect = OSError("reset")
+        ledger = PayoutLedger(str(tmp_path / "payouts.db"))
+        engine = PayoutEngine(client, ledger=ledger)
+        results = engine.pay(PAYOUTS[:2])
+        assert [UNKNOWN, UNKNOWN] == [result.status for result in results]
+        assert not client.create_withdrawal.called
+
+        # not even by a later run, until the payout is resolved
+        ledger.close()
+        ledger = PayoutLedger(str(tmp_path / "payouts.db"))
+        engine = PayoutEngine(FakeClient(), ledger=ledger)
+        results = by_key(engine.pay(PAYOUTS[:2]))
+        assert UNKNOWN == results["payout-1"].status
+        assert "reset" == str(results["payout-1"].error)
+        assert not engine.client.mass_calls
+
+        ledger.resolve("payout-1", {"id": "WD-addr1"})
+        ledger.resolve("payout-2")
+        results = by_key(engine.pay(PAYOUTS[:2]))
+        assert DUPLICATE == results["payout-1"].status
+        assert SENT == results["payout-2"].status
+        assert 1 == len(engine.client.single_calls)
+
+    def test_not_sent_errors(self):
+        """
+        Test that calls refused by the circuit breaker can be retried
+        """
+        client = MagicMock()
+        client.create_withdrawal.side_effect = CircuitOpenError("open")
+        engine = PayoutEngine(client)
+        assert [FAILED] == [result.status for result in engine.pay(
+            PAYOUTS[:1])]
+        assert FAILED == engine.ledger.status("payout-1")
+
+    def test_error_classification(self):
+        """
+        Test that only transport and decoding errors leave payouts unknown
+        """
+        client = MagicMock()
+        client.create_mass_withdrawal.side_effect = TypeError("bug")
+        client.create_withdrawal.side_effect = json.JSONDecodeError(
+            "Expecting value", "<html>", 0)
+        engine = PayoutEngine(client)
+        assert [FAILED, FAILED] == [
+            result.status for result in engine.pay(PAYOUTS[:2])]
+
+        engine = PayoutEngine(client, use_mass=False)
+        assert [UNKNOWN] == [
+            result.status for result in engine.pay(PAYOUTS[2:3])]
+
+    def test_invalid_params(self):
+        """
+        Test that payouts refused for missing params can be retried once
+        they are corrected
+        """
+        client = CoinPayments(
+            public_key="public key", private_key="private key")
+        client.transport = MagicMock(spec=["request"])
+        client.transport.request.return_value = (
+            200, b'{"error": "ok", "result": {"id": "WD-addr1"}}')
+        engine = PayoutEngine(client, use_mass=False)
+        result, = engine.pay([("payout-1", {"address": "addr1"})])
+        assert FAILED == result.status
+        assert isinstance(result.error, ValueError)
+        client.transport.request.assert_not_called()
+
+        result, = engine.pay(PAYOUTS[:1])
+        assert SENT == result.status
+        assert "WD-addr1" == result.result["id"]
+        assert SENT == engine.ledger.status("payout-1")
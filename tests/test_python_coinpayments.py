@@ -1,11 +1,14 @@
 """
 Tests for the pesa app
 """
+import urllib.parse
 from decimal import Decimal
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock
 
-from python_coinpayments import (CoinPayments, authenticate_ipn_request,
-                                 calculate_hmac)
+import pytest
+
+from python_coinpayments import (CoinPayments, ConnectionPool, ResponseCache,
+                                 authenticate_ipn_request, calculate_hmac)
 
 CLIENT = CoinPayments(
     public_key="public key",
@@ -13,6 +16,41 @@ CLIENT = CoinPayments(
     ipn_url="https://example.com")
 
 
+def make_client():
+    """
+    Get a client like CLIENT whose mock transport answers every request
+    """
+    transport = MagicMock()
+    transport.request.return_value = (200, b'{"error": "ok"}')
+    return CoinPayments(
+        public_key="public key",
+        private_key="private key",
+        ipn_url="https://example.com",
+        transport=transport)
+
+
+def sent_params(client: CoinPayments):
+    """
+    Get the params of the one request a client sent, checking its HMAC
+
+    Values are strings, as they were sent.
+    """
+    client.transport.request.assert_called_once()
+    args, kwargs = client.transport.request.call_args
+    assert ("POST", client.url) == args
+    params = dict(urllib.parse.parse_qsl(kwargs["body"].decode("utf-8")))
+    assert calculate_hmac("private key", **params) == \
+        kwargs["headers"]["Hmac"]
+    return params
+
+
+def as_sent(params: dict):
+    """
+    Get params with their values as they are sent
+    """
+    return {name: str(value) for name, value in params.items()}
+
+
 class TestCoinPayments:
     """
     Test class for CoinPayments
@@ -28,19 +66,6 @@ class TestCoinPayments:
         assert "json" == CLIENT.format
         assert 1 == CLIENT.version
 
-    def test_package_params(self):
-        """
-        Test that _package_params works
-        """
-        input_params = {"hello": "world", "foo": "bar"}
-        assert {
-            "hello": "world",
-            "key": CLIENT.public_key,
-            "version": CLIENT.version,
-            "format": CLIENT.format,
-            "foo": "bar",
-        } == CLIENT._package_params(input_params)
-
     def test_calculate_hmac(self):
         """
         Test calculate_hmac
@@ -156,7 +181,12 @@ class TestCoinPayments:
         """
         Test create_hmac
         """
-        params = CLIENT._package_params({"foo": "bar"})
+        params = {
+            "foo": "bar",
+            "key": CLIENT.public_key,
+            "version": CLIENT.version,
+            "format": CLIENT.format,
+        }
         encoded, sig = CLIENT.create_hmac(**params)
         assert b"foo=bar&key=public+key&version=1&format=json" == encoded
         assert (
@@ -164,8 +194,7 @@ class TestCoinPayments:
             "2ae6db1e21f75711a851575e64fe625772e8cf0323c1819efe63e6b0e98c97b"
             == sig)
 
-    @patch.object(CoinPayments, "request")
-    def test_create_transaction(self, mocked_request):
+    def test_create_transaction(self):
         """
         Test create_transaction
         """
@@ -182,92 +211,98 @@ class TestCoinPayments:
             custom="custom-field-1337",
             ipn_url="https://example.com",
         )
-        CLIENT.create_transaction(params=params)
+        client = make_client()
+        client.create_transaction(params=params)
         # get final_params
         params.update({
             "key": CLIENT.public_key,
             "version": CLIENT.version,
             "format": CLIENT.format,
+            "cmd": "create_transaction",
         })
-        mocked_request.assert_called_once_with("post", **params)
+        assert as_sent(params) == sent_params(client)
 
-    @patch.object(CoinPayments, "request")
-    def test_get_basic_info(self, mocked_request):
+    def test_get_basic_info(self):
         """
         Test get_basic_info
         """
         params = {}
-        CLIENT.get_basic_info(params=params)
+        client = make_client()
+        client.get_basic_info(params=params)
         # get final_params
         params.update({
             "key": CLIENT.public_key,
             "version": CLIENT.version,
             "format": CLIENT.format,
+            "cmd": "get_basic_info",
         })
-        mocked_request.assert_called_once_with("post", **params)
+        assert as_sent(params) == sent_params(client)
 
-    @patch.object(CoinPayments, "request")
-    def test_rates(self, mocked_request):
+    def test_rates(self):
         """
         Test rates
         """
         params = {}
-        CLIENT.rates(params=params)
+        client = make_client()
+        client.rates(params=params)
         # get final_params
         params.update({
             "key": CLIENT.public_key,
             "version": CLIENT.version,
             "format": CLIENT.format,
+            "cmd": "rates",
         })
-        mocked_request.assert_called_once_with("post", **params)
+        assert as_sent(params) == sent_params(client)
 
-    @patch.object(CoinPayments, "request")
-    def test_get_withdrawal_history(self, mocked_request):
+    def test_get_withdrawal_history(self):
         """
         Test get_withdrawal_history
         """
         params = {}
-        CLIENT.get_withdrawal_history(params=params)
+        client = make_client()
+        client.get_withdrawal_history(params=params)
         # get final_params
         params.update({
             "key": CLIENT.public_key,
             "version": CLIENT.version,
             "format": CLIENT.format,
+            "cmd": "get_withdrawal_history",
         })
-        mocked_request.assert_called_once_with("post", **params)
+        assert as_sent(params) == sent_params(client)
 
-    @patch.object(CoinPayments, "request")
-    def test_get_deposit_address(self, mocked_request):
+    def test_get_deposit_address(self):
         """
         Test get_deposit_address
         """
         params = {"currency": "BTC"}
-        CLIENT.get_deposit_address(params=params)
+        client = make_client()
+        client.get_deposit_address(params=params)
         # get final_params
         params.update({
             "key": CLIENT.public_key,
             "version": CLIENT.version,
             "format": CLIENT.format,
+            "cmd": "get_deposit_address",
         })
-        mocked_request.assert_called_once_with("post", **params)
+        assert as_sent(params) == sent_params(client)
 
-    @patch.object(CoinPayments, "request")
-    def test_balances(self, mocked_request):
+    def test_balances(self):
         """
         Test balances
         """
         params = {"all": 1}
-        CLIENT.balances(params=params)
+        client = make_client()
+        client.balances(params=params)
         # get final_params
         params.update({
             "key": CLIENT.public_key,
             "version": CLIENT.version,
             "format": CLIENT.format,
+            "cmd": "balances",
         })
-        mocked_request.assert_called_once_with("post", **params)
+        assert as_sent(params) == sent_params(client)
 
-    @patch.object(CoinPayments, "request")
-    def test_create_withdrawal(self, mocked_request):
+    def test_create_withdrawal(self):
         """
         Test create_withdrawal
         """
@@ -279,23 +314,43 @@ class TestCoinPayments:
             note="The note",
             ipn_url="https://example.com",
         )
-        CLIENT.create_withdrawal(params=params)
+        client = make_client()
+        client.create_withdrawal(params=params)
+        # get final_params
+        params.update({
+            "key": CLIENT.public_key,
+            "version": CLIENT.version,
+            "format": CLIENT.format,
+            "cmd": "create_withdrawal",
+        })
+        assert as_sent(params) == sent_params(client)
+
+    def test_create_mass_withdrawal(self):
+        """
+        Test create_mass_withdrawal
+        """
+        params = {
+            "wd[wd1][amount]": Decimal(10),
+            "wd[wd1][currency]": "BTC",
+            "wd[wd1][address]": "DepositBitcoinAddress",
+        }
+        client = make_client()
+        client.create_mass_withdrawal(params=params)
         # get final_params
         params.update({
             "key": CLIENT.public_key,
             "version": CLIENT.version,
             "format": CLIENT.format,
+            "cmd": "create_mass_withdrawal",
         })
-        mocked_request.assert_called_once_with("post", **params)
+        assert as_sent(params) == sent_params(client)
 
-    @patch("python_coinpayments.api.urllib.request.urlopen")
-    def test_request(self, mocked_request):
+    def test_request(self):
         """
         Test the request method
         """
-        cm = MagicMock()
-        cm.getcode.return_value = 200
-        cm.read.return_value = """
+        transport = MagicMock()
+        transport.request.return_value = (200, b"""
             {
                 "error": "ok",
                 "result": {
@@ -303,9 +358,11 @@ class TestCoinPayments:
                     "status": 0,
                     "amount": 1.00
                 }
-            }"""
-        cm.__enter__.return_value = cm
-        mocked_request.return_value = cm
+            }""")
+        client = CoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport)
 
         params = dict(
             amount=Decimal(10),
@@ -316,17 +373,120 @@ class TestCoinPayments:
             ipn_url="https://example.com",
         )
 
-        encoded, sig = CLIENT.create_hmac(**params)
+        encoded, sig = client.create_hmac(**params)
         headers = {
             "Hmac": sig,
             "Content-type": "application/x-www-form-urlencoded"
         }
-        CLIENT.request("post", **params)
+        result = client.request("post", **params)
+
+        assert "ok" == result["error"]
+        assert 1 == transport.request.call_count
+        args, kwargs = transport.request.call_args_list[0]
+
+        assert ("POST", "https://www.coinpayments.net/api.php") == args
+        assert headers == kwargs["headers"]
+        assert encoded == kwargs["body"]
+
+    def test_request_error_body(self):
+        """
+        Test that error responses are still parsed as JSON
+        """
+        transport = MagicMock()
+        transport.request.return_value = (
+            500, b'{"error": "Invalid command"}')
+        client = CoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport)
+
+        assert {"error": "Invalid command"} == client.request(
+            "post", cmd="nope")
+
+    def test_default_transport(self):
+        """
+        Test that the client uses a connection pool by default
+        """
+        assert isinstance(CLIENT.transport, ConnectionPool)
+
+    def test_command_body(self):
+        """
+        Test that API methods send the precompiled constant fields, then
+        the caller's, correctly signed
+        """
+        transport = MagicMock()
+        transport.request.return_value = (200, b'{"error": "ok"}')
+        client = CoinPayments(
+            public_key="public key",
+            private_key="private key",
+            ipn_url="https://example.com/ipn",
+            transport=transport)
+        params = {
+            "currency": "BTC",
+            "label": "a&b",
+            "cmd": "rates",  # constant fields cannot be overridden
+            "key": "someone else",
+        }
+
+        client.get_callback_address(params)
+        _, kwargs = transport.request.call_args
+        assert (
+            b"version=1&key=public+key&cmd=get_callback_address&format=json"
+            b"&ipn_url=https%3A%2F%2Fexample.com%2Fipn"
+            b"&currency=BTC&label=a%26b") == kwargs["body"]
+        assert calculate_hmac(
+            "private key", version=1, key="public key",
+            cmd="get_callback_address", format="json",
+            ipn_url="https://example.com/ipn", currency="BTC",
+            label="a&b") == kwargs["headers"]["Hmac"]
+        assert 4 == len(params)
 
-        assert 1 == mocked_request.call_count
-        args, kwargs = mocked_request.call_args_list[0]
-        request = args[0]
+        # the specs follow changes to the client's settings
+        client.public_key = "new key"
+        client.private_key = "new secret"
+        client.ipn_url = ""
+        client.rates()
+        _, kwargs = transport.request.call_args
+        assert b"version=1&key=new+key&cmd=rates&format=json" == \
+            kwargs["body"]
+        assert calculate_hmac(
+            "new secret", version=1, key="new key", cmd="rates",
+            format="json") == kwargs["headers"]["Hmac"]
 
-        assert headers == request.headers
-        assert encoded == request.data
-        assert "https://www.coinpayments.net/api.php" == request.full_url
+    def test_command_through_request(self):
+        """
+        Test that API methods go through request, with the cache too
+        """
+        client = make_client()
+        client.request = MagicMock(wraps=client.request)
+        client.rates({"short": 1})
+        client.request.assert_called_once()
+        kwargs = client.request.call_args[1]
+        assert "rates" == kwargs.pop("spec").cmd
+        assert {"short": 1} == kwargs
+
+        client = make_client()
+        client.cache = ResponseCache()
+        for _ in range(2):
+            assert "ok" == client.rates({"short": 1})["error"]
+        assert {
+            "version": "1", "key": "public key", "cmd": "rates",
+            "format": "json", "short": "1",
+        } == sent_params(client)
+
+    def test_required_params(self):
+        """
+        Test that calls missing a required param are refused unsent
+        """
+        transport = MagicMock()
+        client = CoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport)
+        with pytest.raises(ValueError) as excinfo:
+            client.create_transaction({"amount": 1, "currency1": "USD"})
+        assert "create_transaction requires currency2, buyer_email" == \
+            str(excinfo.value)
+        with pytest.raises(ValueError):
+            client.get_tx_info()
+        transport.request.assert_not_called()
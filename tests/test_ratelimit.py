@@ -0,0 +1,170 @@
+"""
+Tests for the client-side rate limiter
+"""
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.aio import AsyncCoinPayments
+from python_coinpayments.exceptions import RateLimitTimeout
+from python_coinpayments.ratelimit import RateLimiter
+
+
+class TestRateLimiter:
+    """
+    Test class for RateLimiter
+    """
+
+    def test_burst_then_throttle(self):
+        """
+        Test that bursts go through and further calls wait for tokens
+        """
+        limiter = RateLimiter(rate=20, burst=2)
+        assert 0.01 > limiter.acquire("key", "rates")
+        assert 0.01 > limiter.acquire("key", "rates")
+        assert 0.03 < limiter.acquire("key", "rates")
+        # other keys have their own bucket
+        assert 0.01 > limiter.acquire("other key", "rates")
+
+    def test_priority(self):
+        """
+        Test that critical commands go ahead of background ones
+        """
+        limiter = RateLimiter(rate=10, burst=1)
+        limiter.acquire("key", "rates")
+        order = []
+
+        def call(cmd):
+            limiter.acquire("key", cmd)
+            order.append(cmd)
+
+        background = threading.Thread(target=call, args=("get_tx_ids", ))
+        background.start()
+        time.sleep(0.02)
+        critical = threading.Thread(
+            target=call, args=("create_transaction", ))
+        critical.start()
+        background.join()
+        critical.join()
+        assert ["create_transaction", "get_tx_ids"] == order
+
+    def test_command_limits(self):
+        """
+        Test per command limits
+        """
+        limiter = RateLimiter(
+            rate=1000, command_limits={"get_tx_ids": (20, 1)})
+        limiter.acquire("key", "get_tx_ids")
+        assert 0.03 < limiter.acquire("key", "get_tx_ids")
+        assert 0.01 > limiter.acquire("key", "rates")
+
+    def test_timeout(self):
+        """
+        Test that waiting too long raises RateLimitTimeout
+        """
+        limiter = RateLimiter(rate=1, burst=1)
+        limiter.acquire("key", "rates")
+        with pytest.raises(RateLimitTimeout):
+            limiter.acquire("key", "rates", timeout=0.05)
+        metrics = limiter.metrics()
+        assert 0 == metrics["queue_depth"]
+        assert 1 == metrics["timeouts"]
+
+    def test_metrics(self):
+        """
+        Test queue depth and wait time metrics
+        """
+        limiter = RateLimiter(rate=20, burst=1)
+        threads = [
+            threading.Thread(target=limiter.acquire, args=("key", "rates"))
+            for _ in range(3)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics = limiter.metrics()
+        assert 3 == metrics["acquired"]
+        assert 0 == metrics["queue_depth"]
+        assert metrics["max_queue_depth"] >= 2
+        assert 0.08 < metrics["wait_time_total"]
+        assert 3 == metrics["commands"]["rates"]["acquired"]
+
+    def test_acquire_async(self):
+        """
+        Test waiting for tokens without blocking the event loop
+        """
+        limiter = RateLimiter(rate=20, burst=1)
+
+        async def calls():
+            return await asyncio.gather(
+                *[limiter.acquire_async("key", "rates") for _ in range(3)])
+
+        loop = asyncio.new_event_loop()
+        waits = loop.run_until_complete(calls())
+        loop.close()
+        assert 0.08 < max(waits)
+
+    def test_client(self):
+        """
+        Test that the client asks the limiter before each call
+        """
+        limiter = MagicMock()
+        transport = MagicMock()
+        transport.request.return_value = (200, b'{"error": "ok"}')
+        client = CoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport,
+            rate_limiter=limiter)
+        client.balances()
+        limiter.acquire.assert_called_once_with(
+            "public key", "balances", timeout=None)
+
+    def test_client_timeout(self):
+        """
+        Test that calls waiting too long for the limiter are not sent
+        """
+        transport = MagicMock()
+        transport.request.return_value = (200, b'{"error": "ok"}')
+        client = CoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport,
+            rate_limiter=RateLimiter(rate=1, burst=1),
+            acquire_timeout=0.05)
+        client.balances()
+        with pytest.raises(RateLimitTimeout):
+            client.balances()
+        assert 1 == transport.request.call_count
+
+    def test_async_client_timeout(self):
+        """
+        Test the acquire timeout of the asyncio client
+        """
+        transport = MagicMock()
+
+        async def request(*args, **kwargs):
+            return 200, b'{"error": "ok"}'
+
+        transport.request.side_effect = request
+        client = AsyncCoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport,
+            rate_limiter=RateLimiter(rate=1, burst=1),
+            acquire_timeout=0.05)
+
+        async def calls():
+            await client.balances()
+            with pytest.raises(RateLimitTimeout):
+                await client.balances()
+
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(calls())
+        loop.close()
+        assert 1 == transport.request.call_count
@@ -0,0 +1,117 @@
+"""
+Tests for the indexed exchange rates
+"""
+from decimal import ROUND_DOWN, Decimal
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments.exceptions import CoinPaymentsError
+from python_coinpayments.rates import RatesSnapshot
+
+RATES = {
+    "error": "ok",
+    "result": {
+        "BTC": {"is_fiat": 0, "rate_btc": "1.000000000000000000000000"},
+        "LTC": {"is_fiat": 0, "rate_btc": "0.012500000000000000000000"},
+        "USD": {"is_fiat": 1, "rate_btc": "0.000250000000000000000000"},
+        "DEAD": {"is_fiat": 0, "rate_btc": "0"},
+    },
+}
+
+
+class TestRatesSnapshot:
+    """
+    Test class for RatesSnapshot
+    """
+
+    def test_convert(self):
+        """
+        Test converting single amounts
+        """
+        rates = RatesSnapshot(RATES)
+        assert Decimal("0.02500000") == rates.convert(100, "USD", "BTC")
+        assert Decimal("50.00000000") == rates.convert("1", "LTC", "USD")
+        assert Decimal("3.33") == rates.convert(
+            "0.0666", "LTC", "USD", places=2)
+        assert Decimal("0.00003333") == rates.convert(
+            Decimal("0.1333333"), "USD", "BTC", rounding=ROUND_DOWN)
+        assert "DEAD" not in rates
+        with pytest.raises(KeyError):
+            rates.convert(1, "DEAD", "BTC")
+        with pytest.raises(KeyError):
+            rates.convert(1, "BTC", "EUR")
+
+    def test_convert_many(self):
+        """
+        Test batched conversion
+        """
+        rates = RatesSnapshot(RATES)
+        conversions = [(i, "USD", "LTC") for i in range(1, 6)] + [
+            (1, "BTC", "USD"),
+        ]
+        assert [Decimal(i) / 50 for i in range(1, 6)] + [Decimal(4000)] == \
+            rates.convert_many(conversions)
+
+    def test_convert_many_numpy(self):
+        """
+        Test vectorised conversion gives the same rounded results
+        """
+        pytest.importorskip("numpy")
+        rates = RatesSnapshot(RATES)
+        conversions = [(Decimal(i) / 7, "USD", "LTC") for i in range(100)]
+        assert rates.convert_many(conversions) == rates.convert_many(
+            conversions, use_numpy=True)
+
+    def test_update(self):
+        """
+        Test incremental updates keep indexes and report changes
+        """
+        rates = RatesSnapshot(RATES)
+        ltc = rates.index("LTC")
+        assert 1 == rates.version
+
+        newer = {"error": "ok", "result": dict(RATES["result"])}
+        newer["result"]["LTC"] = {"rate_btc": "0.025"}
+        newer["result"]["ETH"] = {"rate_btc": "0.03"}
+        del newer["result"]["USD"]
+
+        assert {"LTC", "ETH", "USD"} == rates.update(newer)
+        assert ltc == rates.index("LTC")
+        assert Decimal("0.025") == rates.rate("LTC", "BTC")
+        assert "USD" not in rates
+        assert 2 == rates.version
+        assert set() == rates.update(newer)
+        assert 2 == rates.version
+
+    def test_invalid_rates(self):
+        """
+        Test that coins with an invalid rate have no rate
+        """
+        rates = RatesSnapshot({"error": "ok", "result": {
+            "BTC": {"rate_btc": "1"},
+            "LTC": {"rate_btc": 0.0125},
+            "BAD": {"rate_btc": "n/a"},
+            "INF": {"rate_btc": "Infinity"},
+            "LIST": {"rate_btc": []},
+        }})
+        assert Decimal("0.0125") == rates.rate("LTC", "BTC")
+        assert {"BTC", "LTC"} == {
+            coin for coin in rates.coins if coin in rates}
+
+    def test_errors(self):
+        """
+        Test that API errors are raised
+        """
+        with pytest.raises(CoinPaymentsError):
+            RatesSnapshot({"error": "Invalid API key"})
+
+    def test_from_client(self):
+        """
+        Test building and refreshing from a client
+        """
+        client = MagicMock()
+        client.rates.return_value = RATES
+        rates = RatesSnapshot.from_client(client)
+        assert 3 == len([coin for coin in rates.coins if coin in rates])
+        assert set() == rates.refresh(client)
@@ -0,0 +1,152 @@
+"""
+Tests for deadlines, retries and circuit breaking
+"""
+import socket
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from python_coinpayments import CoinPayments, ConnectionPool
+from python_coinpayments.exceptions import CircuitOpenError
+from python_coinpayments.resilience import (
+    CircuitBreaker, RetryPolicy, split_timeout,
+)
+
+OK = (200, b'{"error": "ok"}')
+
+
+def make_client(responses, **kwargs):
+    """
+    Get a client whose transport answers with responses in turn
+    """
+    transport = MagicMock()
+    transport.request.side_effect = responses
+    kwargs.setdefault("retry", RetryPolicy(backoff=0))
+    return CoinPayments(
+        public_key="public key",
+        private_key="private key",
+        transport=transport,
+        **kwargs)
+
+
+class TestRetries:
+    """
+    Test class for timeouts and retries
+    """
+
+    def test_split_timeout(self):
+        """
+        Test the timeout formats
+        """
+        assert (1, 1) == split_timeout(1)
+        assert (1, 2) == split_timeout((1, 2))
+        assert (None, None) == split_timeout(None)
+
+    def test_delay(self):
+        """
+        Test the jittered backoff
+        """
+        policy = RetryPolicy(max_attempts=4, backoff=1, max_backoff=3)
+        for attempt, ceiling in enumerate((1, 2, 3)):
+            assert 0 <= policy.delay("rates", attempt) <= ceiling
+        assert policy.delay("rates", 3) is None
+        assert policy.delay("create_withdrawal", 0) is None
+
+    def test_read_command_retried(self):
+        """
+        Test that read-only commands are retried on transport errors
+        """
+        client = make_client([ConnectionResetError(), socket.timeout(), OK])
+        assert {"error": "ok"} == client.get_tx_info({"txid": "x"})
+        assert 3 == client.transport.request.call_count
+
+    def test_retries_exhausted(self):
+        """
+        Test that the last error is raised once retries run out
+        """
+        client = make_client([OSError("1"), OSError("2"), OSError("3")])
+        with pytest.raises(OSError, match="3"):
+            client.balances()
+
+    def test_mutating_command_not_retried(self):
+        """
+        Test that commands that move funds are never retried
+        """
+        client = make_client([socket.timeout(), OK])
+        with pytest.raises(socket.timeout):
+            client.create_withdrawal({"amount": 1, "currency": "BTC"})
+        assert 1 == client.transport.request.call_count
+
+    def test_server_errors(self):
+        """
+        Test that 5xx responses are retried and their body still parsed
+        """
+        error = (503, b'{"error": "Unavailable"}')
+        client = make_client([error, OK])
+        assert {"error": "ok"} == client.rates()
+
+        client = make_client([error, error, error])
+        assert {"error": "Unavailable"} == client.rates()
+
+    def test_timeouts(self):
+        """
+        Test that per command timeouts are given to the transport
+        """
+        client = make_client(
+            [OK, OK], timeout=(1, 5), timeouts={"get_tx_ids": (1, 30)})
+        client.rates()
+        client.get_tx_list()
+        calls = client.transport.request.call_args_list
+        assert (1, 5) == calls[0][1]["timeout"]
+        assert (1, 30) == calls[1][1]["timeout"]
+
+    def test_pool_read_timeout(self, server):
+        """
+        Test that a stalled server does not hang the connection pool
+        """
+        server.delay = 0.3
+        pool = ConnectionPool()
+        with pytest.raises(socket.timeout):
+            pool.request("POST", server.url, body=b"x", timeout=(1, 0.05))
+
+
+class TestCircuitBreaker:
+    """
+    Test class for CircuitBreaker
+    """
+
+    def test_opens_and_recovers(self):
+        """
+        Test that the breaker fails fast and lets a trial call through
+        """
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10)
+        client = make_client(
+            [OSError(), OSError(), OK],
+            retry=RetryPolicy(max_attempts=1),
+            circuit_breaker=breaker)
+
+        for _ in range(2):
+            with pytest.raises(OSError):
+                client.rates()
+        assert CircuitBreaker.OPEN == breaker.state
+        with pytest.raises(CircuitOpenError):
+            client.rates()
+        assert 2 == client.transport.request.call_count
+
+        with patch("python_coinpayments.resilience.time.monotonic",
+                   return_value=breaker.opened_at + 11):
+            assert {"error": "ok"} == client.rates()
+        assert CircuitBreaker.CLOSED == breaker.state
+
+    def test_half_open_failure(self):
+        """
+        Test that a failed trial call opens the circuit again
+        """
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        breaker.before_call()
+        assert CircuitBreaker.HALF_OPEN == breaker.state
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record_failure()
+        assert CircuitBreaker.OPEN == breaker.state
@@ -0,0 +1,93 @@
+"""
+Tests for request signing
+"""
+import hashlib
+import hmac
+import time
+import urllib.parse
+from decimal import Decimal
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.signing import Signer, calculate_hmac, encode_params
+
+PARAMS = dict(
+    amount=Decimal("10.5"),
+    currency1="USD",
+    currency2="BTC",
+    buyer_email="johndoe@example.com",
+    item_name="Investment & more",
+    item_number=1337,
+    key="public key",
+    version=1,
+    format="json",
+    cmd="create_transaction",
+)
+
+
+def legacy_create_hmac(secret: str, **params):
+    """
+    The signing path before requests were encoded once
+    """
+    encoded = urllib.parse.urlencode(params).encode("utf-8")
+    sig = hmac.new(bytearray(secret, "utf-8"),
+                   urllib.parse.urlencode(params).encode("utf-8"),
+                   hashlib.sha512).hexdigest()
+    return encoded, sig
+
+
+def throughput(func, rounds: int = 2000):
+    """
+    Get the best of three runs of func, in calls per second
+    """
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return rounds / best
+
+
+class TestSigning:
+    """
+    Test class for the signing helpers
+    """
+
+    def test_encode_params_order(self):
+        """
+        Test that params are encoded in insertion order
+        """
+        assert b"b=2&a=1" == encode_params({"b": 2, "a": 1})
+
+    def test_same_output(self):
+        """
+        Test that signing is byte-for-byte the same as before
+        """
+        for secret in ("private key", "", "ünïcödé"):
+            signer = Signer(secret)
+            assert legacy_create_hmac(secret, **PARAMS) == \
+                signer.sign_params(PARAMS)
+            assert legacy_create_hmac(secret, **PARAMS)[1] == \
+                calculate_hmac(secret, **PARAMS)
+
+    def test_private_key_change(self):
+        """
+        Test that changing the private key re-keys the signer
+        """
+        client = CoinPayments(public_key="public", private_key="one")
+        client.private_key = "two"
+        assert legacy_create_hmac("two", **PARAMS) == \
+            client.create_hmac(**PARAMS)
+
+    def test_signing_throughput(self, record_property):
+        """
+        Track signing throughput per request
+
+        The figures are reported as test properties (see pytest --junitxml)
+        """
+        client = CoinPayments(public_key="public", private_key="private")
+        legacy = throughput(
+            lambda: legacy_create_hmac("private", **PARAMS))
+        current = throughput(lambda: client.create_hmac(**PARAMS))
+        record_property("legacy_signs_per_second", round(legacy))
+        record_property("signs_per_second", round(current))
@@ -0,0 +1,172 @@
+"""
+Tests for coalescing identical in-flight requests
+"""
+import asyncio
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments import AsyncCoinPayments, CoinPayments
+from python_coinpayments.singleflight import AsyncSingleFlight, SingleFlight
+
+# the params create_transaction requires
+TRANSACTION = {
+    "amount": 1,
+    "currency1": "USD",
+    "currency2": "BTC",
+    "buyer_email": "buyer@example.com",
+}
+
+
+class TestSingleFlight:
+    """
+    Test class for SingleFlight
+    """
+
+    def test_concurrent_calls_share_one_execution(self):
+        """
+        Test that concurrent identical calls run once
+        """
+        flight = SingleFlight()
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"error": "ok"}
+
+        results = []
+        threads = [
+            threading.Thread(
+                target=lambda: results.append(flight.do("key", slow)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert 1 == len(calls)
+        assert 10 == len(results)
+        assert all(result is results[0] for result in results)
+        assert 0 == len(flight)
+
+    def test_errors_are_shared(self):
+        """
+        Test that waiting callers get the leader's exception
+        """
+        flight = SingleFlight()
+        started = threading.Event()
+
+        def failing():
+            started.set()
+            time.sleep(0.1)
+            raise OSError("boom")
+
+        errors = []
+
+        def call():
+            try:
+                flight.do("key", failing)
+            except OSError as exception:
+                errors.append(exception)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait()
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join()
+        follower.join()
+        assert 2 == len(errors)
+        assert errors[0] is errors[1]
+
+    def test_client_coalesces_read_only_commands(self):
+        """
+        Test that the client coalesces rates() but not create_transaction()
+        """
+        transport = MagicMock()
+
+        def slow_request(*args, **kwargs):
+            time.sleep(0.1)
+            return 200, b'{"error": "ok"}'
+
+        transport.request.side_effect = slow_request
+        client = CoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport,
+            coalesce=True)
+
+        def run_concurrently(func, count=5):
+            threads = [threading.Thread(target=func) for _ in range(count)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        run_concurrently(client.rates)
+        assert 1 == transport.request.call_count
+        run_concurrently(lambda: client.create_transaction(TRANSACTION))
+        assert 6 == transport.request.call_count
+
+
+class TestAsyncSingleFlight:
+    """
+    Test class for AsyncSingleFlight
+    """
+
+    def test_client_coalesces_read_only_commands(self):
+        """
+        Test that concurrent identical calls share one request
+        """
+        calls = []
+
+        async def slow_request(*args, **kwargs):
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 200, b'{"error": "ok"}'
+
+        transport = MagicMock()
+        transport.request.side_effect = slow_request
+        client = AsyncCoinPayments(
+            public_key="public key",
+            private_key="private key",
+            transport=transport,
+            coalesce=True)
+
+        async def requests():
+            return await asyncio.gather(
+                *[client.balances() for _ in range(10)])
+
+        loop = asyncio.new_event_loop()
+        results = loop.run_until_complete(requests())
+        loop.close()
+        assert 1 == len(calls)
+        assert all(result is results[0] for result in results)
+
+    def test_cancelled_waiter_does_not_cancel_call(self):
+        """
+        Test that cancelling one caller leaves the shared call running
+        """
+        flight = AsyncSingleFlight()
+
+        async def slow():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def requests():
+            first = asyncio.ensure_future(flight.do("key", slow))
+            second = asyncio.ensure_future(flight.do("key", slow))
+            await asyncio.sleep(0)
+            first.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await first
+            return await second
+
+        loop = asyncio.new_event_loop()
+        assert "done" == loop.run_until_complete(requests())
+        loop.close()
+        assert 0 == len(flight)
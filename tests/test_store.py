@@ -0,0 +1,206 @@
+"""
+Tests for the store of final results
+"""
+import asyncio
+import json
+import threading
+import urllib.parse
+
+from python_coinpayments import (
+    AsyncCoinPayments, CoinPayments, FinalResultStore,
+)
+from python_coinpayments.decoders import decimal_decoder
+
+STATUSES = {"CPA": 100, "CPB": 0, "CPC": -1, "CPD": 2}
+
+
+class FakeTransport:
+    """
+    Answers get_tx_info(_multi) and get_withdrawal_info from STATUSES
+    """
+
+    def __init__(self):
+        self.requested = []
+
+    def answer(self, body: bytes):
+        """
+        Get the response to a request body
+        """
+        params = dict(urllib.parse.parse_qsl(body.decode()))
+        cmd = params["cmd"]
+        if cmd == "get_tx_info_multi":
+            txids = params["txid"].split("|")
+            self.requested.append(txids)
+            return {"error": "ok", "result": {
+                txid: {"error": "ok", "status": STATUSES[txid],
+                       "amountf": "1.50000000"}
+                for txid in txids}}
+        key = params.get("txid", params.get("id"))
+        self.requested.append([key])
+        if key not in STATUSES:
+            return {"error": "Invalid ID", "result": []}
+        return {"error": "ok", "result": {
+            "status": STATUSES[key], "amountf": "1.50000000"}}
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Send a fake request
+        """
+        return 200, json.dumps(self.answer(body)).encode()
+
+
+class AsyncFakeTransport(FakeTransport):
+    """
+    FakeTransport for the asyncio client
+    """
+
+    async def request(self, method, url, body=None, headers=None,
+                      timeout=None):
+        return 200, json.dumps(self.answer(body)).encode()
+
+
+def make_client(store: FinalResultStore, client_class=CoinPayments,
+                transport_class=FakeTransport):
+    """
+    Get a client with a store and a fake transport
+    """
+    return client_class(
+        public_key="public key",
+        private_key="private key",
+        transport=transport_class(),
+        store=store)
+
+
+class TestFinalResultStore:
+    """
+    Test class for FinalResultStore
+    """
+
+    def test_get_tx_info(self, tmp_path):
+        """
+        Test that only final results are stored and then served locally
+        """
+        store = FinalResultStore(str(tmp_path / "store.db"))
+        client = make_client(store)
+        for _ in range(2):
+            for txid in ("CPA", "CPB"):
+                response = client.get_tx_info({"txid": txid})
+                assert STATUSES[txid] == response["result"]["status"]
+        assert [["CPA"], ["CPB"], ["CPB"]] == client.transport.requested
+        assert 1 == len(store)
+
+        # queued for payout still becomes complete, so it is not stored
+        for _ in range(2):
+            assert 2 == client.get_tx_info({"txid": "CPD"})["result"]["status"]
+        assert [["CPD"], ["CPD"]] == client.transport.requested[-2:]
+        assert 1 == len(store)
+
+        # errors and full lookups are not stored
+        assert "Invalid ID" == client.get_tx_info({"txid": "CPX"})["error"]
+        client.get_tx_info({"txid": "CPA", "full": 1})
+        assert 1 == len(store)
+        assert ["CPA"] == client.transport.requested[-1]
+
+    def test_get_tx_info_multi(self, tmp_path):
+        """
+        Test that only the IDs missing from the store are requested
+        """
+        store = FinalResultStore(str(tmp_path / "store.db"))
+        client = make_client(store)
+        client.get_tx_info({"txid": "CPA"})
+
+        response = client.get_tx_info_multi({"txid": "CPA|CPB|CPC"})
+        assert ["CPB", "CPC"] == client.transport.requested[-1]
+        assert ["CPA", "CPB", "CPC"] == list(response["result"])
+        assert {"error": "ok", "status": 100, "amountf": "1.50000000"} == \
+            response["result"]["CPA"]
+        assert {"CPA", "CPC"} == set(store.get_many("tx", STATUSES))
+
+        # a stored multi entry answers get_tx_info without its error field
+        assert {"status": -1, "amountf": "1.50000000"} == \
+            client.get_tx_info({"txid": "CPC"})["result"]
+        assert 2 == len(client.transport.requested)
+
+        response = client.get_tx_info_multi({"txid": "CPC|CPA"})
+        assert ["CPC", "CPA"] == list(response["result"])
+        assert 2 == len(client.transport.requested)
+
+    def test_kinds(self, tmp_path):
+        """
+        Test that withdrawals use their own final statuses and keys
+        """
+        store = FinalResultStore(str(tmp_path / "store.db"))
+        client = make_client(store)
+        client.get_withdrawal_info({"id": "CPD"})
+        client.get_withdrawal_info({"id": "CPA"})
+        assert ["CPD"] == list(store.get_many("withdrawal", STATUSES))
+        assert {} == store.get_many("tx", STATUSES)
+
+    def test_persistence_and_decoder(self, tmp_path):
+        """
+        Test that results survive reopening and go through the decoder
+        """
+        path = str(tmp_path / "store.db")
+        store = FinalResultStore(path)
+        make_client(store).get_tx_info({"txid": "CPA"})
+        store.close()
+
+        store = FinalResultStore(path, decoder=decimal_decoder)
+        client = make_client(store)
+        result = client.get_tx_info({"txid": "CPA"})["result"]
+        assert [] == client.transport.requested
+        assert "1.50000000" == str(result["amountf"])
+        assert not isinstance(result["amountf"], str)
+
+    def test_eviction(self, tmp_path):
+        """
+        Test that the oldest results beyond max_entries are evicted
+        """
+        store = FinalResultStore(
+            str(tmp_path / "store.db"), max_entries=3, compact_every=2)
+        for index in range(5):
+            store.put_many("tx", {str(index): {"status": 100}})
+        # evicted after every second write
+        assert 4 == len(store)
+        store.compact()
+        assert {"2", "3", "4"} == set(store.get_many("tx", "01234"))
+
+        store.max_age = -1
+        assert 3 == store.evict()
+        assert 0 == len(store)
+
+    def test_bulk_lookup(self, tmp_path):
+        """
+        Test looking up more IDs than SQLite allows variables
+        """
+        store = FinalResultStore(str(tmp_path / "store.db"))
+        ids = [str(index) for index in range(1200)]
+        store.put_many("tx", {id_: {"status": 100} for id_ in ids})
+        assert 1200 == len(store.get_many("tx", ids + ["x"]))
+
+    def test_async(self, tmp_path):
+        """
+        Test the store with the asyncio client
+        """
+        store = FinalResultStore(str(tmp_path / "store.db"))
+        client = make_client(
+            store, AsyncCoinPayments, transport_class=AsyncFakeTransport)
+        threads = set()
+        lookup = store.lookup
+
+        def recording_lookup(params):
+            threads.add(threading.get_ident())
+            return lookup(params)
+
+        store.lookup = recording_lookup
+        loop = asyncio.new_event_loop()
+        try:
+            for _ in range(2):
+                response = loop.run_until_complete(
+                    client.get_tx_info_multi({"txid": "CPA|CPB"}))
+                assert {"CPA", "CPB"} == set(response["result"])
+        finally:
+            loop.close()
+        assert [["CPA", "CPB"], ["CPB"]] == client.transport.requested
+        # SQLite is never queried on the event loop's thread
+        assert threads and threading.get_ident() not in threads
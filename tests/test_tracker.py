@@ -0,0 +1,220 @@
+"""
+Tests for the transaction tracker
+"""
+import threading
+from unittest.mock import MagicMock
+
+from python_coinpayments.tracker import TransactionTracker, is_final
+
+
+class FakeClock:
+    """
+    A clock that only moves when told to
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_client(statuses: dict):
+    """
+    Get a mocked client answering get_tx_info_bulk from statuses
+    """
+    client = MagicMock()
+
+    def get_tx_info_bulk(txids, max_workers=4, chunk_size=25):
+        results = {
+            txid: {"error": "ok", "status": statuses[txid]}
+            for txid in txids if txid in statuses
+        }
+        return results, []
+
+    client.get_tx_info_bulk.side_effect = get_tx_info_bulk
+    return client
+
+
+class TestTracker:
+    """
+    Test class for TransactionTracker
+    """
+
+    def test_is_final(self):
+        """
+        Test which statuses are final
+        """
+        assert [False, False, False, True, True, True] == [
+            is_final(status) for status in (None, 0, 1, 2, 100, -1)]
+
+    def test_poll_only_due(self):
+        """
+        Test that only due, non-final transactions are polled, in one batch
+        """
+        statuses = {"a": 0, "b": 1, "c": 100}
+        client = make_client(statuses)
+        clock = FakeClock()
+        changes = []
+        tracker = TransactionTracker(
+            client, on_change=lambda *args: changes.append(args[:3]),
+            clock=clock)
+        for txid in ("a", "b", "c"):
+            tracker.track(txid)
+        tracker.track("d", status=2)  # already final
+
+        assert {"a", "b", "c"} == tracker.poll()
+        assert 1 == client.get_tx_info_bulk.call_count
+        assert ["a", "b", "c"] == client.get_tx_info_bulk.call_args[0][0]
+        assert [("a", None, 0), ("b", None, 1), ("c", None, 100)] == changes
+        assert 2 == len(tracker)
+        assert "c" not in tracker
+
+        # nothing is due until the minimum interval has passed
+        assert set() == tracker.poll()
+        assert 15.0 == tracker.next_poll()
+        clock.now += 15
+        statuses["b"] = -1
+        assert {"b"} == tracker.poll()
+        assert ["a", "b"] == client.get_tx_info_bulk.call_args[0][0]
+        assert ["a"] == [txid for txid in "abc" if txid in tracker]
+
+    def test_interval(self):
+        """
+        Test that waiting payments are polled less often as they age
+        """
+        tracker = TransactionTracker(MagicMock())
+        assert 15.0 == tracker.interval(0, 60)
+        assert 60.0 == tracker.interval(0, 600)
+        assert 300.0 == tracker.interval(0, 86400)
+        assert 15.0 == tracker.interval(1, 86400)
+
+    def test_feed_ipn(self):
+        """
+        Test that IPNs update the status and postpone polls
+        """
+        client = make_client({"a": 0})
+        clock = FakeClock()
+        changes = []
+        tracker = TransactionTracker(
+            client, on_change=lambda *args: changes.append(args[:3]),
+            clock=clock)
+        tracker.track("a", status=0)
+
+        clock.now += 10
+        assert tracker.feed_ipn({"txn_id": "a", "status": "1"})
+        assert not tracker.feed_ipn({"txn_id": "x", "status": "1"})
+        assert [("a", 0, 1)] == changes
+        assert 1 == tracker.status("a")
+
+        # the poll that was due at 15s was pushed back by the IPN
+        clock.now += 10
+        assert set() == tracker.poll()
+        assert not client.get_tx_info_bulk.called
+
+        tracker.feed_ipn({"txn_id": "a", "status": "100"})
+        assert "a" not in tracker
+        assert ("a", 1, 100) == changes[-1]
+
+    def test_ipn_during_poll(self):
+        """
+        Test that a poll result older than an IPN is ignored
+        """
+        clock = FakeClock()
+        tracker = TransactionTracker(MagicMock(), clock=clock)
+
+        def get_tx_info_bulk(txids, max_workers=4, chunk_size=25):
+            clock.now += 1
+            tracker.feed_ipn({"txn_id": "a", "status": "1"})
+            return {"a": {"error": "ok", "status": 0}}, []
+
+        tracker.client.get_tx_info_bulk.side_effect = get_tx_info_bulk
+        tracker.track("a")
+        tracker.poll()
+        assert 1 == tracker.status("a")
+
+    def test_next_poll_during_poll(self):
+        """
+        Test that nothing is due while every transaction is being polled
+        """
+        clock = FakeClock()
+        tracker = TransactionTracker(MagicMock(), clock=clock)
+        waits = []
+
+        def get_tx_info_bulk(txids, max_workers=4, chunk_size=25):
+            waits.append(tracker.next_poll())
+            return {"a": {"error": "ok", "status": 0}}, []
+
+        tracker.client.get_tx_info_bulk.side_effect = get_tx_info_bulk
+        tracker.track("a")
+        tracker.poll()
+        assert [None] == waits
+        assert "a" in tracker
+        assert 15.0 == tracker.next_poll()
+
+    def test_invalid_status(self):
+        """
+        Test that results without a valid status are retried later, and do
+        not stop the other transactions from being polled
+        """
+        client = MagicMock()
+        client.get_tx_info_bulk.return_value = ({
+            "a": {"error": "ok"},
+            "b": {"error": "ok", "status": "pending"},
+            "c": {"error": "ok", "status": "100"},
+        }, [])
+        tracker = TransactionTracker(client, clock=FakeClock())
+        for txn_id in ("a", "b", "c"):
+            tracker.track(txn_id)
+        assert {"c"} == tracker.poll()
+        assert "a" in tracker and "b" in tracker and "c" not in tracker
+        assert 15.0 == tracker.next_poll()
+        assert not tracker.feed_ipn({"txn_id": "a", "status": "?"})
+
+    def test_failed_lookup(self):
+        """
+        Test that failed lookups are retried later
+        """
+        clock = FakeClock()
+        tracker = TransactionTracker(make_client({}), clock=clock)
+        tracker.track("a")
+        assert set() == tracker.poll()
+        assert "a" in tracker
+        assert 15.0 == tracker.next_poll()
+
+    def test_untrack(self):
+        """
+        Test that untracked transactions are not polled
+        """
+        client = make_client({"a": 0})
+        tracker = TransactionTracker(client, clock=FakeClock())
+        tracker.track("a")
+        tracker.untrack("a")
+        assert tracker.next_poll() is None
+        assert set() == tracker.poll()
+        assert not client.get_tx_info_bulk.called
+
+    def test_run(self):
+        """
+        Test running the polling loop on a thread
+        """
+        statuses = {"a": 0}
+        done = threading.Event()
+        tracker = TransactionTracker(
+            make_client(statuses), min_interval=0.01,
+            on_change=lambda *args: done.set() if args[2] == 100 else None)
+        thread = threading.Thread(target=tracker.run)
+        thread.start()
+        tracker.track("a")
+        statuses["a"] = 100
+        assert done.wait(5)
+        tracker.stop()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert 0 == len(tracker)
+
+        # until_empty returns once everything is final
+        tracker.track("b", status=0)
+        statuses["b"] = -1
+        tracker.run(until_empty=True)
+        assert 0 == len(tracker)
@@ -0,0 +1,264 @@
+"""
+Tests for the HTTP transports
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from python_coinpayments import CoinPayments
+from python_coinpayments.aio import (
+    AsyncCoinPayments, AsyncRecordingTransport, AsyncReplayTransport,
+)
+from python_coinpayments.exceptions import ReplayError
+from python_coinpayments.transport import (
+    ConnectionPool, RecordingTransport, ReplayTransport, read_recording,
+    replay_calls,
+)
+
+# the params create_transaction requires
+TRANSACTION = {
+    "amount": 1,
+    "currency1": "USD",
+    "currency2": "BTC",
+    "buyer_email": "buyer@example.com",
+}
+
+
+class TestConnectionPool:
+    """
+    Test class for ConnectionPool
+    """
+
+    def test_keep_alive(self, server):
+        """
+        Test that consecutive requests reuse one connection
+        """
+        pool = ConnectionPool()
+        for i in range(5):
+            status, body = pool.request(
+                "POST", server.url, body=str(i).encode())
+            assert 200 == status
+            assert str(i).encode() == body
+        assert 5 == server.requests
+        assert 1 == server.connections
+        pool.close()
+
+    def test_connection_close(self, server):
+        """
+        Test that connections the server closes are not pooled
+        """
+        server.close_after_response = True
+        pool = ConnectionPool()
+        for _ in range(3):
+            pool.request("POST", server.url, body=b"x")
+        assert 3 == server.connections
+        assert not any(pool._idle.values())
+
+    def test_idle_eviction(self, server):
+        """
+        Test that connections idle for too long are not reused
+        """
+        pool = ConnectionPool(idle_timeout=0)
+        pool.request("POST", server.url, body=b"x")
+        pool.request("POST", server.url, body=b"x")
+        assert 2 == server.connections
+
+    def test_stale_connection_retry(self, server):
+        """
+        Test that a request on a connection the server dropped is retried
+        """
+        server.drop_after_response = True
+        pool = ConnectionPool()
+        pool.request("POST", server.url, body=b"x")
+        server.drop_after_response = False
+        # let the close reach the pool, as it would after an idle timeout
+        time.sleep(0.1)
+        status, body = pool.request("POST", server.url, body=b"again")
+        assert 200 == status
+        assert b"again" == body
+        assert 2 == server.connections
+        assert 2 == server.requests
+
+    def test_unwritten_request_retry(self, server):
+        """
+        Test that a request that could not be written to a reused connection
+        is retried on a fresh one
+        """
+        pool = ConnectionPool()
+        conn = MagicMock()
+        conn.sock, other = socket.socketpair()
+        conn.request.side_effect = BrokenPipeError
+        origin = ("http", "127.0.0.1", server.server_port)
+        pool._put_connection(origin, conn)
+        status, body = pool.request("POST", server.url, body=b"x")
+        assert (200, b"x") == (status, body)
+        conn.close.assert_called_once_with()
+        assert 1 == server.requests
+        conn.sock.close()
+        other.close()
+
+    def test_no_resend_after_write(self, server):
+        """
+        Test that a request is not resent when the connection is reset after
+        it was written, as the server may have acted on it
+        """
+        pool = ConnectionPool()
+        pool.request("POST", server.url, body=b"x")
+        server.reset_requests = 1
+        with pytest.raises(OSError):
+            pool.request("POST", server.url, body=b"cmd=create_withdrawal")
+        assert 2 == server.requests
+        assert 1 == server.connections
+
+        client = CoinPayments(
+            public_key="public key", private_key="private key",
+            transport=pool)
+        client.url = server.url
+        server.response = b'{"error": "ok", "result": {}}'
+        client.rates()
+        server.reset_requests = 1
+        with pytest.raises(OSError):
+            client.create_withdrawal({"amount": 1, "currency": "BTC"})
+        assert 4 == server.requests
+        assert 2 == server.connections
+
+    def test_maxsize(self, server):
+        """
+        Test that at most maxsize idle connections are kept per host
+        """
+        pool = ConnectionPool(maxsize=2)
+        barrier = threading.Barrier(4)
+
+        def worker():
+            barrier.wait()
+            pool.request("POST", server.url, body=b"x")
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert 4 == server.requests
+        assert all(len(idle) <= 2 for idle in pool._idle.values())
+        pool.close()
+        assert not pool._idle
+
+    def test_invalid_maxsize(self):
+        """
+        Test that the pool needs room for at least one connection
+        """
+        with pytest.raises(ValueError):
+            ConnectionPool(maxsize=0)
+
+
+def record(path, server):
+    """
+    Record a rates call, a get_tx_info call and a timed out call
+    """
+    server.response = b'{"error": "ok", "result": {"BTC": {}}}'
+    transport = RecordingTransport(ConnectionPool(), path)
+    client = CoinPayments(
+        public_key="public key", private_key="private key",
+        transport=transport)
+    client.url = server.url
+    client.rates()
+    client.get_tx_info({"txid": "CPTX1"})
+    transport.transport = MagicMock(spec=["request"])
+    transport.transport.request.side_effect = TimeoutError
+    with pytest.raises(TimeoutError):
+        client.create_transaction(TRANSACTION)
+    transport.close()
+
+
+class TestRecordReplay:
+    """
+    Test class for RecordingTransport and ReplayTransport
+    """
+
+    def test_recording(self, server, tmp_path):
+        """
+        Test that requests are recorded without secrets, one per line
+        """
+        path = str(tmp_path / "traffic.jsonl")
+        record(path, server)
+        with open(path) as recording:
+            text = recording.read()
+        assert "public+key" not in text
+        assert server.headers[0]["HMAC"] not in text
+        lines = text.splitlines()
+        assert 3 == len(lines)
+        assert all(line.startswith('{"t":') for line in lines)
+        rates = json.loads(lines[0])
+        assert 200 == rates["s"]
+        assert "key=REDACTED" in rates["q"]
+        assert server.response.decode() == rates["r"]
+        assert "TimeoutError" == json.loads(lines[2])["x"]
+
+        # recordings are appended to
+        record(path, server)
+        assert 6 == len(read_recording(path))
+
+    def test_replay(self, server, tmp_path):
+        """
+        Test that recorded responses and errors are replayed offline
+        """
+        path = str(tmp_path / "traffic.jsonl")
+        record(path, server)
+        client = CoinPayments(
+            public_key="other key", private_key="other secret",
+            transport=ReplayTransport(path, speed=None))
+        assert {"BTC": {}} == client.rates()["result"]
+        assert "ok" == client.get_tx_info({"txid": "CPTX2"})["error"]
+        with pytest.raises(TimeoutError):
+            client.create_transaction(TRANSACTION)
+        with pytest.raises(ReplayError):
+            client.balances()
+
+    def test_replay_timing(self, tmp_path):
+        """
+        Test that responses take as long as they did when recorded
+        """
+        path = str(tmp_path / "traffic.jsonl")
+        entry = {"t": 0, "d": 0.05, "m": "POST", "u": "", "s": 200,
+                 "q": "version=1&key=REDACTED&cmd=rates&format=json",
+                 "r": '{"error": "ok", "result": {}}'}
+        with open(path, "w") as recording:
+            for offset in (0, 0.1):
+                recording.write(json.dumps(dict(entry, t=offset)) + "\n")
+        client = CoinPayments(
+            public_key="public key", private_key="private key",
+            transport=ReplayTransport(path))
+        calls = replay_calls(client, path)
+        assert ["rates", "rates"] == [cmd for cmd, _, _ in calls]
+        assert all(0.05 <= latency < 0.5 for _, latency, _ in calls)
+        assert all("ok" == response["error"] for _, _, response in calls)
+
+        fast = replay_calls(CoinPayments(
+            public_key="public key", private_key="private key",
+            transport=ReplayTransport(path, speed=10)), path, speed=10)
+        assert all(latency < 0.05 for _, latency, _ in fast)
+
+    def test_async(self, server, tmp_path):
+        """
+        Test recording and replaying with the asyncio client
+        """
+        path = str(tmp_path / "traffic.jsonl")
+        server.response = b'{"error": "ok", "result": {}}'
+        client = AsyncCoinPayments(
+            public_key="public key", private_key="private key")
+        client.transport = AsyncRecordingTransport(client.transport, path)
+        client.url = server.url
+        loop = asyncio.new_event_loop()
+        try:
+            loop.run_until_complete(client.rates())
+            client.transport = AsyncReplayTransport(path, speed=None)
+            response = loop.run_until_complete(client.rates())
+        finally:
+            loop.close()
+        assert {"error": "ok", "result": {}} == response
+        assert 1 == server.requests